@@ -0,0 +1,282 @@
+"""Online backups and compact snapshots of the live database.
+
+    python backup.py create [--method backup|vacuum] [--dir DIR]
+    python backup.py verify SNAPSHOT...
+    python backup.py prune [--dir DIR]
+
+Both methods read through SQLite, never by copying the file, so snapshots
+are consistent even while WAL frames are in flight, and in WAL mode they
+never block the app's writers.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+from datetime import datetime, timezone
+
+from config import (
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    BACKUP_KEEP_DAILY,
+    BACKUP_MAX_RESTARTS,
+    BACKUP_PAGES,
+    BACKUP_SLEEP,
+    DATABASE_PATH,
+    DB_BUSY_TIMEOUT,
+)
+
+BACKUP_METHODS = ("backup", "vacuum")
+SNAPSHOT_NAME = re.compile(r"^indexa-(\d{8})-(\d{6})(?:-(\d+))?\.db$")
+CHUNK_SIZE = 1024 * 1024
+
+
+class BackupError(Exception):
+    """Raised when a snapshot cannot be taken or fails verification"""
+
+
+class _TooManyRestarts(Exception):
+    pass
+
+
+def _connect_source(path, readonly=True):
+    conn = sqlite3.connect(path, timeout=DB_BUSY_TIMEOUT / 1000)
+    conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}")
+    if readonly:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def online_backup(dest, source=None, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP, max_restarts=BACKUP_MAX_RESTARTS):
+    """Copy the database to dest with the backup API, a few pages per step.
+
+    Each step is a short read transaction with a sleep in between. A write
+    from another connection restarts the copy; after max_restarts it is
+    finished in a single step instead, which in WAL mode is one read
+    snapshot and still does not block writers.
+    """
+    restarts = 0
+    remaining_before = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, remaining_before
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _TooManyRestarts()
+        remaining_before = remaining
+
+    src = _connect_source(source or DATABASE_PATH)
+    dst = sqlite3.connect(dest)
+    try:
+        try:
+            src.backup(dst, pages=pages, progress=progress, sleep=sleep)
+        except _TooManyRestarts:
+            src.backup(dst, pages=-1)
+    finally:
+        dst.close()
+        src.close()
+    return restarts
+
+
+def vacuum_into(dest, source=None):
+    """Write a compacted, defragmented copy of the database to dest"""
+    # query_only would reject VACUUM INTO, although it only reads the source
+    src = _connect_source(source or DATABASE_PATH, readonly=False)
+    try:
+        src.execute("VACUUM INTO ?", (dest,))
+    finally:
+        src.close()
+
+
+def file_checksum(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def integrity_check(path):
+    """Run PRAGMA integrity_check on a snapshot without modifying it"""
+    conn = sqlite3.connect(f"file:{path}?mode=ro&immutable=1", uri=True)
+    try:
+        return [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    finally:
+        conn.close()
+
+
+def take_snapshot(dest, method="vacuum", source=None):
+    """Write a self-contained, integrity-checked snapshot to dest and return its checksum"""
+    if method not in BACKUP_METHODS:
+        raise BackupError(f"Unknown backup method: {method}")
+    if method == "backup":
+        online_backup(dest, source)
+    else:
+        vacuum_into(dest, source)
+
+    # A snapshot is a single file: switch it out of WAL mode so opening it never needs -wal/-shm files
+    conn = sqlite3.connect(dest)
+    try:
+        conn.execute("PRAGMA journal_mode = DELETE")
+    finally:
+        conn.close()
+
+    result = integrity_check(dest)
+    if result != ["ok"]:
+        raise BackupError(f"Snapshot failed integrity check: {'; '.join(result[:5])}")
+    return file_checksum(dest)
+
+
+def checksum_path(path):
+    return f"{path}.sha256"
+
+
+def write_checksum(path, checksum):
+    """Store the checksum next to the snapshot in sha256sum format"""
+    with open(checksum_path(path), "w") as f:
+        f.write(f"{checksum}  {os.path.basename(path)}\n")
+
+
+def read_checksum(path):
+    try:
+        with open(checksum_path(path)) as f:
+            return f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+
+
+def verify(path):
+    """Check a snapshot against its stored checksum and SQLite's integrity check"""
+    expected = read_checksum(path)
+    if expected is None:
+        raise BackupError(f"{path}: no checksum file")
+    actual = file_checksum(path)
+    if actual != expected:
+        raise BackupError(f"{path}: checksum mismatch (expected {expected}, got {actual})")
+    result = integrity_check(path)
+    if result != ["ok"]:
+        raise BackupError(f"{path}: integrity check failed: {'; '.join(result[:5])}")
+    return {"path": path, "sha256": actual, "bytes": os.path.getsize(path)}
+
+
+def list_snapshots(directory=None):
+    """Snapshot paths in a backup directory, oldest first"""
+    directory = directory or BACKUP_DIR
+    try:
+        matches = [SNAPSHOT_NAME.match(name) for name in os.listdir(directory)]
+    except FileNotFoundError:
+        return []
+    # Name order, except that indexa-<time>-1.db was taken after indexa-<time>.db
+    matches.sort(key=lambda m: (m.group(1), m.group(2), int(m.group(3) or 0)) if m else ())
+    return [os.path.join(directory, m.group(0)) for m in matches if m]
+
+
+def snapshot_time(path):
+    match = SNAPSHOT_NAME.match(os.path.basename(path))
+    return datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S").replace(tzinfo=timezone.utc)
+
+
+def _new_snapshot_path(directory):
+    stem = datetime.now(timezone.utc).strftime("indexa-%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{stem}.db")
+    counter = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{stem}-{counter}.db")
+        counter += 1
+    return path
+
+
+def create_backup(directory=None, method="vacuum", source=None, keep=BACKUP_KEEP, keep_daily=BACKUP_KEEP_DAILY):
+    """Take a snapshot into the backup directory, then rotate old ones.
+
+    When the new snapshot is byte-identical to the newest existing one it is
+    discarded, so frequent scheduled runs only add files when data changed.
+    """
+    directory = directory or BACKUP_DIR
+    os.makedirs(directory, exist_ok=True)
+    path = _new_snapshot_path(directory)
+    temp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+    try:
+        checksum = take_snapshot(temp_path, method, source)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    existing = list_snapshots(directory)
+    if existing and read_checksum(existing[-1]) == checksum:
+        os.remove(temp_path)
+        result = {"path": existing[-1], "sha256": checksum, "unchanged": True}
+    else:
+        write_checksum(path, checksum)
+        os.replace(temp_path, path)
+        result = {"path": path, "sha256": checksum, "unchanged": False}
+    result["bytes"] = os.path.getsize(result["path"])
+    result["pruned"] = prune(directory, keep, keep_daily)
+    return result
+
+
+def prune(directory=None, keep=BACKUP_KEEP, keep_daily=BACKUP_KEEP_DAILY, now=None):
+    """Delete snapshots outside the retention policy and return their paths.
+
+    Keeps the `keep` most recent snapshots, plus the newest snapshot of each
+    of the last `keep_daily` days.
+    """
+    snapshots = list_snapshots(directory)
+    now = now or datetime.now(timezone.utc)
+    kept = set(snapshots[-keep:]) if keep > 0 else set()
+    newest_per_day = {}
+    for path in snapshots:
+        taken = snapshot_time(path)
+        if (now - taken).days < keep_daily:
+            newest_per_day[taken.date()] = path
+    kept.update(newest_per_day.values())
+
+    removed = []
+    for path in snapshots:
+        if path not in kept:
+            os.remove(path)
+            if os.path.exists(checksum_path(path)):
+                os.remove(checksum_path(path))
+            removed.append(path)
+    return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Back up the Indexa database while it is in use")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Take a snapshot and rotate old ones")
+    create.add_argument("--dir", default=BACKUP_DIR, help="Backup directory")
+    create.add_argument("--method", choices=BACKUP_METHODS, default="vacuum",
+                        help="vacuum: compact copy (default); backup: page-by-page copy with the backup API")
+
+    verifier = commands.add_parser("verify", help="Check snapshots against their checksums")
+    verifier.add_argument("paths", nargs="*", help="Snapshots to verify (default: all in --dir)")
+    verifier.add_argument("--dir", default=BACKUP_DIR)
+
+    pruner = commands.add_parser("prune", help="Apply the retention policy")
+    pruner.add_argument("--dir", default=BACKUP_DIR)
+    pruner.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    pruner.add_argument("--keep-daily", type=int, default=BACKUP_KEEP_DAILY)
+
+    args = parser.parse_args()
+    try:
+        if args.command == "create":
+            print(json.dumps(create_backup(args.dir, args.method)))
+        elif args.command == "verify":
+            for path in args.paths or list_snapshots(args.dir):
+                print(json.dumps(verify(path)))
+        else:
+            print(json.dumps({"pruned": prune(args.dir, args.keep, args.keep_daily)}))
+    except BackupError as exc:
+        print(exc, file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+# Indexa Backup Script
+# Takes a consistent snapshot of the live database (safe while the app is running),
+# verifies it and rotates old snapshots. Schedule it from cron, e.g.:
+#   0 3 * * * docker exec indexa ./backup.sh
+# Snapshots go to $BACKUP_DIR (default: /data/backups); pass --method backup for a page-by-page copy.
+
+set -e
+
+cd "$(dirname "$0")"
+exec python backup.py create "$@"
@@ -0,0 +1,121 @@
+"""Batch endpoints against the equivalent single-entry calls.
+
+Starts one uvicorn worker on a copy of the cached corpus database and, for
+--batch random entries, times N GET /entries/{id} against one
+GET /entries?ids=, N PUT against one PATCH /entries (recategorizing), and
+N DELETE against one POST /entries/delete.
+
+    python benchmarks/batch.py --entries 20000 --batch 200
+"""
+import argparse
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SEED  # noqa: E402
+from export_search_latency import free_port  # noqa: E402
+
+
+def wait_until_ready(client):
+    for _ in range(100):
+        try:
+            client.get("/categories")
+            return
+        except Exception:
+            time.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(client, ids):
+    """Yield (operation, single-call ms, batch ms); each pair works on its own half of ids"""
+    half = len(ids) // 2
+    singles, batched = ids[:half], ids[half:]
+
+    def get_each():
+        for entry_id in singles:
+            client.get(f"/entries/{entry_id}").raise_for_status()
+
+    def get_batch():
+        client.get("/entries", params={"ids": ",".join(map(str, batched))}).raise_for_status()
+
+    yield "get", timed(get_each), timed(get_batch)
+
+    entries = {entry_id: client.get(f"/entries/{entry_id}").json() for entry_id in singles}
+
+    def put_each():
+        for entry_id, entry in entries.items():
+            client.put(f"/entries/{entry_id}", json={**entry, "category": "Recategorized"}).raise_for_status()
+
+    def patch_batch():
+        client.patch("/entries", json=[
+            {"id": entry_id, "category": "Recategorized"} for entry_id in batched
+        ]).raise_for_status()
+
+    yield "recategorize", timed(put_each), timed(patch_batch)
+
+    def delete_each():
+        for entry_id in singles:
+            client.delete(f"/entries/{entry_id}").raise_for_status()
+
+    def delete_batch():
+        client.post("/entries/delete", json={"ids": batched}).raise_for_status()
+
+    yield "delete", timed(delete_each), timed(delete_batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--batch", type=int, default=200, help="Entries per operation")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "indexa-bench"))
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    os.environ["DATABASE_PATH"] = os.path.join(args.db_dir, f"corpus-{DEFAULT_SEED}-{args.entries}.db")
+    import corpus
+    import httpx
+    from database import get_db, init_db
+
+    init_db()
+    with get_db() as conn:
+        corpus.load(conn, args.entries)
+        # Work on a copy: the writes below must not change the cached corpus
+        path = os.path.join(tempfile.mkdtemp(), "batch.db")
+        copy = sqlite3.connect(path)
+        conn.backup(copy)
+        copy.close()
+        all_ids = [row[0] for row in conn.execute("SELECT id FROM entries")]
+    ids = random.Random(7).sample(all_ids, 2 * args.batch)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, "DATABASE_PATH": path, "MAINTENANCE_ENABLED": "false"},
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+            wait_until_ready(client)
+            print(f"{args.batch} entries per operation")
+            print(f"{'operation':<16}{'single ms':>12}{'batch ms':>12}{'speedup':>10}")
+            for operation, single, batch in run(client, ids):
+                print(f"{operation:<16}{single:>12.1f}{batch:>12.1f}{single / batch:>9.1f}x")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""Deterministic synthetic knowledge base of IT runbooks for benchmarks.
+
+Entry i depends only on (seed, i), so a 10k corpus is a prefix of the 1M one
+and the same arguments always produce byte-identical entries. Categories and
+tags follow a Zipf distribution like real knowledge bases: a few hot
+categories/tags and a long tail.
+
+    python benchmarks/corpus.py --entries 100000 --out corpus.ndjson
+"""
+import argparse
+import bisect
+import itertools
+import json
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+DEFAULT_SEED = 1901
+
+SYSTEMS = [
+    "nginx", "postgres", "redis", "docker", "kubernetes", "ansible", "terraform", "grafana",
+    "prometheus", "elasticsearch", "haproxy", "bind", "openldap", "samba", "zfs", "ceph",
+    "proxmox", "vmware", "jenkins", "gitlab", "vault", "consul", "rabbitmq", "kafka",
+    "mysql", "mongodb", "squid", "postfix", "dovecot", "wireguard", "openvpn", "pfsense",
+    "cisco", "juniper", "mikrotik", "ubuntu", "debian", "rhel", "windows-server", "active-directory",
+]
+
+ACTIONS = [
+    "install", "upgrade", "restore", "backup", "rotate certificates for", "troubleshoot",
+    "harden", "monitor", "migrate", "scale", "patch", "decommission", "failover", "tune",
+]
+
+CATEGORIES = [
+    "Linux", "Networking", "Databases", "Containers", "Security", "Monitoring", "Backups",
+    "Windows", "Storage", "Virtualization", "CI/CD", "Mail", "DNS", "Identity", "Cloud",
+    "Hardware", "Incident Response", "Onboarding", "Licensing", "Printing",
+]
+
+TAG_WORDS = [
+    "prod", "staging", "dev", "urgent", "howto", "checklist", "postmortem", "vendor",
+    "ssl", "tls", "firewall", "vlan", "raid", "lvm", "systemd", "cron", "ssh", "sudo",
+    "iptables", "nftables", "selinux", "apparmor", "snmp", "ntp", "dhcp", "smtp", "imap",
+    "s3", "nfs", "iscsi", "ha", "dr", "sla", "oncall", "audit", "compliance", "gpo", "mfa",
+]
+
+# System names double as tags, giving a ~80 tag vocabulary
+TAGS = TAG_WORDS + SYSTEMS
+
+FILLER = (
+    "check the service status before and after the change and record the output in the ticket "
+    "the configuration lives under etc and is managed by ansible so local edits will be reverted "
+    "schedule the work inside the maintenance window and notify the on call engineer first "
+    "verify replication lag is below the threshold before promoting the standby node "
+    "keep a copy of the previous configuration so the change can be rolled back quickly "
+    "the monitoring dashboard should show the error rate returning to baseline within minutes "
+    "escalate to the vendor if the firmware version does not match the support matrix "
+    "credentials are stored in the password vault under the team shared folder"
+).split()
+
+CODE_SNIPPETS = {
+    "bash": [
+        "sudo systemctl restart {system}",
+        "journalctl -u {system} --since '1 hour ago' | tail -n 50",
+        "df -h && free -m && uptime",
+        "rsync -aHAX --delete /srv/{system}/ backup01:/srv/{system}/",
+        "openssl x509 -in /etc/ssl/certs/{system}.pem -noout -dates",
+        "ss -tlnp | grep {port}",
+    ],
+    "yaml": [
+        "- name: ensure {system} is running\n  service:\n    name: {system}\n    state: started",
+        "{system}:\n  replicas: {replicas}\n  port: {port}",
+    ],
+    "sql": [
+        "SELECT pid, state, query FROM pg_stat_activity WHERE state <> 'idle';",
+        "VACUUM (ANALYZE, VERBOSE) {system}_events;",
+    ],
+}
+
+START = datetime(2023, 1, 1)
+SPAN_SECONDS = 3 * 365 * 24 * 3600
+
+
+def _zipf_cum_weights(n, exponent=1.1):
+    weights = [1 / (rank + 1) ** exponent for rank in range(n)]
+    return list(itertools.accumulate(weights))
+
+
+CATEGORY_WEIGHTS = _zipf_cum_weights(len(CATEGORIES))
+TAG_WEIGHTS = _zipf_cum_weights(len(TAGS))
+SYSTEM_WEIGHTS = _zipf_cum_weights(len(SYSTEMS), exponent=0.8)
+
+
+def _pick(rng, population, cum_weights):
+    return population[bisect.bisect(cum_weights, rng.random() * cum_weights[-1])]
+
+
+def _sentence(rng, words):
+    return " ".join(rng.choice(FILLER) for _ in range(words)).capitalize() + "."
+
+
+def _paragraph(rng):
+    return " ".join(_sentence(rng, rng.randint(8, 20)) for _ in range(rng.randint(2, 5)))
+
+
+def _code_block(rng, system):
+    language = rng.choice(list(CODE_SNIPPETS))
+    lines = [
+        rng.choice(CODE_SNIPPETS[language]).format(
+            system=system, port=rng.choice([22, 80, 443, 5432, 6379, 8080, 9090]), replicas=rng.randint(1, 5)
+        )
+        for _ in range(rng.randint(1, 4))
+    ]
+    return f"```{language}\n" + "\n".join(lines) + "\n```"
+
+
+def _table(rng, system):
+    rows = ["| Host | Role | Port |", "| --- | --- | --- |"]
+    for n in range(rng.randint(2, 6)):
+        rows.append(f"| {system}-{n + 1:02d} | {rng.choice(['primary', 'replica', 'witness'])} | {rng.randint(1024, 65535)} |")
+    return "\n".join(rows)
+
+
+def _steps(rng):
+    return "\n".join(f"{n}. {_sentence(rng, rng.randint(5, 12))}" for n in range(1, rng.randint(3, 8)))
+
+
+def _content(rng, system, action, sections):
+    parts = [f"# {action.capitalize()} {system}", _paragraph(rng)]
+    for _ in range(sections):
+        parts.append(f"## {rng.choice(['Prerequisites', 'Procedure', 'Verification', 'Rollback', 'Notes', 'Inventory'])}")
+        kind = rng.random()
+        if kind < 0.35:
+            parts.append(_code_block(rng, system))
+        elif kind < 0.5:
+            parts.append(_table(rng, system))
+        elif kind < 0.75:
+            parts.append(_steps(rng))
+        parts.append(_paragraph(rng))
+    return "\n\n".join(parts)
+
+
+def _timestamp(rng):
+    return (START + timedelta(seconds=rng.randrange(SPAN_SECONDS))).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generate_entry(index, seed=DEFAULT_SEED):
+    """Build entry number `index` (0-based) as a dict ready for import"""
+    rng = random.Random(seed * 10_000_019 + index)
+    system = _pick(rng, SYSTEMS, SYSTEM_WEIGHTS)
+    action = rng.choice(ACTIONS)
+    # Log-normal section count: most runbooks are short, a few are long
+    sections = min(int(rng.lognormvariate(1.0, 0.6)) + 1, 20)
+
+    tags = {system}
+    tag_count = rng.randint(1, 5)
+    while len(tags) < tag_count:
+        tags.add(_pick(rng, TAGS, TAG_WEIGHTS))
+
+    created = _timestamp(rng)
+    updated = max(created, _timestamp(rng))
+    return {
+        "title": f"{action.capitalize()} {system} ({index})",
+        "content": _content(rng, system, action, sections),
+        "category": _pick(rng, CATEGORIES, CATEGORY_WEIGHTS),
+        "tags": ",".join(sorted(tags)),
+        "created_at": created,
+        "updated_at": updated,
+    }
+
+
+def generate_entries(count, seed=DEFAULT_SEED, start=0):
+    """Yield entries start..count-1"""
+    for index in range(start, count):
+        yield generate_entry(index, seed)
+
+
+def load(conn, count, seed=DEFAULT_SEED):
+    """Top the entries table up to `count` corpus entries through the bulk import path"""
+    from transfer import import_entries
+
+    existing = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    if existing < count:
+        import_entries(conn, generate_entries(count, seed, start=existing))
+        conn.execute("ANALYZE")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--out", default="-", help="NDJSON output file (default stdout)")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.out == "-" else open(args.out, "w", encoding="utf-8")
+    try:
+        for entry in generate_entries(args.entries, args.seed):
+            out.write(json.dumps(entry, ensure_ascii=False) + "\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == "__main__":
+    main()
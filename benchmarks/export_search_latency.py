@@ -0,0 +1,125 @@
+"""Measure /search latency while /export runs concurrently.
+
+Starts one uvicorn worker on a seeded temporary database. If a handler
+blocks the event loop, /search latency climbs while the export is running,
+so the two p99 columns should stay close.
+
+    python benchmarks/export_search_latency.py --entries 20000 --searches 300
+"""
+import argparse
+import asyncio
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ["docker", "nginx", "proxy", "ubuntu", "backup", "restore", "kernel", "firewall",
+         "certificate", "dns", "vlan", "raid", "zfs", "systemd", "cron", "ssh", "ldap"]
+
+
+def seed(conn, count):
+    """Fill the database with synthetic entries"""
+    rng = random.Random(42)
+    rows = []
+    for i in range(count):
+        body = " ".join(rng.choice(WORDS) for _ in range(400))
+        rows.append((f"Entry {i} {rng.choice(WORDS)}", body, rng.choice(WORDS), ",".join(rng.sample(WORDS, 3))))
+    conn.executemany("INSERT INTO entries (title, content, category, tags) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def search_latencies(client, count):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = await client.get("/search", params={"q": WORDS[i % len(WORDS)][:4]})
+        response.raise_for_status()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def export_loop(client, stop):
+    exports = 0
+    while not stop.is_set():
+        async with client.stream("GET", "/export") as response:
+            response.raise_for_status()
+            async for _ in response.aiter_raw():
+                pass
+        exports += 1
+    return exports
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(client):
+    for _ in range(100):
+        try:
+            await client.get("/categories")
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def run(args, base_url):
+    import httpx
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        await wait_until_ready(client)
+        baseline = await search_latencies(client, args.searches)
+
+        stop = asyncio.Event()
+        exporter = asyncio.ensure_future(export_loop(client, stop))
+        await asyncio.sleep(0.05)
+        loaded = await search_latencies(client, args.searches)
+        stop.set()
+        exports = await exporter
+
+    print(f"{'scenario':<20}{'p50 ms':>10}{'p99 ms':>10}")
+    print(f"{'search alone':<20}{statistics.median(baseline):>10.2f}{percentile(baseline, 99):>10.2f}")
+    print(f"{'search + export':<20}{statistics.median(loaded):>10.2f}{percentile(loaded, 99):>10.2f}")
+    print(f"exports completed during run: {exports}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--searches", type=int, default=300)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from database import get_db, init_db
+    init_db()
+    with get_db() as conn:
+        seed(conn, args.entries)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    try:
+        asyncio.run(run(args, f"http://127.0.0.1:{port}"))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
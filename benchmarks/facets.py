@@ -0,0 +1,120 @@
+"""Compare per-value count queries with the single-pass faceted search.
+
+The corpus is regenerated with categories split per system ("Databases /
+postgres"), which gives several hundred categories. The per-value approach
+runs the page query, a total and one COUNT per category and per tag; the
+faceted path evaluates the match once and reads all of it from that.
+
+    python benchmarks/facets.py --entries 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import generate_entries  # noqa: E402
+
+QUERIES = ["backup", "restore OR failover", "certificates", "tune"]
+
+PAGE_SQL = """
+    SELECT entries_fts.rowid FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+    WHERE entries_fts MATCH ? {condition} ORDER BY {rank} LIMIT ?
+"""
+
+COUNT_SQL = """
+    SELECT COUNT(*) FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid
+    WHERE entries_fts MATCH ? {condition}
+"""
+
+
+def split_categories(entries):
+    """Corpus entries with the category qualified by the entry's main system"""
+    for entry in entries:
+        system = entry["title"].split(" (")[0].rsplit(" ", 1)[-1]
+        yield {**entry, "category": f"{entry['category']} / {system}"}
+
+
+def per_value_counts(conn, match, categories, tags, selected, limit):
+    """Page, total and facet counts the naive way: one query per facet value"""
+    from search import fetch_hits, rank_expression
+
+    in_selected = f"AND e.category IN ({', '.join('?' for _ in selected)})" if selected else ""
+    page_sql = PAGE_SQL.format(condition=in_selected, rank=rank_expression())
+    ids = [row[0] for row in conn.execute(page_sql, (match, *selected, limit))]
+    page = fetch_hits(conn, match, ids) if ids else []
+    total = conn.execute(COUNT_SQL.format(condition=in_selected), (match, *selected)).fetchone()[0]
+    category_counts = {}
+    for category in categories:
+        count = conn.execute(COUNT_SQL.format(condition="AND e.category = ?"), (match, category)).fetchone()[0]
+        if count:
+            category_counts[category] = count
+    tag_counts = {}
+    for tag in tags:
+        count = conn.execute(
+            COUNT_SQL.format(condition=f"AND e.id IN (SELECT entry_id FROM entry_tags WHERE tag = ?) {in_selected}"),
+            (match, tag, *selected),
+        ).fetchone()[0]
+        if count:
+            tag_counts[tag] = count
+    return page, total, category_counts, tag_counts
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--selected", type=int, default=5, help="Categories selected in the multi-select run")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from database import get_db, init_db
+    from search import compile_query, faceted_search
+    from transfer import import_entries
+    init_db()
+
+    with get_db() as conn:
+        import_entries(conn, split_categories(generate_entries(args.entries)))
+        conn.execute("ANALYZE")
+
+    with get_db(readonly=True) as conn:
+        categories = [row[0] for row in conn.execute("SELECT DISTINCT category FROM entries")]
+        tags = [row[0] for row in conn.execute("SELECT DISTINCT tag FROM entry_tags")]
+        print(f"{args.entries} entries, {len(categories)} categories, {len(tags)} tags")
+        print(f"{'query':<22}{'selected':>9}{'hits':>8}{'per-value ms':>14}{'faceted ms':>12}{'speedup':>9}")
+
+        for q in QUERIES:
+            match = compile_query(q)
+            by_count = [row[0] for row in conn.execute(
+                "SELECT category FROM entries GROUP BY category ORDER BY COUNT(*) DESC LIMIT ?", (args.selected,)
+            )]
+            for selected in ((), tuple(by_count)):
+                naive_ms, (page, total, category_counts, tag_counts) = best_of(
+                    lambda: per_value_counts(conn, match, categories, tags, selected, args.limit)
+                )
+                faceted_ms, result = best_of(lambda: faceted_search(
+                    conn, match, selected, limit=args.limit, facet_limit=len(categories) + len(tags)
+                ))
+                assert result["total"] == total
+                assert [r["id"] for r in result["results"]] == [r["id"] for r in page]
+                # Category counts ignore the category selection in both
+                assert {f["category"]: f["count"] for f in result["categories"] if f["count"]} == category_counts
+                assert {f["tag"]: f["count"] for f in result["tags"]} == tag_counts
+                print(f"{q:<22}{len(selected):>9}{total:>8}{naive_ms:>14.1f}{faceted_ms:>12.1f}"
+                      f"{naive_ms / faceted_ms:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
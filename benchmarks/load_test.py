@@ -0,0 +1,258 @@
+"""Replay a mixed traffic pattern against a local instance and sweep WORKERS.
+
+For each WORKERS value a fresh copy of a seeded corpus database is served by
+`python main.py`, and --concurrency virtual users loop over a weighted mix of
+actions:
+  search  live-search bursts: successive prefixes of a word, spaced like
+          keystrokes just past the 300ms debounce in static/script.js
+  view    GET /view/{id} page loads
+  create  POST /entries
+  update  PUT /entries/{id}
+A separate task streams GET /export every --export-every seconds.
+
+Reports throughput, per-route p50/p95/p99 latency and error counts. Server
+tracebacks mentioning a locked database or a pool timeout are counted as
+SQLite lock errors.
+
+    python benchmarks/load_test.py --entries 20000 --workers 1,2,4 --concurrency 32 --duration 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SEED, SYSTEMS, generate_entry  # noqa: E402
+
+SEARCH_WORDS = SYSTEMS + ["restore", "certificate", "replication", "firewall", "backup", "rollback"]
+
+LOCK_ERROR_MARKERS = ("database is locked", "PoolTimeout", "database table is locked")
+
+
+def parse_mix(spec):
+    """Parse "search=70,view=20" into (actions, cumulative weights)"""
+    mix = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in ("search", "view", "create", "update"):
+            raise SystemExit(f"Unknown action in --mix: {name}")
+        mix[name] = float(weight)
+    return list(mix), list(mix.values())
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class Recorder:
+    """Collects latencies and failures per route"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    async def request(self, client, route, method, url, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except Exception:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append((time.perf_counter() - start) * 1000)
+        if response.status_code >= 400:
+            self.errors[route] += 1
+        return response
+
+    def summary(self, duration):
+        routes = {}
+        for route in sorted(set(self.latencies) | set(self.errors)):
+            samples = self.latencies[route]
+            routes[route] = {
+                "errors": self.errors[route],
+                "rps": round(len(samples) / duration, 1),
+                "p50_ms": round(percentile(samples, 50), 2) if samples else None,
+                "p95_ms": round(percentile(samples, 95), 2) if samples else None,
+                "p99_ms": round(percentile(samples, 99), 2) if samples else None,
+            }
+        return routes
+
+
+async def virtual_user(client, recorder, rng, args, actions, weights, deadline, next_index):
+    while time.monotonic() < deadline:
+        action = rng.choices(actions, cum_weights=None, weights=weights)[0]
+        if action == "search":
+            word = rng.choice(SEARCH_WORDS)
+            # The UI only searches from the second character on, after each debounce
+            for end in range(2, len(word) + 1, rng.randint(1, 3)):
+                await recorder.request(client, "GET /search", "GET", "/search", params={"q": word[:end]})
+                await asyncio.sleep(args.keystroke_ms / 1000)
+        elif action == "view":
+            await recorder.request(client, "GET /view/{id}", "GET", f"/view/{rng.randint(1, args.entries)}")
+        elif action == "create":
+            entry = generate_entry(next_index(), args.seed)
+            await recorder.request(client, "POST /entries", "POST", "/entries", json={
+                key: entry[key] for key in ("title", "content", "category", "tags")
+            })
+        else:
+            entry_id = rng.randint(1, args.entries)
+            entry = generate_entry(entry_id - 1, args.seed)
+            entry["content"] += f"\n\nUpdated during load test {rng.random()}"
+            await recorder.request(client, "PUT /entries/{id}", "PUT", f"/entries/{entry_id}", json={
+                key: entry[key] for key in ("title", "content", "category", "tags")
+            })
+        await asyncio.sleep(rng.uniform(0, 2 * args.think_ms) / 1000)
+
+
+async def exporter(client, recorder, interval, deadline):
+    while time.monotonic() + interval < deadline:
+        await asyncio.sleep(interval)
+        start = time.perf_counter()
+        try:
+            async with client.stream("GET", "/export") as response:
+                async for _ in response.aiter_raw():
+                    pass
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        if failed:
+            recorder.errors["GET /export"] += 1
+        else:
+            recorder.latencies["GET /export"].append((time.perf_counter() - start) * 1000)
+
+
+async def wait_until_ready(client, server):
+    for _ in range(300):
+        if server.poll() is not None:
+            raise RuntimeError("server exited during startup")
+        try:
+            await client.get("/categories")
+            return
+        except Exception:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def drive(base_url, server, args, actions, weights):
+    import httpx
+
+    limits = httpx.Limits(max_connections=args.concurrency + 1)
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        await wait_until_ready(client, server)
+        recorder = Recorder()
+        counter = iter(range(args.entries, 10 ** 9))
+        deadline = time.monotonic() + args.duration
+        start = time.perf_counter()
+        tasks = [
+            virtual_user(client, recorder, random.Random(args.seed + n), args, actions, weights, deadline,
+                         lambda: next(counter))
+            for n in range(args.concurrency)
+        ]
+        if args.export_every:
+            tasks.append(exporter(client, recorder, args.export_every, deadline))
+        await asyncio.gather(*tasks)
+        return recorder, time.perf_counter() - start
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_corpus(path, entries, seed):
+    """Build the seeded database once in a subprocess so this process never opens it"""
+    code = (
+        "import corpus; from database import close_pools, get_db, init_db; init_db()\n"
+        f"with get_db() as conn: corpus.load(conn, {entries}, {seed})\n"
+        # Closing the last connection checkpoints the WAL, so copying the main file is enough
+        "close_pools()"
+    )
+    env = dict(os.environ, DATABASE_PATH=path, PYTHONPATH=os.pathsep.join([ROOT, os.path.dirname(__file__)]))
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True)
+
+
+def run_workers(workers, template, workdir, args, actions, weights):
+    db_path = os.path.join(workdir, f"workers-{workers}.db")
+    shutil.copyfile(template, db_path)
+    log_path = os.path.join(workdir, f"workers-{workers}.log")
+    port = free_port()
+    env = dict(os.environ, DATABASE_PATH=db_path, WORKERS=str(workers), HOST="127.0.0.1", PORT=str(port),
+               DEBUG="false")
+
+    with open(log_path, "w") as log:
+        server = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            recorder, elapsed = asyncio.run(drive(f"http://127.0.0.1:{port}", server, args, actions, weights))
+        finally:
+            server.terminate()
+            server.wait()
+
+    with open(log_path, errors="replace") as log:
+        server_log = log.read()
+    routes = recorder.summary(elapsed)
+    completed = sum(len(samples) for samples in recorder.latencies.values())
+    return {
+        "workers": workers,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(completed / elapsed, 1),
+        "errors": sum(recorder.errors.values()),
+        "sqlite_lock_errors": sum(server_log.count(marker) for marker in LOCK_ERROR_MARKERS),
+        "routes": routes,
+    }
+
+
+def print_report(result):
+    print(f"\nWORKERS={result['workers']}: {result['throughput_rps']} req/s over {result['seconds']}s, "
+          f"{result['errors']} errors, {result['sqlite_lock_errors']} SQLite lock errors")
+    print(f"  {'route':<20}{'req/s':>8}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in result["routes"].items():
+        cells = [f"{stats[key]:>10.2f}" if stats[key] is not None else f"{'-':>10}" for key in ("p50_ms", "p95_ms", "p99_ms")]
+        print(f"  {route:<20}{stats['rps']:>8}{stats['errors']:>8}{''.join(cells)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated WORKERS values to sweep")
+    parser.add_argument("--concurrency", type=int, default=32, help="virtual users")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per WORKERS value")
+    parser.add_argument("--mix", default="search=70,view=22,create=4,update=4")
+    parser.add_argument("--keystroke-ms", type=float, default=320, help="delay between live-search requests")
+    parser.add_argument("--think-ms", type=float, default=200, help="mean pause between user actions")
+    parser.add_argument("--export-every", type=float, default=5, help="seconds between exports (0 disables)")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+    actions, weights = parse_mix(args.mix)
+
+    workdir = tempfile.mkdtemp(prefix="indexa-load-")
+    template = os.path.join(workdir, "corpus.db")
+    print(f"Seeding {args.entries} entries into {template}", file=sys.stderr)
+    prepare_corpus(template, args.entries, args.seed)
+
+    results = []
+    for workers in (int(w) for w in args.workers.split(",")):
+        result = run_workers(workers, template, workdir, args, actions, weights)
+        print_report(result)
+        results.append(result)
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    print(f"\nServer logs kept in {workdir}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
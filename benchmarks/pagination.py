@@ -0,0 +1,96 @@
+"""Compare deep-page latency of OFFSET paging against keyset (cursor) paging.
+
+    python benchmarks/pagination.py --entries 100000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PAGE_SIZE = 50
+
+OFFSET_SQL = """
+    SELECT id, title, category, tags, updated_at FROM entries
+    {where}
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ? OFFSET ?
+"""
+
+KEYSET_SQL = """
+    SELECT id, title, category, tags, updated_at FROM entries
+    {where}
+    ORDER BY updated_at DESC, id DESC
+    LIMIT ?
+"""
+
+
+def seed(conn, count):
+    """Insert synthetic entries spread over a year of update times"""
+    rng = random.Random(7)
+    rows = []
+    for i in range(count):
+        updated = f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(0, 23):02d}:00:00"
+        rows.append((f"Entry {i}", "body " * 200, f"Category {rng.randint(0, 19)}", "a,b", updated, updated))
+    conn.executemany("""
+        INSERT INTO entries (title, content, category, tags, created_at, updated_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, rows)
+    conn.commit()
+    conn.execute("ANALYZE")
+
+
+def best_of(fn, repeat=5):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def bench(conn, category, depth):
+    where = "WHERE category = ?" if category else ""
+    base = (category,) if category else ()
+
+    offset_ms = best_of(lambda: conn.execute(OFFSET_SQL.format(where=where), (*base, PAGE_SIZE, depth)).fetchall())
+
+    # The cursor is the last row of the previous page
+    previous = conn.execute(OFFSET_SQL.format(where=where), (*base, 1, max(depth - 1, 0))).fetchone()
+    keyset_where = f"{where} {'AND' if category else 'WHERE'} (updated_at, id) < (?, ?)"
+    keyset_args = (*base, previous["updated_at"], previous["id"], PAGE_SIZE)
+    keyset_ms = best_of(lambda: conn.execute(KEYSET_SQL.format(where=keyset_where), keyset_args).fetchall())
+    return offset_ms, keyset_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from database import get_db, init_db
+    init_db()
+    with get_db() as conn:
+        seed(conn, args.entries)
+
+    print(f"{'listing':<14}{'depth':>8}{'offset ms':>12}{'keyset ms':>12}")
+    with get_db(readonly=True) as conn:
+        for category in (None, "Category 3"):
+            total = conn.execute(
+                "SELECT COUNT(*) FROM entries" + (" WHERE category = ?" if category else ""),
+                (category,) if category else (),
+            ).fetchone()[0]
+            for fraction in (0, 0.1, 0.5, 0.99):
+                depth = int(total * fraction)
+                offset_ms, keyset_ms = bench(conn, category, depth)
+                label = category or "all"
+                print(f"{label:<14}{depth:>8}{offset_ms:>12.2f}{keyset_ms:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Build time and query latency of the related-entries index.
+
+Copies the cached corpus database from benchmarks/suite.py, builds the hashed
+TF-IDF vectors, then times top-k queries for random entries, both from the
+memory-mapped build and after entries were written since it (in memory).
+
+    python benchmarks/related.py --entries 100000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SEED, generate_entries  # noqa: E402
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95)],
+        "max": timings[-1],
+    }
+
+
+def time_queries(index, ids, limit):
+    timings = []
+    for entry_id in ids:
+        start = time.perf_counter()
+        index.related(entry_id, limit)
+        timings.append((time.perf_counter() - start) * 1000)
+    return percentiles(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--writes", type=int, default=500, help="Entries written after the build")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "indexa-bench"))
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    os.environ["DATABASE_PATH"] = os.path.join(args.db_dir, f"corpus-{DEFAULT_SEED}-{args.entries}.db")
+    import corpus
+    from database import get_db, get_pool, init_db
+    from related import RelatedIndex, build, index_dir
+
+    init_db()
+    with get_db() as conn:
+        corpus.load(conn, args.entries)
+        # Work on a copy: the writes below must not change the cached corpus
+        path = os.path.join(tempfile.mkdtemp(), "related.db")
+        copy = sqlite3.connect(path)
+        conn.backup(copy)
+        copy.close()
+    pool = get_pool(path)
+
+    with pool.reader() as conn:
+        manifest = build(conn, path)
+    directory = os.path.join(index_dir(path), manifest["build"])
+    size_mb = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory)) / 2 ** 20
+    print(f"build: {manifest['count']} entries in {manifest['seconds']:.1f}s, {size_mb:.1f} MB on disk")
+
+    index = RelatedIndex(path)
+    start = time.perf_counter()
+    with pool.reader() as conn:
+        index.sync(conn)
+    print(f"load (memory map): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    rng = random.Random(7)
+    with pool.reader() as conn:
+        ids = [row[0] for row in conn.execute("SELECT id FROM entries")]
+    sample = rng.sample(ids, min(args.queries, len(ids)))
+    print(f"{'phase':<26}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    stats = time_queries(index, sample, args.limit)
+    print(f"{'from build':<26}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+
+    # Entries written after the build are vectorized on the next sync and compared in memory
+    with pool.writer() as conn:
+        new = list(generate_entries(args.entries + args.writes, start=args.entries))
+        conn.executemany(
+            "INSERT INTO entries (title, content, category, tags) VALUES (:title, :content, :category, :tags)", new
+        )
+        conn.commit()
+        updated = rng.sample(ids, args.writes)
+        conn.executemany("UPDATE entries SET title = title || ' (revised)', updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                         [(entry_id,) for entry_id in updated])
+        conn.commit()
+    start = time.perf_counter()
+    with pool.reader() as conn:
+        index.sync(conn)
+    print(f"sync {2 * args.writes} written entries: {(time.perf_counter() - start) * 1000:.1f} ms")
+    stats = time_queries(index, sample, args.limit)
+    print(f"{f'with {2 * args.writes} in memory':<26}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""Search latency against the primary database file versus a local replica.
+
+Copies the cached corpus database from benchmarks/suite.py into --primary-dir
+and times the suite's search queries three ways: a new connection per query
+(as every request did before the pool), the pooled primary connections, and
+the replica in --replica-dir. Point --primary-dir at the NAS mount to see
+what the replica saves there; on a local disk the two pooled numbers should
+be about equal. Also reports the initial copy and catch-up after writes.
+
+    python benchmarks/replica.py --entries 100000 --primary-dir /mnt/nas/bench --replica-dir /dev/shm
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SEED, generate_entries  # noqa: E402
+from suite import SEARCH_QUERIES  # noqa: E402
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return {
+        "p50": statistics.median(timings),
+        "p95": timings[int(len(timings) * 0.95)],
+        "max": timings[-1],
+    }
+
+
+def time_searches(connect, repeat):
+    """Per-query timings in ms; connect() returns a context manager yielding a connection"""
+    from search import compile_query, run_search
+
+    timings = []
+    for _ in range(repeat):
+        for query in SEARCH_QUERIES:
+            start = time.perf_counter()
+            with connect() as conn:
+                run_search(conn, compile_query(query))
+            timings.append((time.perf_counter() - start) * 1000)
+    return percentiles(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=200, help="Rounds over the search queries")
+    parser.add_argument("--writes", type=int, default=500, help="Entries written before timing catch-up")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "indexa-bench"))
+    parser.add_argument("--primary-dir", default=tempfile.gettempdir())
+    parser.add_argument("--replica-dir", default="/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir())
+    args = parser.parse_args()
+
+    os.makedirs(args.db_dir, exist_ok=True)
+    os.environ["DATABASE_PATH"] = os.path.join(args.db_dir, f"corpus-{DEFAULT_SEED}-{args.entries}.db")
+    import corpus
+    from contextlib import closing
+    from database import get_db, get_pool, init_db
+    from replica import Replica
+
+    init_db()
+    with get_db() as conn:
+        corpus.load(conn, args.entries)
+        primary = os.path.join(tempfile.mkdtemp(dir=args.primary_dir), "primary.db")
+        copy = sqlite3.connect(primary)
+        conn.backup(copy)
+        copy.close()
+    pool = get_pool(primary)
+
+    def connect_each_time():
+        conn = sqlite3.connect(primary)
+        conn.row_factory = sqlite3.Row
+        return closing(conn)
+
+    print(f"{'reads from':<28}{'p50 ms':>9}{'p95 ms':>9}{'max ms':>9}")
+    for label, connect in (("primary, new connection", connect_each_time), ("primary, pooled", pool.reader)):
+        stats = time_searches(connect, args.repeat)
+        print(f"{label:<28}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+
+    # A long bound keeps the background thread out of the catch-up timings below
+    replica = Replica(primary, directory=args.replica_dir, max_staleness=3600)
+    start = time.perf_counter()
+    replica.start()
+    load_ms = (time.perf_counter() - start) * 1000
+    try:
+        stats = time_searches(lambda: get_db(readonly=True, path=primary), args.repeat)
+        print(f"{'replica':<28}{stats['p50']:>9.2f}{stats['p95']:>9.2f}{stats['max']:>9.2f}")
+        print(f"initial copy: {load_ms:.0f} ms")
+
+        # Writes from another process, replayed from the change log in one catch-up
+        other = sqlite3.connect(primary)
+        other.executemany(
+            "INSERT INTO entries (title, content, category, tags) VALUES (:title, :content, :category, :tags)",
+            generate_entries(args.entries + args.writes, start=args.entries),
+        )
+        other.commit()
+        other.close()
+        start = time.perf_counter()
+        replayed = replica.catch_up()
+        print(f"catch-up after {replayed} written entries: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+        # Read-your-writes: a single-entry write including its replay into the replica
+        timings = []
+        for i in range(100):
+            start = time.perf_counter()
+            with get_db(path=primary) as conn:
+                conn.execute("UPDATE entries SET title = title || '.' WHERE id = ?", (i + 1,))
+                conn.commit()
+            timings.append((time.perf_counter() - start) * 1000)
+        stats = percentiles(timings)
+        print(f"write + replay: p50 {stats['p50']:.2f} ms, p95 {stats['p95']:.2f} ms")
+    finally:
+        replica.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Compare the pydantic response_model path with direct row-to-bytes encoding.
+
+"models" is what the handlers did before: build Entry/SearchResult objects
+per row, let FastAPI validate and serialize them through the route's
+response_model, then JSONResponse encodes with the stdlib. "stdlib" and
+"orjson" encode the sqlite3 rows directly with serialization.dumps.
+
+    python benchmarks/serialization.py --entries 10000
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    import corpus
+    import serialization
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from database import get_db, init_db
+    from main import Entry, SearchResult, app
+    from search import compile_query, run_search
+
+    init_db()
+    with get_db() as conn:
+        corpus.load(conn, args.entries)
+
+    # The handler serializes through the cloned field, as FastAPI does for every request
+    fields = {route.path: route.secure_cloned_response_field for route in app.routes
+              if "GET" in getattr(route, "methods", ()) and getattr(route, "secure_cloned_response_field", None)}
+    orjson = serialization.orjson
+
+    def stdlib_dumps(rows):
+        serialization.orjson = None
+        try:
+            return serialization.rows_json(rows)
+        finally:
+            serialization.orjson = orjson
+
+    cases = []
+    with get_db(readonly=True) as conn:
+        for limit in (50, 500):
+            rows = conn.execute("SELECT * FROM entries ORDER BY updated_at DESC, id DESC LIMIT ?", (limit,)).fetchall()
+            cases.append((f"/entries?limit={limit}", rows, Entry, fields["/entries"], False))
+        for include_content in (False, True):
+            rows = run_search(conn, compile_query("restore"), limit=20, include_content=include_content)
+            name = "/search" + ("?include_content=true" if include_content else "")
+            cases.append((name, rows, SearchResult, fields["/search"], True))
+
+    print(f"{'response':<32}{'rows':>6}{'KB':>8}{'models ms':>11}{'stdlib ms':>11}{'orjson ms':>11}{'speedup':>9}")
+    for name, rows, model, field, exclude_none in cases:
+        def models():
+            content = asyncio.run(serialize_response(
+                field=field, response_content=[model(**dict(row)) for row in rows], exclude_none=exclude_none
+            ))
+            return JSONResponse(content).body
+
+        # Same documents; key order may differ from the model's field order
+        assert json.loads(models()) == json.loads(stdlib_dumps(rows))
+        models_ms = best_of(models, args.repeat)
+        stdlib_ms = best_of(lambda: stdlib_dumps(rows), args.repeat)
+        orjson_ms = best_of(lambda: serialization.rows_json(rows), args.repeat) if orjson else float("nan")
+        size_kb = len(serialization.rows_json(rows)) / 1024
+        print(f"{name:<32}{len(rows):>6}{size_kb:>8.1f}{models_ms:>11.2f}{stdlib_ms:>11.2f}{orjson_ms:>11.2f}"
+              f"{models_ms / min(stdlib_ms, orjson_ms):>8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
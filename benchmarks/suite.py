@@ -0,0 +1,237 @@
+"""Microbenchmarks for each data-access path over the synthetic runbook corpus.
+
+Each corpus size runs in its own process against a cached database built by
+benchmarks/corpus.py. Results are written as sorted, indented JSON so two runs
+can be diffed; --baseline compares best-of timings (min_ms, the least noisy
+statistic) and exits 1 when any benchmark is slower than the baseline by more
+than --threshold.
+
+    python benchmarks/suite.py --entries 1000,10000 --out results.json
+    python benchmarks/suite.py --entries 1000,10000 --baseline results.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from corpus import DEFAULT_SEED  # noqa: E402
+
+SEARCH_QUERIES = ["nginx", "restore postgres", "title:redis", "vault OR consul", '"replication lag"']
+
+# Misspelled or infix queries, which miss the word index and take the fallback path
+TYPO_QUERIES = ["ngnix", "restore postgers", "bernetes"]
+
+LIST_FIELDS = "id,title,preview,category,tags,updated_at"
+
+# Differences below this are timer noise, whatever the ratio
+NOISE_FLOOR_MS = 0.05
+
+
+def measure(fn, repeat):
+    """Run fn once to warm up, then `repeat` timed runs; returns summary stats in ms"""
+    fn()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+    }
+
+
+def listing_sql(columns, where=""):
+    # Mirrors the query in main.get_entries
+    return f"""
+        SELECT {columns} FROM entries
+        {where}
+        ORDER BY updated_at DESC, id DESC
+        LIMIT ?
+    """
+
+
+def define_benchmarks(conn, size):
+    """Return {name: (callable, repeat_scale)} for a loaded database"""
+    from pagination import parse_fields
+    from rendering import convert_markdown
+    from search import compile_query, run_search, search_with_fallback
+    from suggest import SuggestIndex
+    from tags import tag_filter
+    from transfer import EXPORT_PAGE_SIZE, encode_entry, fetch_export_page
+
+    benchmarks = {}
+
+    for q in SEARCH_QUERIES:
+        match = compile_query(q)
+        benchmarks[f"fts_match[{q}]"] = (lambda match=match: run_search(conn, match, limit=20), 1)
+    for q in TYPO_QUERIES:
+        match = compile_query(q)
+        benchmarks[f"fts_fallback[{q}]"] = (lambda q=q, match=match: search_with_fallback(conn, q, match, limit=20), 1)
+
+    # Typeahead is answered from memory once the index is built
+    suggest_index = SuggestIndex()
+    suggest_index.sync(conn)
+    for prefix in ("n", "restore po"):
+        benchmarks[f"suggest[{prefix}]"] = (lambda prefix=prefix: suggest_index.complete(prefix), 1)
+
+    _, columns = parse_fields(LIST_FIELDS)
+    middle = conn.execute(
+        "SELECT updated_at, id FROM entries ORDER BY updated_at DESC, id DESC LIMIT 1 OFFSET ?", (size // 2,)
+    ).fetchone()
+    tag_condition, tag_params = tag_filter(["prod", "nginx"], "all")
+
+    benchmarks["list_first_page"] = (
+        lambda: conn.execute(listing_sql(columns), (50,)).fetchall(), 1)
+    benchmarks["list_keyset_middle"] = (
+        lambda: conn.execute(listing_sql(columns, "WHERE (updated_at, id) < (?, ?)"), (*middle, 50)).fetchall(), 1)
+    benchmarks["list_category"] = (
+        lambda: conn.execute(listing_sql(columns, "WHERE category = ?"), ("Databases", 50)).fetchall(), 1)
+    benchmarks["list_tags_all"] = (
+        lambda: conn.execute(listing_sql(columns, f"WHERE {tag_condition}"), (*tag_params, 50)).fetchall(), 1)
+
+    # Same aggregation as GET /tags?counts=true
+    benchmarks["tag_counts"] = (
+        lambda: conn.execute("SELECT tag, COUNT(*) AS count FROM entry_tags GROUP BY tag ORDER BY tag").fetchall(), 1)
+
+    documents = [row[0] for row in conn.execute("SELECT content FROM entries ORDER BY id LIMIT 20")]
+    benchmarks["markdown_render_20"] = (lambda: [convert_markdown(text) for text in documents], 1)
+
+    benchmarks["export_page"] = (
+        lambda: [encode_entry(entry) for entry in fetch_export_page(conn, 0, None, EXPORT_PAGE_SIZE)], 1)
+
+    def export_full():
+        last_id = 0
+        while True:
+            entries = fetch_export_page(conn, last_id, None, EXPORT_PAGE_SIZE)
+            if not entries:
+                return
+            for entry in entries:
+                encode_entry(entry)
+            last_id = entries[-1]["id"]
+
+    # A full export scales with the corpus, so it gets a tenth of the runs
+    benchmarks["export_full"] = (export_full, 0.1)
+    return benchmarks
+
+
+def run_size(size, seed, repeat, db_dir, only=None):
+    """Benchmark one corpus size in this process; returns {name: stats}"""
+    os.makedirs(db_dir, exist_ok=True)
+    os.environ["DATABASE_PATH"] = os.path.join(db_dir, f"corpus-{seed}-{size}.db")
+    import corpus
+    from database import get_db, init_db
+
+    init_db()
+    with get_db() as conn:
+        start = time.perf_counter()
+        corpus.load(conn, size, seed)
+        print(f"[{size}] corpus ready in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    results = {}
+    with get_db(readonly=True) as conn:
+        for name, (fn, scale) in define_benchmarks(conn, size).items():
+            if only and not any(part in name for part in only):
+                continue
+            results[name] = measure(fn, max(1, int(repeat * scale)))
+            print(f"[{size}] {name:<28}{results[name]['median_ms']:>10.3f} ms", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Return (size, name, baseline_ms, current_ms) for every min_ms slower than the threshold allows"""
+    regressions = []
+    for size, benchmarks in results["results"].items():
+        for name, stats in benchmarks.items():
+            base = baseline.get("results", {}).get(size, {}).get(name)
+            if not base:
+                continue
+            before, after = base["min_ms"], stats["min_ms"]
+            if after > before * (1 + threshold) and after - before > NOISE_FLOOR_MS:
+                regressions.append((size, name, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", default="1000,10000", help="comma-separated corpus sizes, up to 1000000")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--only", help="comma-separated substrings of benchmark names to run")
+    parser.add_argument("--db-dir", default=os.path.join(tempfile.gettempdir(), "indexa-bench"),
+                        help="where generated corpus databases are cached between runs")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.3, help="allowed slowdown (0.3 = 30%%)")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    only = args.only.split(",") if args.only else None
+
+    if args.worker:
+        json.dump(run_size(args.worker, args.seed, args.repeat, args.db_dir, only), sys.stdout)
+        return
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "repeat": args.repeat,
+        },
+        "results": {},
+    }
+    for size in (int(s) for s in args.entries.split(",")):
+        # A fresh process per size keeps config, pools and caches independent
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(size), "--seed", str(args.seed),
+                   "--repeat", str(args.repeat), "--db-dir", args.db_dir]
+        if args.only:
+            command += ["--only", args.only]
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True).stdout
+        results["results"][str(size)] = json.loads(output)
+
+    text = json.dumps(results, indent=2, sort_keys=True) + "\n"
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        sys.stdout.write(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for size, name, before, after in regressions:
+            print(f"REGRESSION [{size}] {name}: {before:.3f} ms -> {after:.3f} ms "
+                  f"(+{(after / before - 1) * 100:.0f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} against {args.baseline}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
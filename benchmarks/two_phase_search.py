@@ -0,0 +1,94 @@
+"""Compare the original single-query search with the two-phase search path.
+
+The original query computes snippet() and carries full bodies for every
+candidate row before ORDER BY bm25 ... LIMIT. The two-phase path ranks rowids
+from the FTS index first, then loads metadata and snippets for the page only.
+
+    python benchmarks/two_phase_search.py --sizes 10000,100000 --content-words 2000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORDS = ["docker", "nginx", "proxy", "ubuntu", "backup", "restore", "kernel", "firewall",
+         "certificate", "dns", "vlan", "raid", "zfs", "systemd", "cron", "ssh", "ldap",
+         "postgres", "redis", "grafana", "prometheus", "ansible", "terraform", "kubernetes"]
+
+QUERIES = ["dock", "nginx proxy", "back OR restore", "title:redis"]
+
+SINGLE_QUERY = """
+    SELECT e.*, snippet(entries_fts, 1, '<mark>', '</mark>', '...', 32) as snippet
+    FROM entries_fts
+    JOIN entries e ON entries_fts.rowid = e.id
+    WHERE entries_fts MATCH ?
+    ORDER BY {rank}
+    LIMIT ?
+"""
+
+
+def seed(conn, count, content_words):
+    rng = random.Random(11)
+    batch = []
+    for i in range(count):
+        body = " ".join(rng.choice(WORDS) for _ in range(content_words))
+        batch.append((f"{rng.choice(WORDS).title()} runbook {i}", body, rng.choice(WORDS), ",".join(rng.sample(WORDS, 2))))
+        if len(batch) == 5000:
+            conn.executemany("INSERT INTO entries (title, content, category, tags) VALUES (?, ?, ?, ?)", batch)
+            batch = []
+    if batch:
+        conn.executemany("INSERT INTO entries (title, content, category, tags) VALUES (?, ?, ?, ?)", batch)
+    conn.commit()
+
+
+def best_of(fn, repeat=3):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000")
+    parser.add_argument("--content-words", type=int, default=2000)
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATABASE_PATH"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+    from database import get_db, init_db
+    from search import compile_query, rank_expression, run_search
+    init_db()
+
+    print(f"{'entries':>8}  {'query':<18}{'single ms':>11}{'two-phase ms':>14}{'single KB':>11}{'two-phase KB':>14}")
+    loaded = 0
+    for size in (int(s) for s in args.sizes.split(",")):
+        with get_db() as conn:
+            seed(conn, size - loaded, args.content_words)
+        loaded = size
+
+        with get_db(readonly=True) as conn:
+            for q in QUERIES:
+                match = compile_query(q)
+                single_sql = SINGLE_QUERY.format(rank=rank_expression())
+                single_ms, single_rows = best_of(
+                    lambda: [dict(row) for row in conn.execute(single_sql, (match, args.limit)).fetchall()]
+                )
+                two_phase_ms, two_phase_rows = best_of(lambda: run_search(conn, match, limit=args.limit))
+                assert [r["id"] for r in single_rows] == [r["id"] for r in two_phase_rows]
+
+                single_kb = len(json.dumps(single_rows)) / 1024
+                two_phase_kb = len(json.dumps(two_phase_rows)) / 1024
+                print(f"{size:>8}  {q:<18}{single_ms:>11.1f}{two_phase_ms:>14.1f}{single_kb:>11.1f}{two_phase_kb:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
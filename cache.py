@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """Thread-safe LRU cache bounded by entry count and/or total size, with optional TTL"""
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None, sizeof=len):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._expires = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if self.ttl and self._expires[key] < time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        size = self.sizeof(value) if self.max_bytes else 0
+        # Values bigger than the whole cache would only evict everything else
+        if self.max_bytes and size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._data[key] = value
+            self._sizes[key] = size
+            if self.ttl:
+                self._expires[key] = time.monotonic() + self.ttl
+            self._bytes += size
+            self._evict()
+
+    def pop(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self._expires.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def __len__(self):
+        return len(self._data)
+
+    def _discard(self, key):
+        if key in self._data:
+            del self._data[key]
+            self._expires.pop(key, None)
+            self._bytes -= self._sizes.pop(key)
+
+    def _evict(self):
+        while self._data and (
+            (self.max_entries and len(self._data) > self.max_entries)
+            or (self.max_bytes and self._bytes > self.max_bytes)
+        ):
+            key, _ = self._data.popitem(last=False)
+            self._expires.pop(key, None)
+            self._bytes -= self._sizes.pop(key)
+
+
+# Write generation: bumped after every committed write, so cache keys that
+# include it can never match results computed before the write
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def current_generation():
+    return _generation
+
+
+def bump_generation():
+    """Invalidate every generation-keyed cache entry in this process"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+        return _generation
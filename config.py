@@ -0,0 +1,104 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Application
+DATABASE_PATH = os.getenv("DATABASE_PATH", "/data/indexa.db")
+STATIC_DIR = "static"
+TEMPLATES_DIR = "templates"
+APP_NAME = os.getenv("APP_NAME", "Indexa - Personal IT Knowledge Base")
+APP_VERSION = os.getenv("APP_VERSION", "1.0.0")
+DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+
+# Additional knowledge bases, one SQLite file each: "ops=/data/ops.db,dev=/data/dev.db".
+# DATABASE_PATH is always available as "default"; select one with ?kb=name
+KNOWLEDGE_BASES = os.getenv("KNOWLEDGE_BASES", "")
+
+# Connection pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))  # read-only connections per process
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # milliseconds
+
+# SQLite pragmas applied to every pooled connection
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-65536"))  # negative values are KiB
+DB_TEMP_STORE = os.getenv("DB_TEMP_STORE", "MEMORY")
+
+# Schema migrations at startup: "auto" applies pending ones under a file lock,
+# "check" only verifies the schema is current (run python migrations.py before starting workers)
+DB_MIGRATE = os.getenv("DB_MIGRATE", "auto")
+
+# Local read replica: with a directory here (a tmpfs such as /dev/shm), each worker copies the
+# database into it at startup and serves all reads from the copy; writes go to DATABASE_PATH and
+# are replayed into the copy from the entries_changes log
+DB_REPLICA_DIR = os.getenv("DB_REPLICA_DIR", "")
+DB_REPLICA_MAX_STALENESS = float(os.getenv("DB_REPLICA_MAX_STALENESS", "1"))  # seconds a read may lag other workers' writes
+DB_REPLICA_MAX_REPLAY = int(os.getenv("DB_REPLICA_MAX_REPLAY", "5000"))  # changed entries above which the copy is reloaded
+DB_CHANGELOG_KEEP = int(os.getenv("DB_CHANGELOG_KEEP", "100000"))  # entries_changes rows kept by maintenance
+
+# Async execution: database work runs on dedicated threads, never on the event loop
+DB_QUEUE_SIZE = int(os.getenv("DB_QUEUE_SIZE", "64"))  # max queued or running calls per process
+
+# Export
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "500"))  # entries fetched per keyset page
+
+# Import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))  # rows per executemany call
+IMPORT_SPOOL_SIZE = int(os.getenv("IMPORT_SPOOL_SIZE", str(8 * 1024 * 1024)))  # bytes buffered in memory before spilling to disk
+
+# Batch endpoints (GET /entries?ids=, PATCH /entries, POST /entries/delete)
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "1000"))  # entries per request
+
+# Rendered markdown cache
+RENDER_CACHE_BYTES = int(os.getenv("RENDER_CACHE_BYTES", str(32 * 1024 * 1024)))  # in-process LRU bound
+RENDER_CACHE_PERSIST = os.getenv("RENDER_CACHE_PERSIST", "False").lower() == "true"  # also keep HTML in entries_html
+
+# Search result cache
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "1024"))  # cached result lists
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "60"))  # seconds
+
+# Search ranking: bm25 weight per FTS column (title > tags > category > content by default)
+SEARCH_WEIGHTS = os.getenv("SEARCH_WEIGHTS", "title=10,tags=5,category=2,content=1")
+
+# Typo tolerance: first pages with fewer hits than this are topped up with substring (trigram)
+# matches and spelling corrections; 0 disables both
+SEARCH_FALLBACK_HITS = int(os.getenv("SEARCH_FALLBACK_HITS", "3"))
+SPELLING_REBUILD_INTERVAL = float(os.getenv("SPELLING_REBUILD_INTERVAL", "3600"))  # seconds between full vocabulary rebuilds
+
+# Backups
+BACKUP_DIR = os.getenv("BACKUP_DIR", os.path.join(os.path.dirname(DATABASE_PATH), "backups"))
+BACKUP_PAGES = int(os.getenv("BACKUP_PAGES", "1024"))  # pages copied per online backup step
+BACKUP_SLEEP = float(os.getenv("BACKUP_SLEEP", "0.01"))  # seconds between steps
+BACKUP_MAX_RESTARTS = int(os.getenv("BACKUP_MAX_RESTARTS", "3"))  # then finish from one read snapshot
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "7"))  # most recent snapshots kept by rotation
+BACKUP_KEEP_DAILY = int(os.getenv("BACKUP_KEEP_DAILY", "30"))  # plus the newest snapshot of each of this many days
+
+# Background maintenance (FTS merges, ANALYZE, WAL checkpoints, incremental vacuum), run by one
+# worker per database, elected through a lock file, once writes have been quiet for MAINTENANCE_IDLE
+MAINTENANCE_ENABLED = os.getenv("MAINTENANCE_ENABLED", "True").lower() == "true"
+MAINTENANCE_TICK = float(os.getenv("MAINTENANCE_TICK", "15"))  # seconds between idle checks
+MAINTENANCE_IDLE = float(os.getenv("MAINTENANCE_IDLE", "30"))  # seconds without writes before running
+MAINTENANCE_BUDGET = float(os.getenv("MAINTENANCE_BUDGET", "2"))  # seconds per task per idle window
+MAINTENANCE_OPTIMIZE_INTERVAL = float(os.getenv("MAINTENANCE_OPTIMIZE_INTERVAL", "86400"))  # full FTS merge and ANALYZE
+FTS_AUTOMERGE = int(os.getenv("FTS_AUTOMERGE", "8"))  # segments per level before FTS5 merges them on write
+FTS_CRISISMERGE = int(os.getenv("FTS_CRISISMERGE", "16"))  # segments per level that force a merge inside the write
+
+# Related entries: entries changed since the last vector build above which maintenance rebuilds it
+RELATED_REBUILD_CHANGES = int(os.getenv("RELATED_REBUILD_CHANGES", "2000"))
+
+# Admin endpoints (/admin/*) require "Authorization: Bearer <ADMIN_TOKEN>"; while it is
+# empty (the default) they answer 403, since /admin/backup hands out the whole database
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+# Instrumentation
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True").lower() == "true"  # request/SQL/render timing at /metrics
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "0"))  # log statements slower than this with their query plan; 0 disables
+
+# HTTP responses
+COMPRESS_MIN_SIZE = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))  # bytes; smaller bodies are sent as-is
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))  # used when the optional brotli package is installed
@@ -0,0 +1,483 @@
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from config import (
+    DATABASE_PATH,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_BUSY_TIMEOUT,
+    DB_JOURNAL_MODE,
+    DB_SYNCHRONOUS,
+    DB_MMAP_SIZE,
+    DB_CACHE_SIZE,
+    DB_TEMP_STORE,
+    DB_QUEUE_SIZE,
+)
+from metrics import connection_factory
+
+
+class PoolTimeout(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes free in time"""
+
+
+class ConnectionPool:
+    """Per-process pool of reusable SQLite connections.
+
+    Readers come from a bounded set of ``query_only`` connections. All writes
+    go through one shared writer connection guarded by a lock, so writers
+    queue up in-process instead of fighting over SQLite's file lock.
+    """
+
+    def __init__(self, path, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._readers = queue.LifoQueue(maxsize=size)
+        self._all_readers = []
+        self._lock = threading.Lock()
+        self._writer = None
+        self._writer_lock = threading.RLock()
+        self._watcher = None
+        self._watcher_lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self, readonly=False):
+        """Open a connection with the tuned pragmas applied"""
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            factory=connection_factory(),
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT}")
+        conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size = {DB_CACHE_SIZE}")
+        conn.execute(f"PRAGMA temp_store = {DB_TEMP_STORE}")
+        if readonly:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def _get_writer(self):
+        # Journal mode is persistent, so switching it once on the writer is enough
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if self._writer is None:
+                conn = self._connect()
+                # Only takes effect on a new, empty database; maintenance.py can convert existing ones
+                conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}")
+                self._writer = conn
+            return self._writer
+
+    def _get_reader(self):
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+            if len(self._all_readers) < self.size:
+                conn = self._connect(readonly=True)
+                self._all_readers.append(conn)
+                return conn
+
+        try:
+            return self._readers.get(timeout=self.timeout)
+        except queue.Empty:
+            raise PoolTimeout(f"No database connection available after {self.timeout}s")
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection"""
+        # Make sure the database exists and is in WAL mode before reading
+        self._get_writer()
+        conn = self._get_reader()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    @contextmanager
+    def writer(self):
+        """Borrow the writer connection, serialized across threads"""
+        with self._writer_lock:
+            conn = self._get_writer()
+            try:
+                yield conn
+            finally:
+                # Uncommitted work is discarded, as closing the connection would
+                if conn.in_transaction:
+                    conn.rollback()
+
+    def data_version(self):
+        """Return a value that changes whenever any other connection, in any process, commits"""
+        with self._watcher_lock:
+            if self._watcher is None:
+                self._get_writer()
+                self._watcher = self._connect(readonly=True)
+            return self._watcher.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        """Close every connection owned by the pool"""
+        with self._watcher_lock:
+            if self._watcher is not None:
+                self._watcher.close()
+                self._watcher = None
+        with self._lock:
+            self._closed = True
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers.clear()
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = os.getpid()
+
+
+def get_pool(path=None):
+    """Return this process's pool for a database file"""
+    global _pools_pid
+    path = path or DATABASE_PATH
+    with _pools_lock:
+        # Connections must never be shared across a fork
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path)
+        return pool
+
+
+def close_pools():
+    """Close all pools opened by this process"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+
+
+def close_pool(path):
+    """Close one database's pool; the next get_pool(path) opens a fresh one"""
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+
+
+# Local read replicas (replica.py), by primary database path
+_replicas = {}
+
+
+def register_replica(path, replica):
+    """Serve this process's reads of a database from a replica"""
+    _replicas[get_pool(path).path] = replica
+
+
+def unregister_replica(path):
+    _replicas.pop(get_pool(path).path, None)
+
+
+# Database context manager
+@contextmanager
+def get_db(readonly=False, path=None):
+    """Borrow a pooled connection: read-only for queries, the shared writer otherwise"""
+    pool = get_pool(path)
+    replica = _replicas.get(pool.path)
+    if readonly:
+        with (replica.reader() if replica is not None else pool.reader()) as conn:
+            yield conn
+    else:
+        with pool.writer() as conn:
+            yield conn
+        # Replay our own writes right away, so the next read sees them
+        if replica is not None:
+            replica.catch_up()
+
+
+def data_version(path=None):
+    """Cheap cross-process change counter for a database (the default one unless given)"""
+    pool = get_pool(path)
+    replica = _replicas.get(pool.path)
+    # With a replica, the version its copy reflects: cached results must match what reads see.
+    # Never catches up here, since callers may be on the event loop; reader() and the
+    # background thread do that on database threads
+    if replica is not None:
+        return replica.data_version
+    return pool.data_version()
+
+
+# Async data access
+_executors = {}
+_executors_lock = threading.Lock()
+_executors_pid = os.getpid()
+_queue_slots = weakref.WeakKeyDictionary()
+
+
+def _get_executor(readonly, path=None):
+    """Return this process's reader or writer executor for a database file"""
+    global _executors_pid
+    with _executors_lock:
+        # Worker threads do not survive a fork
+        if _executors_pid != os.getpid():
+            _executors.clear()
+            _executors_pid = os.getpid()
+        # Per file, so writes to one database never queue behind another's
+        key = (path or DATABASE_PATH, readonly)
+        executor = _executors.get(key)
+        if executor is None:
+            # One thread per pooled reader, and a single thread for the writer
+            if readonly:
+                executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="indexa-db-read")
+            else:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="indexa-db-write")
+            _executors[key] = executor
+        return executor
+
+
+def shutdown_executors():
+    """Wait for pending database calls and stop the executor threads"""
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=True)
+        _executors.clear()
+
+
+@asynccontextmanager
+async def _queue_slot():
+    # Bound the number of queued calls so overload shows up as backpressure
+    loop = asyncio.get_running_loop()
+    slots = _queue_slots.get(loop)
+    if slots is None:
+        slots = _queue_slots[loop] = asyncio.Semaphore(DB_QUEUE_SIZE)
+    async with slots:
+        yield
+
+
+def _call_with_connection(fn, args, kwargs, readonly, path):
+    with get_db(readonly=readonly, path=path) as conn:
+        return fn(conn, *args, **kwargs)
+
+
+async def run_db(fn, *args, readonly=False, path=None, **kwargs):
+    """Run fn(conn, *args, **kwargs) on a database thread and await the result"""
+    async with _queue_slot():
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            _get_executor(readonly, path), _call_with_connection, fn, args, kwargs, readonly, path
+        )
+
+
+# Schema
+CREATE_ENTRIES_TABLE = """
+    CREATE TABLE IF NOT EXISTS entries (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        title TEXT NOT NULL,
+        content TEXT NOT NULL,
+        category TEXT NOT NULL,
+        tags TEXT DEFAULT '',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+CREATE_ENTRIES_FTS = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+        title, content, category, tags, content='entries', content_rowid='id'
+    )
+"""
+
+CREATE_TRIGGER_AI = """
+    CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_fts(rowid, title, content, category, tags)
+        VALUES (new.id, new.title, new.content, new.category, new.tags);
+    END
+"""
+
+CREATE_TRIGGER_AD = """
+    CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, title, content, category, tags)
+        VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
+    END
+"""
+
+CREATE_TRIGGER_AU = """
+    CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
+        INSERT INTO entries_fts(entries_fts, rowid, title, content, category, tags)
+        VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
+        INSERT INTO entries_fts(rowid, title, content, category, tags)
+        VALUES (new.id, new.title, new.content, new.category, new.tags);
+    END
+"""
+
+# Trigram index over the same columns, for substring matches the word index cannot find
+CREATE_ENTRIES_TRIGRAM = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_trigram USING fts5(
+        title, content, category, tags, content='entries', content_rowid='id', tokenize='trigram'
+    )
+"""
+
+CREATE_TRIGGER_TRIGRAM_AI = """
+    CREATE TRIGGER IF NOT EXISTS entries_trigram_ai AFTER INSERT ON entries BEGIN
+        INSERT INTO entries_trigram(rowid, title, content, category, tags)
+        VALUES (new.id, new.title, new.content, new.category, new.tags);
+    END
+"""
+
+CREATE_TRIGGER_TRIGRAM_AD = """
+    CREATE TRIGGER IF NOT EXISTS entries_trigram_ad AFTER DELETE ON entries BEGIN
+        INSERT INTO entries_trigram(entries_trigram, rowid, title, content, category, tags)
+        VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
+    END
+"""
+
+CREATE_TRIGGER_TRIGRAM_AU = """
+    CREATE TRIGGER IF NOT EXISTS entries_trigram_au AFTER UPDATE ON entries BEGIN
+        INSERT INTO entries_trigram(entries_trigram, rowid, title, content, category, tags)
+        VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
+        INSERT INTO entries_trigram(rowid, title, content, category, tags)
+        VALUES (new.id, new.title, new.content, new.category, new.tags);
+    END
+"""
+
+# Read-only view of the entries_fts vocabulary (term, doc count, occurrences)
+CREATE_ENTRIES_VOCAB = """
+    CREATE VIRTUAL TABLE IF NOT EXISTS entries_vocab USING fts5vocab(entries_fts, 'row')
+"""
+
+# Keyset pagination indexes for GET /entries, newest first with id as tie-breaker
+CREATE_INDEX_UPDATED = """
+    CREATE INDEX IF NOT EXISTS idx_entries_updated
+    ON entries(updated_at DESC, id DESC)
+"""
+
+CREATE_INDEX_CATEGORY_UPDATED = """
+    CREATE INDEX IF NOT EXISTS idx_entries_category_updated
+    ON entries(category, updated_at DESC, id DESC)
+"""
+
+CREATE_ENTRIES_HTML = """
+    CREATE TABLE IF NOT EXISTS entries_html (
+        entry_id INTEGER PRIMARY KEY,
+        updated_at TIMESTAMP NOT NULL,
+        checksum INTEGER NOT NULL,
+        html TEXT NOT NULL
+    )
+"""
+
+CREATE_TRIGGER_HTML_AD = """
+    CREATE TRIGGER IF NOT EXISTS entries_html_ad AFTER DELETE ON entries BEGIN
+        DELETE FROM entries_html WHERE entry_id = old.id;
+    END
+"""
+
+# Normalized tag index: one row per (tag, entry), kept in sync with entries.tags
+CREATE_ENTRY_TAGS = """
+    CREATE TABLE IF NOT EXISTS entry_tags (
+        tag TEXT NOT NULL,
+        entry_id INTEGER NOT NULL,
+        PRIMARY KEY (tag, entry_id)
+    ) WITHOUT ROWID
+"""
+
+CREATE_INDEX_ENTRY_TAGS = """
+    CREATE INDEX IF NOT EXISTS idx_entry_tags_entry ON entry_tags(entry_id)
+"""
+
+# Splits a comma-separated tags column into trimmed, non-empty tags
+SPLIT_TAGS = """
+    WITH RECURSIVE split(entry_id, rest, tag) AS (
+        SELECT {id}, {tags} || ',', ''{source}
+        UNION ALL
+        SELECT entry_id, substr(rest, instr(rest, ',') + 1), trim(substr(rest, 1, instr(rest, ',') - 1))
+        FROM split WHERE rest != ''
+    )
+    SELECT entry_id, tag FROM split WHERE tag != ''
+"""
+
+CREATE_TRIGGER_TAGS_AI = """
+    CREATE TRIGGER IF NOT EXISTS entry_tags_ai AFTER INSERT ON entries BEGIN
+        INSERT OR IGNORE INTO entry_tags(entry_id, tag)
+        """ + SPLIT_TAGS.format(id="new.id", tags="COALESCE(new.tags, '')", source="") + """;
+    END
+"""
+
+CREATE_TRIGGER_TAGS_AD = """
+    CREATE TRIGGER IF NOT EXISTS entry_tags_ad AFTER DELETE ON entries BEGIN
+        DELETE FROM entry_tags WHERE entry_id = old.id;
+    END
+"""
+
+CREATE_TRIGGER_TAGS_AU = """
+    CREATE TRIGGER IF NOT EXISTS entry_tags_au AFTER UPDATE OF id, tags ON entries BEGIN
+        DELETE FROM entry_tags WHERE entry_id = old.id;
+        INSERT OR IGNORE INTO entry_tags(entry_id, tag)
+        """ + SPLIT_TAGS.format(id="new.id", tags="COALESCE(new.tags, '')", source="") + """;
+    END
+"""
+
+BACKFILL_ENTRY_TAGS = """
+    INSERT OR IGNORE INTO entry_tags(entry_id, tag)
+""" + SPLIT_TAGS.format(id="id", tags="COALESCE(tags, '')", source=" FROM entries")
+
+# Single-row counter bumped by every change to entries, in any process.
+# Unlike PRAGMA data_version it means the same thing on every connection,
+# so it can back HTTP validators shared by all workers.
+CREATE_ENTRIES_VERSION = """
+    CREATE TABLE IF NOT EXISTS entries_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+"""
+
+CREATE_TRIGGER_VERSION = """
+    CREATE TRIGGER IF NOT EXISTS entries_version_{suffix} AFTER {event} ON entries BEGIN
+        UPDATE entries_version SET version = version + 1 WHERE id = 1;
+    END
+"""
+
+# Ids of changed entries in commit order, replayed by in-memory replicas (replica.py)
+CREATE_ENTRIES_CHANGES = """
+    CREATE TABLE IF NOT EXISTS entries_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        entry_id INTEGER NOT NULL
+    )
+"""
+
+CREATE_TRIGGER_CHANGES = """
+    CREATE TRIGGER IF NOT EXISTS entries_changes_{suffix} AFTER {event} ON entries BEGIN
+        INSERT INTO entries_changes (entry_id) VALUES ({row}.id);
+    END
+"""
+
+CHANGE_TRIGGERS = (("ai", "INSERT", "new"), ("au", "UPDATE", "new"), ("ad", "DELETE", "old"))
+
+
+# Initialize database
+def init_db(path=None):
+    """Bring the database schema up to date (see migrations.py)"""
+    # Imported here because migrations is built from the schema defined in this module
+    from migrations import migrate
+    migrate(path)
+
+
+def entries_version(conn):
+    """Current value of the global entries change counter"""
+    return conn.execute("SELECT version FROM entries_version WHERE id = 1").fetchone()[0]
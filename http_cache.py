@@ -0,0 +1,284 @@
+import gzip
+import hashlib
+import os
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import parse_qs
+
+from fastapi.responses import Response
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.staticfiles import StaticFiles
+
+from config import APP_VERSION, BROTLI_QUALITY, COMPRESS_MIN_SIZE, GZIP_LEVEL, STATIC_DIR, TEMPLATES_DIR
+
+try:
+    import brotli
+except ImportError:  # optional: without it responses are only gzipped
+    brotli = None
+
+# Bodies larger than this are compressed on a worker thread instead of the event loop
+THREAD_COMPRESS_SIZE = 256 * 1024
+
+COMPRESSIBLE_TYPES = (
+    "text/", "application/json", "application/javascript", "application/x-ndjson",
+    "application/xml", "image/svg+xml",
+)
+
+
+# Validators
+
+def make_etag(*parts):
+    """Strong ETag from the values that determine a representation"""
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode("utf-8"), digest_size=12)
+    return f'"{digest.hexdigest()}"'
+
+
+def parse_timestamp(value):
+    """SQLite CURRENT_TIMESTAMP text (UTC) as an aware datetime"""
+    return datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S").replace(tzinfo=timezone.utc)
+
+
+def http_date(value):
+    """SQLite timestamp as an HTTP date for Last-Modified"""
+    return format_datetime(parse_timestamp(value), usegmt=True)
+
+
+def is_settled(updated_at):
+    """True once updated_at's second is over, so no later edit can share the timestamp"""
+    return parse_timestamp(updated_at) + timedelta(seconds=2) <= datetime.now(timezone.utc)
+
+
+def entry_etag(kind, entry_id, updated_at, *extra):
+    """ETag for one representation of an entry, derived from updated_at.
+
+    updated_at has one-second resolution, so while it is within the current
+    second no validator is issued (None); otherwise a second edit in the same
+    second would keep the ETag and clients would revalidate stale copies.
+    """
+    if not is_settled(updated_at):
+        return None
+    return make_etag(kind, entry_id, updated_at, *extra)
+
+
+def etag_matches(header, etag):
+    """Weak comparison, as If-None-Match requires"""
+    if header.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in header.split(","))
+
+
+def is_not_modified(request, etag, updated_at=None):
+    """Evaluate If-None-Match (preferred) or If-Modified-Since against a representation"""
+    if etag is None:
+        return False
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and updated_at:
+        try:
+            return parse_timestamp(updated_at) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def cache_headers(etag, updated_at=None):
+    """Validator headers; no-cache makes clients revalidate instead of guessing freshness"""
+    headers = {"Cache-Control": "no-cache"}
+    if etag is None:
+        return headers
+    headers["ETag"] = etag
+    if updated_at:
+        headers["Last-Modified"] = http_date(updated_at)
+    return headers
+
+
+def not_modified(etag, updated_at=None):
+    return Response(status_code=304, headers=cache_headers(etag, updated_at))
+
+
+# Content-hashed static assets
+
+_asset_hashes = {}
+
+
+def asset_hash(name):
+    """Short content hash of a static file, recomputed when its mtime changes"""
+    path = os.path.join(STATIC_DIR, name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    cached = _asset_hashes.get(name)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:12]
+    _asset_hashes[name] = (mtime, digest)
+    return digest
+
+
+def asset_url(name):
+    """URL of a static file that changes whenever its content does"""
+    return f"/static/{name}?v={asset_hash(name)}"
+
+
+_build_id = None
+
+
+def build_id():
+    """Identifies the deployed templates and assets, so HTML ETags change on deploy"""
+    global _build_id
+    if _build_id is None:
+        digest = hashlib.sha256(APP_VERSION.encode("utf-8"))
+        for directory in (TEMPLATES_DIR, STATIC_DIR):
+            for name in sorted(os.listdir(directory)):
+                path = os.path.join(directory, name)
+                if os.path.isfile(path):
+                    with open(path, "rb") as f:
+                        digest.update(name.encode("utf-8") + f.read())
+        _build_id = digest.hexdigest()[:12]
+    return _build_id
+
+
+class HashedStaticFiles(StaticFiles):
+    """StaticFiles that lets clients cache content-hashed URLs (?v=<hash>) forever"""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        version = parse_qs(scope.get("query_string", b"").decode("latin-1")).get("v")
+        name = os.path.relpath(full_path, self.directory)
+        if version and version[0] == asset_hash(name):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        else:
+            response.headers["Cache-Control"] = "no-cache"
+        return response
+
+
+# Compression
+
+def choose_encoding(accept_encoding):
+    """Pick br (if available) or gzip from an Accept-Encoding header, honouring q=0"""
+    accepted = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in (("br", "gzip") if brotli else ("gzip",)):
+        if accepted.get(encoding, accepted.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def strip_encoding_suffix(header):
+    """Map ETags we suffixed with -gzip/-br back to the handler's own ETag"""
+    tags = []
+    for tag in header.split(","):
+        tag = tag.strip()
+        for encoding in ("gzip", "br"):
+            suffix = f'-{encoding}"'
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+        tags.append(tag)
+    return ", ".join(tags)
+
+
+def encoded_etag(etag, header):
+    """The -gzip/-br variant of etag that If-None-Match carried, if any"""
+    tags = {tag.strip() for tag in header.split(",")}
+    for encoding in ("gzip", "br"):
+        tag = f'{etag[:-1]}-{encoding}"'
+        if tag in tags:
+            return tag
+    return None
+
+
+def compress(encoding, body):
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def is_compressible(content_type):
+    return bool(content_type) and content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compress complete response bodies with brotli or gzip above a size threshold.
+
+    Streamed bodies (e.g. /export, which has its own gzip option) pass through
+    untouched. Strong ETags get an encoding suffix, since the bytes differ, and
+    the suffix is removed again from If-None-Match before handlers see it
+    and put back on the ETag of the 304 the handler answers with.
+    """
+
+    def __init__(self, app, minimum_size=COMPRESS_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request_headers = Headers(scope=scope)
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            # Rewritten in place: outer middleware reads the routing info handlers add to this scope
+            scope["headers"] = [
+                (key, strip_encoding_suffix(value.decode("latin-1")).encode("latin-1") if key == b"if-none-match" else value)
+                for key, value in scope["headers"]
+            ]
+        start_message = None
+
+        async def send_wrapper(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start":
+                if message["status"] == 304 and if_none_match is not None:
+                    # Answer with the validator the client holds, so the 304 matches the 200 it revalidates
+                    headers = MutableHeaders(raw=message["headers"])
+                    etag = headers.get("etag")
+                    tag = encoded_etag(etag, if_none_match) if etag and etag.endswith('"') else None
+                    if tag:
+                        headers["ETag"] = tag
+                        headers.add_vary_header("Accept-Encoding")
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            if not is_compressible(headers.get("content-type")) or "content-encoding" in headers:
+                await send(start)
+                await send(message)
+                return
+
+            headers.add_vary_header("Accept-Encoding")
+            if encoding is None or message.get("more_body") or len(body) < self.minimum_size:
+                await send(start)
+                await send(message)
+                return
+
+            if len(body) > THREAD_COMPRESS_SIZE:
+                body = await run_in_threadpool(compress, encoding, body)
+            else:
+                body = compress(encoding, body)
+            headers["Content-Encoding"] = encoding
+            headers["Content-Length"] = str(len(body))
+            etag = headers.get("etag")
+            if etag and etag.endswith('"'):
+                headers["ETag"] = f'{etag[:-1]}-{encoding}"'
+            await send(start)
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_wrapper)
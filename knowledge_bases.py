@@ -0,0 +1,89 @@
+"""Named knowledge bases: one SQLite file each, searched together by fan-out.
+
+Every knowledge base has its own connection pool, writer lock and database
+threads, so writes to one never wait on another. Federated searches rank
+each selected base in parallel, merge the per-base bm25 orderings with a
+heap, and only fetch snippets for the merged page.
+"""
+import asyncio
+import heapq
+import itertools
+import re
+
+from config import DATABASE_PATH, KNOWLEDGE_BASES
+from database import run_db
+from search import fetch_hits, rank_candidates
+
+DEFAULT_KB = "default"
+NAME = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class UnknownKnowledgeBase(KeyError):
+    """Raised for a knowledge base name that is not configured"""
+
+
+def parse_knowledge_bases(value, default_path=DATABASE_PATH):
+    """Parse "name=path,name=path" into {name: path}, with DATABASE_PATH as "default" first"""
+    bases = {DEFAULT_KB: default_path}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, sep, path = item.partition("=")
+        name, path = name.strip(), path.strip()
+        if not sep or not path or not NAME.match(name):
+            raise ValueError(f"Invalid knowledge base {item!r}, expected name=path")
+        if name in bases:
+            raise ValueError(f"Knowledge base {name!r} is defined twice")
+        bases[name] = path
+    return bases
+
+
+knowledge_bases = parse_knowledge_bases(KNOWLEDGE_BASES)
+
+
+def knowledge_base_path(name=None):
+    """Database file of a knowledge base (the default one for None)"""
+    try:
+        return knowledge_bases[name or DEFAULT_KB]
+    except KeyError:
+        raise UnknownKnowledgeBase(name) from None
+
+
+async def federated_search(
+    names, match, category=None, tags=(), tag_mode="all", limit=20, offset=0, include_content=False
+):
+    """Search several knowledge bases at once; hits carry the "kb" they came from.
+
+    Each base ranks its own top offset+limit rowids on its reader threads, all
+    at the same time. bm25 scores from different files are compared as they
+    are, so a base's own term statistics decide its scores.
+    """
+    names = list(dict.fromkeys(names))
+    paths = [knowledge_base_path(name) for name in names]
+    depth = offset + limit
+    ranked = await asyncio.gather(*(
+        run_db(rank_candidates, match, category, tags, tag_mode, depth, 0,
+               with_scores=True, readonly=True, path=path)
+        for path in paths
+    ))
+
+    # Each list is already sorted by score, so a k-way heap merge needs only the head of each
+    merged = heapq.merge(*(
+        [(score, position, entry_id) for score, entry_id in shard]
+        for position, shard in enumerate(ranked)
+    ))
+    page = list(itertools.islice(merged, offset, depth))
+    if not page:
+        return []
+
+    wanted = {}
+    for _, position, entry_id in page:
+        wanted.setdefault(position, []).append(entry_id)
+    fetched = await asyncio.gather(*(
+        run_db(fetch_hits, match, ids, include_content, readonly=True, path=paths[position])
+        for position, ids in wanted.items()
+    ))
+    hits = {}
+    for position, rows in zip(wanted, fetched):
+        for row in rows:
+            hits[(position, row["id"])] = {**row, "kb": names[position]}
+    # Rows deleted between the two phases are simply dropped
+    return [hits[(position, entry_id)] for _, position, entry_id in page if (position, entry_id) in hits]
@@ -1,32 +1,85 @@
-from fastapi import FastAPI, HTTPException, Request, Form, Depends
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, HTTPException, Request, Form, Depends, Query
+from fastapi.responses import FileResponse, HTMLResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
-import sqlite3
-from contextlib import contextmanager
 from typing import List, Optional
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hmac
+import itertools
 import os
+import tempfile
 from datetime import datetime
-from dotenv import load_dotenv
-import markdown
+from urllib.parse import quote
+from contextlib import asynccontextmanager
 
-# Load environment variables from .env file
-load_dotenv()
+from config import DATABASE_PATH, STATIC_DIR, TEMPLATES_DIR, APP_NAME, APP_VERSION, DEBUG
+from config import DB_MIGRATE, IMPORT_BATCH_SIZE, IMPORT_SPOOL_SIZE, METRICS_ENABLED
+from config import ADMIN_TOKEN, BACKUP_DIR, BATCH_MAX_ITEMS, MAINTENANCE_ENABLED
+from backup import BACKUP_METHODS, BackupError, take_snapshot
+from cache import bump_generation, current_generation
+from database import init_db, run_db, close_pools, shutdown_executors, data_version, entries_version
+from http_cache import (
+    CompressionMiddleware, HashedStaticFiles, asset_url, build_id, cache_headers, entry_etag,
+    is_not_modified, make_etag, not_modified,
+)
+from knowledge_bases import (
+    DEFAULT_KB, UnknownKnowledgeBase, federated_search, knowledge_base_path, knowledge_bases,
+)
+from maintenance import MaintenanceScheduler, leader_pid, read_status, scheduler
+from metrics import MetricsMiddleware, TimedTemplate, render_metrics
+from migrations import check_schema
+from pagination import decode_cursor, encode_cursor, parse_fields, parse_ids
+from related import BUILD_RETRY_AFTER, RelatedBuilding, RelatedUnavailable, get_related_index
+from replica import replica
+from rendering import html_cache, render_entry, store_rendered
+from serialization import FastJSONResponse, RawJSONResponse, dumps, rows_json
+from search import QueryError, compile_query, faceted_search, search_cache, search_cache_key, search_with_fallback
+from suggest import get_suggest_index
+from tags import tag_filter
+from transfer import EXPORT_MEDIA_TYPES, ImportFormatError, import_file, iter_export
 
-# Configuration
-DATABASE_PATH = os.getenv("DATABASE_PATH", "/data/indexa.db")
-STATIC_DIR = "static"
-TEMPLATES_DIR = "templates"
-APP_NAME = os.getenv("APP_NAME", "Indexa - Personal IT Knowledge Base")
-APP_VERSION = os.getenv("APP_VERSION", "1.0.0")
-DEBUG = os.getenv("DEBUG", "False").lower() == "true"
+@asynccontextmanager
+async def lifespan(app):
+    """Migrate (or check) the schema and start maintenance; release database threads and connections on shutdown"""
+    for path in knowledge_bases.values():
+        if DB_MIGRATE == "check":
+            check_schema(path)
+        else:
+            init_db(path)
+    # One scheduler per database file; each elects its own leader
+    schedulers = [scheduler] + [
+        MaintenanceScheduler(path) for name, path in knowledge_bases.items() if name != DEFAULT_KB
+    ]
+    if MAINTENANCE_ENABLED:
+        for each in schedulers:
+            each.start()
+    # Copy the default knowledge base next to this worker and read from the copy (DB_REPLICA_DIR)
+    if replica is not None:
+        await run_in_threadpool(replica.start)
+    yield
+    if replica is not None:
+        replica.stop()
+    for each in schedulers:
+        each.stop()
+    shutdown_executors()
+    close_pools()
 
-app = FastAPI(title=APP_NAME, version=APP_VERSION, debug=DEBUG)
+app = FastAPI(
+    title=APP_NAME, version=APP_VERSION, debug=DEBUG, lifespan=lifespan, default_response_class=FastJSONResponse
+)
 
 # Mount static files and templates
-app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
+app.mount("/static", HashedStaticFiles(directory=STATIC_DIR), name="static")
 templates = Jinja2Templates(directory=TEMPLATES_DIR)
+templates.env.globals["asset_url"] = asset_url
+
+app.add_middleware(CompressionMiddleware)
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+    templates.env.template_class = TimedTemplate
 
 # Pydantic models
 class Entry(BaseModel):
@@ -41,80 +94,56 @@ class Entry(BaseModel):
 class SearchResult(BaseModel):
     id: int
     title: str
-    content: str
+    content: Optional[str] = None  # only with include_content=true
     category: str
     tags: str
     snippet: str
     created_at: str
     updated_at: str
+    kb: Optional[str] = None  # only when searching with kb=
 
-# Database context manager
-@contextmanager
-def get_db():
-    conn = sqlite3.connect(DATABASE_PATH)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
-
-# Initialize database
-def init_db():
-    """Initialize the database with tables and FTS index"""
-    with get_db() as conn:
-        # Create main entries table
-        conn.execute("""
-            CREATE TABLE IF NOT EXISTS entries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                title TEXT NOT NULL,
-                content TEXT NOT NULL,
-                category TEXT NOT NULL,
-                tags TEXT DEFAULT '',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create FTS virtual table for full-text search
-        conn.execute("""
-            CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
-                title, content, category, tags, content='entries', content_rowid='id'
-            )
-        """)
-        
-        # Create triggers to keep FTS table in sync
-        conn.execute("""
-            CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
-                INSERT INTO entries_fts(rowid, title, content, category, tags) 
-                VALUES (new.id, new.title, new.content, new.category, new.tags);
-            END
-        """)
-        
-        conn.execute("""
-            CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
-                INSERT INTO entries_fts(entries_fts, rowid, title, content, category, tags) 
-                VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
-            END
-        """)
-        
-        conn.execute("""
-            CREATE TRIGGER IF NOT EXISTS entries_au AFTER UPDATE ON entries BEGIN
-                INSERT INTO entries_fts(entries_fts, rowid, title, content, category, tags) 
-                VALUES('delete', old.id, old.title, old.content, old.category, old.tags);
-                INSERT INTO entries_fts(rowid, title, content, category, tags) 
-                VALUES (new.id, new.title, new.content, new.category, new.tags);
-            END
-        """)
-        
-        conn.commit()
+class RelatedEntry(BaseModel):
+    id: int
+    title: str
+    category: str
+    tags: str
+    updated_at: str
+    score: float
+
+class CategoryCount(BaseModel):
+    category: str
+    count: int
+
+class TagCount(BaseModel):
+    tag: str
+    count: int
+
+class EntryPatch(BaseModel):
+    id: int
+    title: Optional[str] = None
+    content: Optional[str] = None
+    category: Optional[str] = None
+    tags: Optional[str] = None
+
+class EntryIds(BaseModel):
+    ids: List[int]
+
+class BatchResult(BaseModel):
+    id: int
+    status: str  # updated, deleted or not_found
 
-# Initialize database on startup
-init_db()
+class FacetedSearch(BaseModel):
+    results: List[SearchResult]
+    total: int
+    categories: List[CategoryCount]
+    tags: List[TagCount]
 
-# Markdown converter
-def convert_markdown(text):
-    """Convert markdown text to HTML"""
-    return markdown.markdown(text, extensions=['fenced_code', 'tables', 'toc'])
+def kb_path(kb: Optional[str] = Query(None, description="Knowledge base (default: the main database)")):
+    """Resolve ?kb= to its database file"""
+    try:
+        return knowledge_base_path(kb)
+    except UnknownKnowledgeBase:
+        raise HTTPException(status_code=404, detail=f"Unknown knowledge base: {kb}")
 
 # Routes
 @app.get("/", response_class=HTMLResponse)
@@ -123,63 +152,208 @@ async def home(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 @app.get("/entries", response_model=List[Entry])
-async def get_entries(category: Optional[str] = None, limit: int = 50):
-    """Get all entries or filter by category"""
-    with get_db() as conn:
-        if category:
-            cursor = conn.execute("""
-                SELECT * FROM entries 
-                WHERE category = ? 
-                ORDER BY updated_at DESC 
-                LIMIT ?
-            """, (category, limit))
-        else:
-            cursor = conn.execute("""
-                SELECT * FROM entries 
-                ORDER BY updated_at DESC 
-                LIMIT ?
-            """, (limit,))
+async def get_entries(
+    request: Request,
+    category: Optional[str] = None,
+    limit: int = Query(50, ge=1),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    tag: List[str] = Query([]),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
+    ids: Optional[str] = None,
+    path: str = Depends(kb_path),
+):
+    """Get entries newest first, optionally by category, paginated by an opaque cursor.
+
+    The next page's cursor is returned in the X-Next-Cursor and Link headers.
+    `fields` projects a subset of columns (plus `preview`), e.g. for list views.
+    Repeat `tag` to filter by tags, all of them (tag_mode=all) or any (tag_mode=any).
+    `ids=1,2,3` fetches those entries instead, in that order, in one query;
+    ids that do not exist are listed in the X-Missing-Ids header.
+    """
+    try:
+        _, columns = parse_fields(fields)
+        after = decode_cursor(cursor) if cursor else None
+        wanted = parse_ids(ids, BATCH_MAX_ITEMS) if ids is not None else None
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    
+    if wanted is not None:
+        @versioned(request)
+        def query_ids(conn):
+            rows = fetch_entries(conn, wanted, columns)
+            found = {row["id"] for row in rows}
+            return rows_json(rows), [entry_id for entry_id in wanted if entry_id not in found]
         
-        entries = []
-        for row in cursor.fetchall():
-            entries.append(Entry(**dict(row)))
+        etag, result = await run_db(query_ids, readonly=True, path=path)
+        if result is None:
+            return not_modified(etag)
+        body, missing = result
+        headers = cache_headers(etag)
+        if missing:
+            headers["X-Missing-Ids"] = ",".join(map(str, missing))
+        return RawJSONResponse(body, headers=headers)
+    
+    @versioned(request)
+    def query(conn):
+        conditions = []
+        params = []
+        if category:
+            conditions.append("category = ?")
+            params.append(category)
+        tag_condition, tag_params = tag_filter(tag, tag_mode)
+        if tag_condition:
+            conditions.append(tag_condition)
+            params.extend(tag_params)
+        if after:
+            # Keyset condition, served by the (category, updated_at, id) indexes
+            conditions.append("(updated_at, id) < (?, ?)")
+            params.extend(after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
         
-        return entries
+        result = conn.execute(f"""
+            SELECT {columns} FROM entries 
+            {where}
+            ORDER BY updated_at DESC, id DESC 
+            LIMIT ?
+        """, (*params, limit))
+        rows = result.fetchall()
+        last = (rows[-1]["updated_at"], rows[-1]["id"]) if len(rows) == limit else None
+        # Encode on the database thread, straight from rows to JSON bytes
+        return rows_json(rows), last
+    
+    etag, page = await run_db(query, readonly=True, path=path)
+    if page is None:
+        return not_modified(etag)
+    body, last = page
+    
+    headers = cache_headers(etag)
+    if last:
+        next_cursor = encode_cursor(*last)
+        next_url = request.url.include_query_params(cursor=next_cursor)
+        headers["X-Next-Cursor"] = next_cursor
+        headers["Link"] = f'<{next_url}>; rel="next"'
+    
+    # Entry documents the schema; the rows are not rebuilt as models
+    return RawJSONResponse(body, headers=headers)
+
+def versioned(request):
+    """Decorate a listing query so it is skipped when the client's ETag is still current.
+
+    The ETag combines the request URL with the global entries version, which
+    every write bumps. The decorated function returns (etag, result or None).
+    """
+    def decorator(compute):
+        def query(conn):
+            etag = make_etag(request.url.path, request.url.query, entries_version(conn))
+            if is_not_modified(request, etag):
+                return etag, None
+            return etag, compute(conn)
+        return query
+    return decorator
+
+def entry_updated_at(conn, entry_id):
+    """Fetch only an entry's updated_at, raising 404 if it does not exist"""
+    row = conn.execute("SELECT updated_at FROM entries WHERE id = ?", (entry_id,)).fetchone()
+    if not row:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    return row[0]
+
+def fetch_entry(conn, entry_id):
+    """Fetch a single entry row as a dict, raising 404 if it does not exist"""
+    cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
+    row = cursor.fetchone()
+    
+    if not row:
+        raise HTTPException(status_code=404, detail="Entry not found")
+    
+    return dict(row)
+
+def fetch_entries(conn, entry_ids, columns="*"):
+    """Fetch several entry rows in one query, in the order of entry_ids; missing ids are left out"""
+    if not entry_ids:
+        return []
+    placeholders = ", ".join("?" for _ in entry_ids)
+    rows = conn.execute(f"SELECT {columns} FROM entries WHERE id IN ({placeholders})", list(entry_ids)).fetchall()
+    by_id = {row["id"]: row for row in rows}
+    return [by_id[entry_id] for entry_id in entry_ids if entry_id in by_id]
 
 @app.get("/entries/{entry_id}", response_model=Entry)
-async def get_entry(entry_id: int):
-    """Get a specific entry"""
-    with get_db() as conn:
-        cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Entry not found")
-        
-        return Entry(**dict(row))
+async def get_entry(request: Request, entry_id: int, path: str = Depends(kb_path)):
+    """Get a specific entry, answering 304 from updated_at alone when the client's copy is current"""
+    def query(conn):
+        updated_at = entry_updated_at(conn, entry_id)
+        if is_not_modified(request, entry_etag("entry", entry_id, updated_at, path), updated_at):
+            return updated_at, None
+        entry = fetch_entry(conn, entry_id)
+        return entry["updated_at"], dumps(entry)
+    
+    updated_at, body = await run_db(query, readonly=True, path=path)
+    etag = entry_etag("entry", entry_id, updated_at, path)
+    if body is None:
+        return not_modified(etag, updated_at)
+    return RawJSONResponse(body, headers=cache_headers(etag, updated_at))
+
+@app.get("/entries/{entry_id}/related", response_model=List[RelatedEntry])
+async def get_related_entries(entry_id: int, limit: int = Query(10, ge=1, le=50), path: str = Depends(kb_path)):
+    """Entries most similar to this one, by TF-IDF cosine similarity over title, tags and content.
+
+    Served from memory-mapped vectors; entries written since the last build
+    are vectorized as they are written. Answers 503 while the first build runs.
+    """
+    related_index = get_related_index(path)
+    
+    def query(conn):
+        # data_version is read here, on the database thread, never on the event loop
+        state = (current_generation(), data_version(path))
+        if not related_index.is_current(state):
+            related_index.sync(conn, state)
+        entry_updated_at(conn, entry_id)
+        scores = dict(related_index.related(entry_id, limit))
+        if not scores:
+            return []
+        placeholders = ", ".join("?" for _ in scores)
+        rows = conn.execute(
+            f"SELECT id, title, category, tags, updated_at FROM entries WHERE id IN ({placeholders})", list(scores)
+        ).fetchall()
+        by_id = {row["id"]: {**dict(row), "score": round(scores[row["id"]], 4)} for row in rows}
+        return [by_id[related_id] for related_id in scores if related_id in by_id]
+    
+    try:
+        return await run_db(query, readonly=True, path=path)
+    except RelatedBuilding as exc:
+        raise HTTPException(status_code=503, detail=str(exc), headers={"Retry-After": str(BUILD_RETRY_AFTER)})
+    except RelatedUnavailable as exc:
+        raise HTTPException(status_code=503, detail=str(exc))
 
 @app.post("/entries", response_model=Entry)
-async def create_entry(entry: Entry):
+async def create_entry(entry: Entry, path: str = Depends(kb_path)):
     """Create a new entry"""
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.execute("""
             INSERT INTO entries (title, content, category, tags)
             VALUES (?, ?, ?, ?)
         """, (entry.title, entry.content, entry.category, entry.tags))
         
         entry_id = cursor.lastrowid
+        
+        # Render once on write so page views hit the cache
+        created = fetch_entry(conn, entry_id)
+        store_rendered(conn, created)
         conn.commit()
+        get_related_index(path).record_writes(conn)
         
         # Return the created entry
-        cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
-        row = cursor.fetchone()
-        
-        return Entry(**dict(row))
+        return created
+    
+    created = await run_db(query, path=path)
+    bump_generation()
+    return Entry(**created)
 
 @app.put("/entries/{entry_id}", response_model=Entry)
-async def update_entry(entry_id: int, entry: Entry):
+async def update_entry(entry_id: int, entry: Entry, path: str = Depends(kb_path)):
     """Update an existing entry"""
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.execute("""
             UPDATE entries 
             SET title = ?, content = ?, category = ?, tags = ?, updated_at = CURRENT_TIMESTAMP
@@ -189,97 +363,402 @@ async def update_entry(entry_id: int, entry: Entry):
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Entry not found")
         
+        # Render once on write so page views hit the cache
+        updated = fetch_entry(conn, entry_id)
+        store_rendered(conn, updated)
         conn.commit()
+        get_related_index(path).record_writes(conn)
         
         # Return the updated entry
-        cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
-        row = cursor.fetchone()
-        
-        return Entry(**dict(row))
+        return updated
+    
+    updated = await run_db(query, path=path)
+    bump_generation()
+    return Entry(**updated)
 
 @app.delete("/entries/{entry_id}")
-async def delete_entry(entry_id: int):
+async def delete_entry(entry_id: int, path: str = Depends(kb_path)):
     """Delete an entry"""
-    with get_db() as conn:
+    def query(conn):
         cursor = conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
         
         if cursor.rowcount == 0:
             raise HTTPException(status_code=404, detail="Entry not found")
         
         conn.commit()
+        get_related_index(path).record_writes(conn)
+    
+    await run_db(query, path=path)
+    bump_generation()
+    return {"message": "Entry deleted successfully"}
+
+@app.patch("/entries", response_model=List[BatchResult])
+async def patch_entries(patches: List[EntryPatch], path: str = Depends(kb_path)):
+    """Partially update many entries in one transaction, e.g. to retag or recategorize them.
+
+    Each item changes only the fields it sets. Results come back per item, in
+    order, as "updated" or "not_found".
+    """
+    if len(patches) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} entries per request")
+    changes = [patch.model_dump(exclude={"id"}, exclude_none=True) for patch in patches]
+    for position, fields in enumerate(changes):
+        if not fields:
+            raise HTTPException(status_code=400, detail=f"Item {position} sets no fields")
+    
+    def query(conn):
+        ids = list(dict.fromkeys(patch.id for patch in patches))
+        existing = {row["id"] for row in fetch_entries(conn, ids, "id")}
+        # One executemany per run of consecutive items setting the same fields, so items
+        # are applied in request order; same-field batches are the common case
+        applied = [(tuple(fields), (*fields.values(), patch.id))
+                   for patch, fields in zip(patches, changes) if patch.id in existing]
+        for names, run in itertools.groupby(applied, key=lambda item: item[0]):
+            assignments = ", ".join(f"{name} = ?" for name in names)
+            conn.executemany(
+                f"UPDATE entries SET {assignments}, updated_at = CURRENT_TIMESTAMP WHERE id = ?",
+                [params for _, params in run],
+            )
         
-        return {"message": "Entry deleted successfully"}
+        # Render changed markdown once on write, as PUT does
+        rendered = {patch.id for patch in patches if patch.content is not None and patch.id in existing}
+        for entry in fetch_entries(conn, list(rendered)):
+            store_rendered(conn, dict(entry))
+        # Other edits leave the markdown alone, so stored HTML stays valid under the new updated_at
+        kept = [entry_id for entry_id in existing if entry_id not in rendered]
+        if kept:
+            conn.execute(f"""
+                UPDATE entries_html SET updated_at = (SELECT updated_at FROM entries WHERE id = entry_id)
+                WHERE entry_id IN ({", ".join("?" for _ in kept)})
+            """, kept)
+        conn.commit()
+        get_related_index(path).record_writes(conn)
+        return [{"id": patch.id, "status": "updated" if patch.id in existing else "not_found"} for patch in patches]
+    
+    results = await run_db(query, path=path)
+    bump_generation()
+    return results
 
-@app.get("/search", response_model=List[SearchResult])
-async def search_entries(q: str, category: Optional[str] = None, limit: int = 20):
-    """Full-text search across all entries"""
-    if not q.strip():
+@app.post("/entries/delete", response_model=List[BatchResult])
+async def delete_entries(request: EntryIds, path: str = Depends(kb_path)):
+    """Delete many entries in one transaction, with a "deleted" or "not_found" status per id"""
+    ids = list(dict.fromkeys(request.ids))
+    if len(ids) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_ITEMS} entries per request")
+    
+    def query(conn):
+        existing = {row["id"] for row in fetch_entries(conn, ids, "id")}
+        conn.executemany("DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in ids if entry_id in existing])
+        conn.commit()
+        get_related_index(path).record_writes(conn)
+        return [{"id": entry_id, "status": "deleted" if entry_id in existing else "not_found"} for entry_id in ids]
+    
+    results = await run_db(query, path=path)
+    bump_generation()
+    return results
+
+@app.get("/search", response_model=List[SearchResult], response_model_exclude_none=True)
+async def search_entries(
+    q: str,
+    category: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    tag: List[str] = Query([]),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
+    include_content: bool = False,
+    kb: List[str] = Query([]),
+):
+    """Full-text search across all entries, optionally restricted to a category and tags.
+
+    `q` supports prefix terms, "quoted phrases", -exclusions, OR and
+    title:/content:/category:/tags: column filters. Results carry a snippet;
+    full bodies are only returned with include_content=true. A first page with
+    few hits is topped up with substring and spelling-corrected matches, and
+    the corrected query is sent in the X-Did-You-Mean header (URL-encoded).
+    Repeat `kb` to search those knowledge bases in parallel instead; results
+    are merged by score and carry their `kb` (no typo fallback).
+    """
+    # Compile the user's input into an FTS5 expression
+    try:
+        search_query = compile_query(q)
+    except QueryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if search_query is None:
         return []
     
-    with get_db() as conn:
-        # Prepare search query for FTS
-        search_query = f'"{q}"*'  # Prefix search
-        
-        if category:
-            cursor = conn.execute("""
-                SELECT e.*, snippet(entries_fts, 1, '<mark>', '</mark>', '...', 32) as snippet
-                FROM entries_fts 
-                JOIN entries e ON entries_fts.rowid = e.id
-                WHERE entries_fts MATCH ? AND e.category = ?
-                ORDER BY bm25(entries_fts)
-                LIMIT ?
-            """, (search_query, category, limit))
-        else:
-            cursor = conn.execute("""
-                SELECT e.*, snippet(entries_fts, 1, '<mark>', '</mark>', '...', 32) as snippet
-                FROM entries_fts 
-                JOIN entries e ON entries_fts.rowid = e.id
-                WHERE entries_fts MATCH ?
-                ORDER BY bm25(entries_fts)
-                LIMIT ?
-            """, (search_query, limit))
+    if kb:
+        try:
+            paths = [knowledge_base_path(name) for name in kb]
+        except UnknownKnowledgeBase as exc:
+            raise HTTPException(status_code=404, detail=f"Unknown knowledge base: {exc.args[0]}")
         
-        results = []
-        for row in cursor.fetchall():
-            result_dict = dict(row)
-            results.append(SearchResult(**result_dict))
+        def federated_key(conn):
+            # Every selected file's own data_version, so a commit to any of them invalidates the entry
+            return search_cache_key(q, category, limit, tag, tag_mode, offset, include_content) + (
+                "kb", tuple(kb), tuple(data_version(path) for path in paths)
+            )
         
-        return results
+        cache_key = await run_db(federated_key, readonly=True)
+        body = search_cache.get(cache_key)
+        if body is None:
+            hits = await federated_search(kb, search_query, category, tag, tag_mode, limit, offset, include_content)
+            body = rows_json(hits)
+            search_cache.set(cache_key, body)
+        return RawJSONResponse(body)
+    
+    # The cache holds encoded bodies, so hits skip serialization entirely
+    def query(conn):
+        # The key reads data_version, so it is built here on the database thread
+        cache_key = search_cache_key(q, category, limit, tag, tag_mode, offset, include_content)
+        cached = search_cache.get(cache_key)
+        if cached is None:
+            hits, suggestion = search_with_fallback(
+                conn, q, search_query, category, tag, tag_mode, limit, offset, include_content
+            )
+            cached = rows_json(hits), suggestion
+            search_cache.set(cache_key, cached)
+        return cached
+    
+    body, suggestion = await run_db(query, readonly=True)
+    headers = {"X-Did-You-Mean": quote(suggestion)} if suggestion else None
+    return RawJSONResponse(body, headers=headers)
+
+@app.get("/search/faceted", response_model=FacetedSearch, response_model_exclude_none=True)
+async def faceted_search_entries(
+    q: str,
+    category: List[str] = Query([]),
+    limit: int = Query(20, ge=1, le=200),
+    offset: int = Query(0, ge=0),
+    tag: List[str] = Query([]),
+    tag_mode: str = Query("all", pattern="^(all|any)$"),
+    include_content: bool = False,
+    facet_limit: int = Query(20, ge=1, le=500),
+    path: str = Depends(kb_path),
+):
+    """Search results plus hit counts per category and tag for the whole match set.
+
+    Repeat `category` to select several (any of them matches). Counts come
+    from the same pass over the matches as the ranked page; selected values
+    are always listed, even outside the top `facet_limit`.
+    """
+    try:
+        search_query = compile_query(q)
+    except QueryError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if search_query is None:
+        return {"results": [], "total": 0, "categories": [], "tags": []}
+
+    selected = tuple(sorted(set(category)))
+    
+    def query(conn):
+        # The key reads data_version, so it is built here on the database thread
+        cache_key = search_cache_key(
+            q, selected, limit, tag, tag_mode, offset, include_content, path
+        ) + ("facets", facet_limit)
+        body = search_cache.get(cache_key)
+        if body is None:
+            body = dumps(faceted_search(
+                conn, search_query, selected, tag, tag_mode, limit, offset, include_content, facet_limit
+            ))
+            search_cache.set(cache_key, body)
+        return body
+    
+    return RawJSONResponse(await run_db(query, readonly=True, path=path))
+
+@app.get("/suggest")
+async def suggest(
+    prefix: str = Query(..., min_length=1), limit: int = Query(8, ge=1, le=50), path: str = Depends(kb_path)
+):
+    """Typeahead completions for search terms, titles, tags and categories.
+
+    Served from an in-memory index; the database is only read when it changed
+    since the last call, and entry bodies never are.
+    """
+    suggest_index = get_suggest_index(path)
+    
+    def query(conn):
+        # data_version is read here, on the database thread, never on the event loop
+        state = (current_generation(), data_version(path))
+        if not suggest_index.is_current(state):
+            suggest_index.sync(conn, state)
+        return suggest_index.complete(prefix, limit)
+    
+    return await run_db(query, readonly=True, path=path)
+
+@app.get("/kbs")
+async def get_knowledge_bases():
+    """Configured knowledge bases with their entry counts"""
+    def query(conn):
+        return conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+    
+    counts = await asyncio.gather(*(run_db(query, readonly=True, path=path) for path in knowledge_bases.values()))
+    return [{"name": name, "entries": entries} for name, entries in zip(knowledge_bases, counts)]
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    """Hit/miss counters for the in-process caches"""
+    return {"search": search_cache.stats(), "render": html_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Request, SQL statement and render timings in Prometheus text format (per process)"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
 
 @app.get("/categories")
-async def get_categories():
+async def get_categories(request: Request, response: Response, path: str = Depends(kb_path)):
     """Get all unique categories"""
-    with get_db() as conn:
+    @versioned(request)
+    def query(conn):
         cursor = conn.execute("SELECT DISTINCT category FROM entries ORDER BY category")
-        categories = [row[0] for row in cursor.fetchall()]
-        return categories
+        return [row[0] for row in cursor.fetchall()]
+    
+    etag, categories = await run_db(query, readonly=True, path=path)
+    if categories is None:
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    return categories
 
 @app.get("/tags")
-async def get_tags():
-    """Get all unique tags"""
-    with get_db() as conn:
-        cursor = conn.execute("SELECT DISTINCT tags FROM entries WHERE tags != ''")
-        all_tags = []
-        for row in cursor.fetchall():
-            tags = [tag.strip() for tag in row[0].split(',') if tag.strip()]
-            all_tags.extend(tags)
-        
-        unique_tags = sorted(set(all_tags))
-        return unique_tags
+async def get_tags(request: Request, response: Response, counts: bool = False, path: str = Depends(kb_path)):
+    """Get all unique tags, or with counts=true the number of entries per tag"""
+    @versioned(request)
+    def query(conn):
+        # Grouping walks the (tag, entry_id) primary key; no per-row string splitting
+        cursor = conn.execute("""
+            SELECT tag, COUNT(*) AS count FROM entry_tags
+            GROUP BY tag
+            ORDER BY tag
+        """)
+        if counts:
+            return [dict(row) for row in cursor.fetchall()]
+        return [row[0] for row in cursor.fetchall()]
+    
+    etag, tags = await run_db(query, readonly=True, path=path)
+    if tags is None:
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    return tags
 
 @app.get("/export")
-async def export_entries():
-    """Export all entries as JSON"""
-    with get_db() as conn:
-        cursor = conn.execute("SELECT * FROM entries ORDER BY id")
-        entries = []
-        for row in cursor.fetchall():
-            entries.append(dict(row))
+async def export_entries(
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    since: Optional[str] = None,
+    gzip: bool = False,
+    path: str = Depends(kb_path),
+):
+    """Stream all entries (or those updated after `since`) as JSON or NDJSON"""
+    if since:
+        # Accept ISO timestamps as well as SQLite's CURRENT_TIMESTAMP format
+        since = since.replace("T", " ")
+    
+    filename = f"indexa_export.{format}"
+    media_type = EXPORT_MEDIA_TYPES[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        iter_export(format, since=since, gzip=gzip, path=path),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.post("/import")
+async def import_entries_endpoint(
+    request: Request,
+    format: str = Query("auto", pattern="^(auto|json|ndjson)$"),
+    defer_fts: bool = False,
+    keep_ids: bool = False,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1),
+    path: str = Depends(kb_path),
+):
+    """Bulk import an /export JSON or NDJSON body (optionally gzipped) in one transaction.
+
+    Rows are indexed as they are inserted; defer_fts=true rebuilds both FTS
+    indexes over the whole table instead, which only pays off for loads that
+    are a large share of the knowledge base.
+    """
+    # Spool the streamed body so the import itself never waits on the network
+    body = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_SIZE)
+    try:
+        async for chunk in request.stream():
+            body.write(chunk)
+        body.seek(0)
         
-        return JSONResponse(
-            content={"entries": entries, "exported_at": datetime.now().isoformat()},
-            headers={"Content-Disposition": "attachment; filename=indexa_export.json"}
-        )
+        try:
+            result = await run_db(
+                import_file, body, format,
+                batch_size=batch_size, defer_fts=defer_fts, keep_ids=keep_ids, path=path,
+            )
+        except ImportFormatError as exc:
+            raise HTTPException(status_code=400, detail=str(exc))
+        bump_generation()
+        return result
+    finally:
+        body.close()
+
+def require_admin(request: Request):
+    """Guard /admin routes with ADMIN_TOKEN; without one configured they are disabled"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    expected = f"Bearer {ADMIN_TOKEN}"
+    if not hmac.compare_digest(request.headers.get("authorization", ""), expected):
+        raise HTTPException(status_code=401, detail="Admin token required", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/admin/backup", dependencies=[Depends(require_admin)])
+async def download_backup(method: str = Query("vacuum", pattern=f"^({'|'.join(BACKUP_METHODS)})$")):
+    """Stream a consistent snapshot of the live database while the app keeps serving.
+
+    `vacuum` (default) sends a compacted copy, `backup` a page-by-page copy.
+    The X-Checksum-SHA256 header carries the snapshot's checksum.
+    """
+    # Snapshots go next to the rotated backups rather than to a possibly small /tmp
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=".download-", suffix=".db", dir=BACKUP_DIR)
+    os.close(fd)
+    try:
+        # Its own connection, off the database executors, so a long snapshot holds up no queries
+        checksum = await run_in_threadpool(take_snapshot, path, method)
+    except BaseException as exc:
+        os.remove(path)
+        if isinstance(exc, BackupError):
+            raise HTTPException(status_code=500, detail=str(exc))
+        raise
+    
+    filename = datetime.utcnow().strftime("indexa-%Y%m%d-%H%M%S.db")
+    return FileResponse(
+        path,
+        media_type="application/vnd.sqlite3",
+        filename=filename,
+        headers={"X-Checksum-SHA256": checksum},
+        background=BackgroundTask(os.remove, path),
+    )
+
+@app.get("/admin/maintenance", dependencies=[Depends(require_admin)])
+async def maintenance_status():
+    """Background maintenance: the elected worker, recent runs per task and current file statistics"""
+    def query(conn):
+        pragmas = ("page_count", "freelist_count", "page_size", "auto_vacuum", "journal_mode")
+        return {name: conn.execute(f"PRAGMA {name}").fetchone()[0] for name in pragmas}
+    
+    database = await run_db(query, readonly=True)
+    wal_path = f"{DATABASE_PATH}-wal"
+    database["wal_bytes"] = os.path.getsize(wal_path) if os.path.exists(wal_path) else 0
+    status = await run_in_threadpool(read_status)
+    return {
+        "enabled": MAINTENANCE_ENABLED,
+        "leader_pid": leader_pid(),
+        "worker": {"pid": os.getpid(), "leader": scheduler.is_leader},
+        "database": database,
+        **status,
+    }
+
+@app.get("/admin/replica", dependencies=[Depends(require_admin)])
+async def replica_status():
+    """This worker's local read replica: how far behind the primary it may be and how it caught up"""
+    if replica is None:
+        return {"enabled": False}
+    return {"enabled": True, "pid": os.getpid(), **replica.status()}
 
 # Web interface routes
 @app.get("/add", response_class=HTMLResponse)
@@ -288,32 +767,30 @@ async def add_entry_form(request: Request):
     return templates.TemplateResponse("add_entry.html", {"request": request})
 
 @app.get("/edit/{entry_id}", response_class=HTMLResponse)
-async def edit_entry_form(request: Request, entry_id: int):
+async def edit_entry_form(request: Request, entry_id: int, kb: Optional[str] = None, path: str = Depends(kb_path)):
     """Form to edit existing entry"""
-    with get_db() as conn:
-        cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Entry not found")
-        
-        entry = dict(row)
-        return templates.TemplateResponse("edit_entry.html", {"request": request, "entry": entry})
+    entry = await run_db(fetch_entry, entry_id, readonly=True, path=path)
+    return templates.TemplateResponse("edit_entry.html", {"request": request, "entry": entry, "kb": kb})
 
 @app.get("/view/{entry_id}", response_class=HTMLResponse)
-async def view_entry(request: Request, entry_id: int):
+async def view_entry(request: Request, entry_id: int, kb: Optional[str] = None, path: str = Depends(kb_path)):
     """View a specific entry"""
-    with get_db() as conn:
-        cursor = conn.execute("SELECT * FROM entries WHERE id = ?", (entry_id,))
-        row = cursor.fetchone()
-        
-        if not row:
-            raise HTTPException(status_code=404, detail="Entry not found")
-        
-        entry = dict(row)
-        # Convert markdown content to HTML
-        entry['content_html'] = convert_markdown(entry['content'])
-        return templates.TemplateResponse("view_entry.html", {"request": request, "entry": entry})
+    def query(conn):
+        updated_at = entry_updated_at(conn, entry_id)
+        if is_not_modified(request, entry_etag("view", entry_id, updated_at, build_id(), path), updated_at):
+            return updated_at, None
+        entry = fetch_entry(conn, entry_id)
+        # Convert markdown content to HTML, reusing the cached render when possible
+        entry['content_html'] = render_entry(conn, entry)
+        return entry["updated_at"], entry
+    
+    updated_at, entry = await run_db(query, readonly=True, path=path)
+    etag = entry_etag("view", entry_id, updated_at, build_id(), path)
+    if entry is None:
+        return not_modified(etag, updated_at)
+    return templates.TemplateResponse(
+        "view_entry.html", {"request": request, "entry": entry, "kb": kb}, headers=cache_headers(etag, updated_at)
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -321,7 +798,12 @@ if __name__ == "__main__":
     PORT = int(os.getenv("PORT", "8000"))
     WORKERS = int(os.getenv("WORKERS", "1"))
     
+    # Migrate once here so the workers' startup check finds the schema current
+    init_db()
+    close_pools()
+    
     if DEBUG:
         uvicorn.run("main:app", host=HOST, port=PORT, reload=True)
     else:
-        uvicorn.run(app, host=HOST, port=PORT, workers=WORKERS)
\ No newline at end of file
+        # uvicorn can only start multiple workers from an import string
+        uvicorn.run("main:app", host=HOST, port=PORT, workers=WORKERS)
\ No newline at end of file
@@ -0,0 +1,363 @@
+"""Background database maintenance during idle periods.
+
+One worker per database is elected through a lock file and runs the tasks
+once writes have been quiet for MAINTENANCE_IDLE seconds. Each task works
+in short steps on the shared writer connection, so app writes interleave,
+and stops at MAINTENANCE_BUDGET; unfinished work continues in the next
+idle window. Runs are recorded in <database>-maintenance.json.
+
+    python maintenance.py                                # run every task once, now
+    python maintenance.py --status                       # print the recorded runs
+    python maintenance.py --enable-incremental-vacuum    # one-off VACUUM that switches auto_vacuum
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from config import (
+    DB_CHANGELOG_KEEP,
+    FTS_AUTOMERGE,
+    FTS_CRISISMERGE,
+    MAINTENANCE_BUDGET,
+    MAINTENANCE_IDLE,
+    MAINTENANCE_OPTIMIZE_INTERVAL,
+    MAINTENANCE_TICK,
+)
+from database import get_pool
+from related import RelatedUnavailable, rebuild_if_stale
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: every worker runs maintenance, SQLite still serializes the writes
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLES = ("entries_fts", "entries_trigram")
+
+# Pages of work per step: small enough that a step holds the write lock for milliseconds
+MERGE_PAGES = 64
+VACUUM_PAGES = 256
+
+# Rows sampled per index by ANALYZE, which keeps it fast on large tables
+ANALYSIS_LIMIT = 1000
+
+# Runs kept in the status file
+HISTORY = 20
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def _merge(pool, table, pages, deadline):
+    """Run FTS5 'merge' steps until nothing is left to merge or the deadline passes"""
+    steps = 0
+    while time.monotonic() < deadline:
+        with pool.writer() as conn:
+            before = conn.total_changes
+            conn.execute(f"INSERT INTO {table}({table}, rank) VALUES('merge', ?)", (pages,))
+            conn.commit()
+            # FTS5 documents fewer than two changes as "nothing left to merge"
+            done = conn.total_changes - before < 2
+        steps += 1
+        if done:
+            return {"steps": steps, "complete": True}
+    return {"steps": steps, "complete": False}
+
+
+def fts_merge(pool, deadline):
+    """Merge segments left behind by trigger-driven writes, level by level"""
+    return {table: _merge(pool, table, MERGE_PAGES, deadline) for table in FTS_TABLES}
+
+
+def fts_optimize(pool, deadline):
+    """Merge each FTS index down to a single segment, incrementally (a negative 'merge' is an optimize in steps)"""
+    return {table: _merge(pool, table, -MERGE_PAGES, deadline) for table in FTS_TABLES}
+
+
+def analyze(pool, deadline):
+    """Refresh query planner statistics, sampling at most ANALYSIS_LIMIT rows per index"""
+    with pool.writer() as conn:
+        conn.execute(f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+        conn.commit()
+    return {"complete": True}
+
+
+def pragma_optimize(pool, deadline):
+    """Let SQLite re-analyze only the tables whose statistics look stale"""
+    with pool.writer() as conn:
+        conn.execute("PRAGMA optimize")
+    return {"complete": True}
+
+
+def checkpoint(pool, deadline):
+    """Copy the WAL back into the database and truncate it, waiting for readers at most until the deadline"""
+    with pool.writer() as conn:
+        if conn.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+            return {"skipped": "not in WAL mode", "complete": True}
+        timeout = conn.execute("PRAGMA busy_timeout").fetchone()[0]
+        conn.execute(f"PRAGMA busy_timeout = {max(int((deadline - time.monotonic()) * 1000), 0)}")
+        try:
+            busy, log, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+        finally:
+            conn.execute(f"PRAGMA busy_timeout = {timeout}")
+    return {"wal_pages": log, "checkpointed": checkpointed, "complete": not busy}
+
+
+def incremental_vacuum(pool, deadline):
+    """Return free pages to the file system, a few at a time"""
+    freed = 0
+    while time.monotonic() < deadline:
+        with pool.writer() as conn:
+            # 2 is INCREMENTAL; otherwise free pages are only reused, see --enable-incremental-vacuum
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return {"skipped": "auto_vacuum is not INCREMENTAL", "complete": True}
+            free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if not free:
+                return {"freed_pages": freed, "complete": True}
+            conn.execute(f"PRAGMA incremental_vacuum({min(free, VACUUM_PAGES)})").fetchall()
+            freed += min(free, VACUUM_PAGES)
+    return {"freed_pages": freed, "complete": False}
+
+
+def related_vectors(pool, deadline):
+    """Rebuild the related-entries vectors once RELATED_REBUILD_CHANGES entries changed; only reads the database"""
+    try:
+        with pool.reader() as conn:
+            manifest = rebuild_if_stale(conn, pool.path)
+    except RelatedUnavailable as exc:
+        return {"skipped": str(exc), "complete": True}
+    if manifest is None:
+        return {"rebuilt": False, "complete": True}
+    return {"rebuilt": True, "entries": manifest["count"], "seconds": manifest["seconds"], "complete": True}
+
+
+def prune_changelog(pool, deadline):
+    """Keep the newest DB_CHANGELOG_KEEP entries_changes rows; replicas further behind reload instead"""
+    with pool.writer() as conn:
+        deleted = conn.execute(
+            "DELETE FROM entries_changes WHERE seq <= (SELECT MAX(seq) FROM entries_changes) - ?",
+            (DB_CHANGELOG_KEEP,),
+        ).rowcount
+        conn.commit()
+    return {"deleted": deleted, "complete": True}
+
+
+# (name, function, seconds between completed runs); 0 runs once per idle window
+TASKS = [
+    ("fts_merge", fts_merge, 0),
+    ("fts_optimize", fts_optimize, MAINTENANCE_OPTIMIZE_INTERVAL),
+    ("analyze", analyze, MAINTENANCE_OPTIMIZE_INTERVAL),
+    ("pragma_optimize", pragma_optimize, 3600),
+    ("checkpoint", checkpoint, 0),
+    ("incremental_vacuum", incremental_vacuum, 0),
+    ("related_vectors", related_vectors, 0),
+    ("prune_changelog", prune_changelog, 0),
+]
+
+
+def configure_fts(pool):
+    """Persist the automerge/crisismerge settings in each FTS index's config table"""
+    with pool.writer() as conn:
+        for table in FTS_TABLES:
+            conn.execute(f"INSERT INTO {table}({table}, rank) VALUES('automerge', ?)", (FTS_AUTOMERGE,))
+            conn.execute(f"INSERT INTO {table}({table}, rank) VALUES('crisismerge', ?)", (FTS_CRISISMERGE,))
+        conn.commit()
+
+
+def lock_path(path):
+    return f"{path}-maintenance.lock"
+
+
+def leader_pid(path=None):
+    """Process id last written by the elected worker, if any"""
+    try:
+        with open(lock_path(path or get_pool().path)) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def status_path(path):
+    return f"{path}-maintenance.json"
+
+
+def read_status(path=None):
+    """Recorded maintenance runs for a database, or an empty record"""
+    try:
+        with open(status_path(path or get_pool().path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"tasks": {}, "runs": []}
+
+
+def write_status(path, status):
+    temp_path = f"{status_path(path)}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(status, f, indent=2)
+    os.replace(temp_path, status_path(path))
+
+
+def run_tasks(path=None, force=False, budget=MAINTENANCE_BUDGET, tasks=None):
+    """Run due tasks (all of them with force=True) and record the run.
+
+    A task counts as done once it reports complete; one stopped by its
+    budget stays due and picks up where it left off next time.
+    """
+    pool = get_pool(path)
+    status = read_status(pool.path)
+    now = time.time()
+    report = {"started_at": _now(), "pid": os.getpid(), "tasks": {}}
+    started = time.monotonic()
+
+    for name, task, interval in TASKS:
+        if tasks is not None and name not in tasks:
+            continue
+        last = status["tasks"].get(name, {})
+        if not force and interval and now - last.get("completed_at", 0) < interval:
+            continue
+        task_started = time.monotonic()
+        try:
+            result = task(pool, task_started + budget)
+        except Exception as exc:  # one failing task must not stop the others
+            result = {"error": f"{type(exc).__name__}: {exc}", "complete": False}
+        result["duration_ms"] = round((time.monotonic() - task_started) * 1000, 1)
+        report["tasks"][name] = result
+
+        last = {**last, "last_run": report["started_at"], "result": result}
+        parts = [result] + [value for value in result.values() if isinstance(value, dict)]
+        if all(part.get("complete", True) for part in parts):
+            last["completed_at"] = time.time()
+        status["tasks"][name] = last
+
+    if not report["tasks"]:
+        return report
+    report["duration_ms"] = round((time.monotonic() - started) * 1000, 1)
+    status["runs"] = (status.get("runs", []) + [report])[-HISTORY:]
+    write_status(pool.path, status)
+    return report
+
+
+class MaintenanceScheduler:
+    """Background thread that elects one worker per database and runs maintenance when writes go quiet.
+
+    Leadership is an exclusive lock on <database>-maintenance.lock, held for
+    the life of the process; other workers retry every tick, so a new leader
+    takes over when the old one exits. Idleness is judged from
+    PRAGMA data_version, which moves on every commit from any process.
+    """
+
+    def __init__(self, path=None, tick=MAINTENANCE_TICK, idle=MAINTENANCE_IDLE):
+        self.path = path
+        self.tick = tick
+        self.idle = idle
+        self.is_leader = False
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_version = None
+        self._last_change = 0.0
+        self._maintained_version = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="indexa-maintenance", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._release()
+
+    def _elect(self, path):
+        if self.is_leader:
+            return True
+        lock_file = open(lock_path(path), "a+")
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        lock_file.truncate(0)
+        lock_file.write(f"{os.getpid()}\n")
+        lock_file.flush()
+        self._lock_file = lock_file
+        self.is_leader = True
+        configure_fts(get_pool(path))
+        return True
+
+    def _release(self):
+        if self._lock_file is not None:
+            # Closing the file drops the flock
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    def _idle(self, pool):
+        version = pool.data_version()
+        if version != self._last_version:
+            self._last_version = version
+            self._last_change = time.monotonic()
+        return time.monotonic() - self._last_change >= self.idle
+
+    def step(self):
+        """One scheduler tick: returns the run report, or None when nothing ran"""
+        pool = get_pool(self.path)
+        if not self._elect(pool.path) or not self._idle(pool):
+            return None
+        # Per-window tasks run once per quiet period, interval tasks whenever they are due
+        report = run_tasks(pool.path, tasks=None if self._last_version != self._maintained_version else [
+            name for name, _, interval in TASKS if interval
+        ])
+        # Our own commits moved data_version; they do not count as activity
+        self._last_version = self._maintained_version = pool.data_version()
+        return report if report["tasks"] else None
+
+    def _run(self):
+        while not self._stop.wait(self.tick):
+            try:
+                self.step()
+            except Exception:
+                logger.exception("Maintenance failed")
+
+
+scheduler = MaintenanceScheduler()
+
+
+def enable_incremental_vacuum(path=None):
+    """Switch an existing database to auto_vacuum=INCREMENTAL; rewrites the whole file"""
+    with get_pool(path).writer() as conn:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Indexa database maintenance")
+    parser.add_argument("--status", action="store_true", help="Print recorded runs and exit")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                        help="Rewrite the database with auto_vacuum=INCREMENTAL (blocks writers while it runs)")
+    parser.add_argument("--budget", type=float, default=MAINTENANCE_BUDGET, help="Seconds per task")
+    args = parser.parse_args()
+
+    if args.status:
+        print(json.dumps(read_status(), indent=2))
+        return
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+    configure_fts(get_pool())
+    print(json.dumps(run_tasks(force=True, budget=args.budget), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+
+import jinja2
+
+from config import METRICS_ENABLED, SLOW_QUERY_MS
+
+logger = logging.getLogger("indexa.slow_query")
+
+# Seconds; spans a cached lookup up to a full export
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}" for labels, value in items
+        ]
+
+
+class Gauge(Counter):
+    """Value that can go up and down, e.g. requests in flight"""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(_Metric):
+    """Cumulative-bucket histogram per label set, as Prometheus expects"""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, *labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (the last slot is +Inf), then sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def render(self):
+        with self._lock:
+            items = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_text = _format_labels(self.labelnames + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_text} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {total!r}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+REGISTRY = []
+
+http_requests = Counter(
+    "indexa_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+http_duration = Histogram(
+    "indexa_http_request_duration_seconds", "Time to send the full response, streaming included", ("method", "route"))
+http_in_flight = Gauge(
+    "indexa_http_requests_in_flight", "Requests currently being handled")
+http_in_flight.inc(amount=0)
+sql_duration = Histogram(
+    "indexa_sql_statement_duration_seconds", "Time spent executing and fetching per statement", ("statement",))
+sql_rows = Counter(
+    "indexa_sql_rows_total", "Rows returned (or changed, for writes) per statement", ("statement",))
+markdown_duration = Histogram(
+    "indexa_markdown_render_seconds", "Markdown to HTML conversion time")
+template_duration = Histogram(
+    "indexa_template_render_seconds", "Jinja2 template render time", ("template",))
+
+
+def render_metrics():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER_LIST = re.compile(r"\?(?:\s*,\s*\?)+")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql):
+    """Statement label: collapsed whitespace, and IN lists of any length folded into one"""
+    text = _WHITESPACE.sub(" ", sql).strip()
+    text = _PLACEHOLDER_LIST.sub("?, ...", text)
+    return text[:300]
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute plus fetches and counts rows for each statement.
+
+    A statement is recorded once its rows are exhausted, or when the cursor is
+    reused, closed or garbage collected.
+    """
+
+    _sql = None
+    _params = ()
+    _elapsed = 0.0
+    _rows = 0
+
+    def _begin(self, sql, params):
+        self._finish()
+        self._sql = sql
+        self._params = params
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        sql = self._sql
+        if sql is None:
+            return
+        self._sql = None
+        statement = normalize_sql(sql)
+        rows = self._rows if self.description is not None else max(self.rowcount, 0)
+        sql_duration.observe(statement, value=self._elapsed)
+        sql_rows.inc(statement, amount=rows)
+        if SLOW_QUERY_MS and self._elapsed * 1000 >= SLOW_QUERY_MS:
+            self.connection.log_slow_query(sql, self._params, self._elapsed)
+
+    def execute(self, sql, parameters=()):
+        self._begin(sql, parameters)
+        start = time.perf_counter()
+        try:
+            super().execute(sql, parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        if self.description is None:
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._begin(sql, ())
+        start = time.perf_counter()
+        try:
+            super().executemany(sql, seq_of_parameters)
+        finally:
+            self._elapsed += time.perf_counter() - start
+        self._finish()
+        return self
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._elapsed += time.perf_counter() - start
+        if row is None:
+            self._finish()
+        else:
+            self._rows += 1
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        self._elapsed += time.perf_counter() - start
+        self._rows += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            # Never raise from a finalizer, e.g. for a closed connection at shutdown
+            pass
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection whose statements are timed by InstrumentedCursor"""
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def log_slow_query(self, sql, params, elapsed):
+        try:
+            # A plain cursor, so the EXPLAIN itself is not timed or logged
+            plan = sqlite3.Cursor(self).execute("EXPLAIN QUERY PLAN " + sql, params).fetchall()
+            plan_text = "\n".join(f"  {row[3]}" for row in plan)
+        except sqlite3.Error as exc:
+            plan_text = f"  (no plan: {exc})"
+        logger.warning("Slow query (%.1f ms): %s\n%s", elapsed * 1000, normalize_sql(sql), plan_text)
+
+
+def connection_factory():
+    """Connection class for the pool: instrumented unless metrics are disabled"""
+    return InstrumentedConnection if METRICS_ENABLED else sqlite3.Connection
+
+
+class TimedTemplate(jinja2.Template):
+    """Jinja2 template class that records render time per template name"""
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            template_duration.observe(self.name or "<string>", value=time.perf_counter() - start)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording per-route latency, status counts and requests in flight"""
+
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route_label(self, scope):
+        # Label by route template, not raw path, to keep the series count bounded
+        if self._routes is None:
+            router_app = scope.get("app")
+            routes = getattr(router_app, "routes", [])
+            self._routes = {getattr(route, "endpoint", getattr(route, "app", None)): route.path for route in routes}
+        endpoint = scope.get("endpoint")
+        return self._routes.get(endpoint, "<unmatched>") if endpoint is not None else "<unmatched>"
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            http_in_flight.dec()
+            route = self._route_label(scope)
+            http_duration.observe(scope["method"], route, value=elapsed)
+            http_requests.inc(scope["method"], route, str(status))
@@ -0,0 +1,188 @@
+"""Versioned schema migrations keyed on PRAGMA user_version.
+
+    python migrations.py            # apply pending migrations
+    python migrations.py --check    # exit 1 if any are pending
+"""
+import argparse
+import sys
+from contextlib import contextmanager
+
+from database import (
+    BACKFILL_ENTRY_TAGS,
+    CHANGE_TRIGGERS,
+    CREATE_ENTRIES_CHANGES,
+    CREATE_ENTRIES_FTS,
+    CREATE_ENTRIES_HTML,
+    CREATE_ENTRIES_TABLE,
+    CREATE_ENTRIES_TRIGRAM,
+    CREATE_ENTRIES_VERSION,
+    CREATE_ENTRIES_VOCAB,
+    CREATE_ENTRY_TAGS,
+    CREATE_INDEX_CATEGORY_UPDATED,
+    CREATE_INDEX_ENTRY_TAGS,
+    CREATE_INDEX_UPDATED,
+    CREATE_TRIGGER_AD,
+    CREATE_TRIGGER_AI,
+    CREATE_TRIGGER_AU,
+    CREATE_TRIGGER_CHANGES,
+    CREATE_TRIGGER_HTML_AD,
+    CREATE_TRIGGER_TAGS_AD,
+    CREATE_TRIGGER_TAGS_AI,
+    CREATE_TRIGGER_TAGS_AU,
+    CREATE_TRIGGER_TRIGRAM_AD,
+    CREATE_TRIGGER_TRIGRAM_AI,
+    CREATE_TRIGGER_TRIGRAM_AU,
+    CREATE_TRIGGER_VERSION,
+    get_pool,
+)
+
+try:
+    import fcntl
+except ImportError:  # not on Windows: BEGIN IMMEDIATE still serializes the migrations themselves
+    fcntl = None
+
+
+# Numbered migrations, applied in order, each in its own transaction.
+# Never edit a released migration; append a new one instead. The first four
+# use IF NOT EXISTS / OR IGNORE so databases created before user_version was
+# tracked (version 0) adopt them without changes.
+MIGRATIONS = [
+    (1, "entries table, FTS index and listing indexes", [
+        CREATE_ENTRIES_TABLE,
+        CREATE_INDEX_UPDATED,
+        CREATE_INDEX_CATEGORY_UPDATED,
+        CREATE_ENTRIES_FTS,
+        CREATE_TRIGGER_AI,
+        CREATE_TRIGGER_AD,
+        CREATE_TRIGGER_AU,
+    ]),
+    (2, "rendered HTML cache", [
+        CREATE_ENTRIES_HTML,
+        CREATE_TRIGGER_HTML_AD,
+    ]),
+    (3, "normalized tag index", [
+        CREATE_ENTRY_TAGS,
+        CREATE_INDEX_ENTRY_TAGS,
+        CREATE_TRIGGER_TAGS_AI,
+        CREATE_TRIGGER_TAGS_AD,
+        CREATE_TRIGGER_TAGS_AU,
+        BACKFILL_ENTRY_TAGS,
+    ]),
+    (4, "global entries change counter", [
+        CREATE_ENTRIES_VERSION,
+        "INSERT OR IGNORE INTO entries_version (id, version) VALUES (1, 0)",
+        *(CREATE_TRIGGER_VERSION.format(suffix=suffix, event=event)
+          for suffix, event in (("ai", "INSERT"), ("au", "UPDATE"), ("ad", "DELETE"))),
+    ]),
+    (5, "trigram index and vocabulary for typo-tolerant search", [
+        CREATE_ENTRIES_TRIGRAM,
+        CREATE_TRIGGER_TRIGRAM_AI,
+        CREATE_TRIGGER_TRIGRAM_AD,
+        CREATE_TRIGGER_TRIGRAM_AU,
+        "INSERT INTO entries_trigram(entries_trigram) VALUES('rebuild')",
+        CREATE_ENTRIES_VOCAB,
+    ]),
+    (6, "change log for in-memory replicas", [
+        CREATE_ENTRIES_CHANGES,
+        *(CREATE_TRIGGER_CHANGES.format(suffix=suffix, event=event, row=row) for suffix, event, row in CHANGE_TRIGGERS),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+class SchemaError(RuntimeError):
+    """Raised when the database schema does not match what this code expects"""
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def pending_migrations(conn):
+    """Migrations newer than the database's user_version"""
+    version = schema_version(conn)
+    if version > LATEST_VERSION:
+        raise SchemaError(f"Database schema version {version} is newer than this code ({LATEST_VERSION})")
+    return [migration for migration in MIGRATIONS if migration[0] > version]
+
+
+@contextmanager
+def migration_lock(path):
+    """Exclusive lock file next to the database, so only one process migrates"""
+    with open(f"{path}-migrate.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def apply_migration(conn, version, statements):
+    """Run one migration and record its version atomically"""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for statement in statements:
+            conn.execute(statement)
+        conn.execute(f"PRAGMA user_version = {int(version)}")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def migrate(path=None):
+    """Apply pending migrations and return their versions.
+
+    The common case, an up-to-date schema, is a single PRAGMA read without
+    taking any lock, so workers starting together do not queue up.
+    """
+    pool = get_pool(path)
+    with pool.reader() as conn:
+        if not pending_migrations(conn):
+            return []
+
+    applied = []
+    with migration_lock(pool.path), pool.writer() as conn:
+        # Another process may have migrated while we waited for the lock
+        for version, _, statements in pending_migrations(conn):
+            apply_migration(conn, version, statements)
+            applied.append(version)
+    return applied
+
+
+def check_schema(path=None):
+    """Raise SchemaError unless the schema is current; never writes"""
+    with get_pool(path).reader() as conn:
+        version = schema_version(conn)
+        if pending_migrations(conn):
+            raise SchemaError(
+                f"Database schema is at version {version}, {LATEST_VERSION} required; run python migrations.py"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply Indexa schema migrations")
+    parser.add_argument("--check", action="store_true", help="Only report whether migrations are pending")
+    args = parser.parse_args()
+
+    if args.check:
+        try:
+            check_schema()
+        except SchemaError as exc:
+            print(exc, file=sys.stderr)
+            sys.exit(1)
+        print(f"Schema is current (version {LATEST_VERSION})")
+        return
+
+    applied = migrate()
+    for version, description, _ in MIGRATIONS:
+        if version in applied:
+            print(f"Applied {version}: {description}")
+    print(f"Schema is at version {LATEST_VERSION}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+import base64
+import json
+
+# Columns a listing may project; "preview" is computed from the first characters of content
+LIST_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "content": "content",
+    "preview": "substr(content, 1, 200) AS preview",
+    "category": "category",
+    "tags": "tags",
+    "created_at": "created_at",
+    "updated_at": "updated_at",
+}
+
+# Always selected, because the next cursor is built from them
+CURSOR_FIELDS = ("id", "updated_at")
+
+
+class InvalidCursor(ValueError):
+    """Raised when a pagination cursor cannot be decoded"""
+
+
+def encode_cursor(updated_at, entry_id):
+    """Encode the position after (updated_at, id) as an opaque URL-safe token"""
+    raw = json.dumps([updated_at, entry_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Decode a cursor produced by encode_cursor into (updated_at, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        updated_at, entry_id = json.loads(base64.urlsafe_b64decode(padded))
+    except (ValueError, TypeError):
+        raise InvalidCursor("Invalid cursor") from None
+    if not isinstance(updated_at, str) or not isinstance(entry_id, int):
+        raise InvalidCursor("Invalid cursor")
+    return updated_at, entry_id
+
+
+def parse_fields(fields):
+    """Turn a comma-separated fields= value into the SELECT column list"""
+    if not fields:
+        return None, "*"
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    for name in CURSOR_FIELDS:
+        if name not in names:
+            names.append(name)
+    return names, ", ".join(LIST_FIELDS[name] for name in names)
+
+
+def parse_ids(value, limit):
+    """Turn a comma-separated ids= value into distinct ints, in the order given"""
+    try:
+        ids = [int(part) for part in value.split(",") if part.strip()]
+    except ValueError:
+        raise ValueError("ids must be comma-separated integers") from None
+    ids = list(dict.fromkeys(ids))
+    if not ids:
+        raise ValueError("ids is empty")
+    if len(ids) > limit:
+        raise ValueError(f"At most {limit} ids per request")
+    return ids
@@ -0,0 +1,436 @@
+"""Related entries from hashed TF-IDF vectors.
+
+    python related.py build    # (re)build the vector files next to the database
+
+Each entry is reduced to its TERMS_PER_ENTRY strongest title/tags/content
+terms, hashed into FEATURES buckets and L2-normalized. The vectors and an
+inverted index over them are saved as .npy files in <database>-related/ and
+memory-mapped, so every worker shares one copy through the page cache and a
+restart loads instantly. Entries written after the build are vectorized
+per process and kept in memory until the next build: by the write handlers
+for this process's own writes, on the next read for other processes'. The
+first build runs in a background thread; until it finishes the index is
+unavailable rather than making a request wait for it.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+from config import RELATED_REBUILD_CHANGES
+from database import entries_version, get_pool
+from spelling import words
+
+try:
+    import numpy as np
+except ImportError:  # optional: /entries/{id}/related answers 503 without it
+    np = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Hashed vocabulary size and the number of terms kept per entry
+FEATURES = 1 << 18
+TERMS_PER_ENTRY = 32
+
+# Term frequency multipliers per field
+FIELD_WEIGHTS = (("title", 3.0), ("tags", 2.0), ("content", 1.0))
+
+ARRAYS = ("ids", "features", "weights", "idf", "offsets", "post_rows", "post_weights")
+
+# Seconds a client should wait before retrying while the first build runs
+BUILD_RETRY_AFTER = 5
+
+logger = logging.getLogger(__name__)
+
+
+class RelatedUnavailable(RuntimeError):
+    """Raised when numpy is not installed"""
+
+
+class RelatedBuilding(RelatedUnavailable):
+    """Raised while the first build runs in the background"""
+
+
+def index_dir(path):
+    return f"{path}-related"
+
+
+@contextmanager
+def _build_lock(path):
+    with open(f"{path}-related.lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def read_manifest(path):
+    """The current build's metadata, or None before the first build"""
+    try:
+        with open(os.path.join(index_dir(path), "current.json")) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class Vectorizer:
+    """Turns entries into term counts over hashed features, memoizing each word's hash"""
+
+    def __init__(self):
+        self._features = {}
+
+    def counts(self, title, content, tags):
+        counts = {}
+        features = self._features
+        for text, weight in zip((title, (tags or "").replace(",", " "), content), (w for _, w in FIELD_WEIGHTS)):
+            for word in words(text or ""):
+                feature = features.get(word)
+                if feature is None:
+                    if len(word) < 2:
+                        continue
+                    feature = features[word] = zlib.crc32(word.encode()) & (FEATURES - 1)
+                counts[feature] = counts.get(feature, 0.0) + weight
+        features_array = np.fromiter(counts.keys(), np.int32, len(counts))
+        counts_array = np.fromiter(counts.values(), np.float32, len(counts))
+        return features_array, counts_array
+
+
+def weigh(features, counts, idf):
+    """Keep the TERMS_PER_ENTRY highest tf-idf terms, L2-normalized, padded to fixed width"""
+    weights = (1 + np.log(counts)) * idf[features]
+    if len(weights) > TERMS_PER_ENTRY:
+        top = np.argpartition(-weights, TERMS_PER_ENTRY)[:TERMS_PER_ENTRY]
+        features, weights = features[top], weights[top]
+    norm = np.linalg.norm(weights)
+    row_features = np.zeros(TERMS_PER_ENTRY, np.int32)
+    row_weights = np.zeros(TERMS_PER_ENTRY, np.float32)
+    row_features[:len(features)] = features
+    if norm:
+        row_weights[:len(weights)] = weights / norm
+    return row_features, row_weights
+
+
+def build(conn, path):
+    """Vectorize every entry and write a new build; returns its manifest"""
+    if np is None:
+        raise RelatedUnavailable("Related entries need numpy")
+    started = time.monotonic()
+    version = entries_version(conn)
+    watermark = list(conn.execute(
+        "SELECT COALESCE(MAX(updated_at), ''), COALESCE(MAX(id), 0) FROM entries"
+    ).fetchone())
+
+    vectorizer = Vectorizer()
+    ids, documents = [], []
+    df = np.zeros(FEATURES, np.int32)
+    for entry_id, title, content, tags in conn.execute("SELECT id, title, content, tags FROM entries ORDER BY id"):
+        features, counts = vectorizer.counts(title, content, tags)
+        df[features] += 1
+        ids.append(entry_id)
+        documents.append((features, counts))
+
+    count = len(ids)
+    idf = (np.log((1 + count) / (1 + df)) + 1).astype(np.float32)
+    features = np.zeros((count, TERMS_PER_ENTRY), np.int32)
+    weights = np.zeros((count, TERMS_PER_ENTRY), np.float32)
+    for row, (doc_features, doc_counts) in enumerate(documents):
+        features[row], weights[row] = weigh(doc_features, doc_counts, idf)
+
+    # Inverted index: the rows holding each feature, grouped by feature
+    flat_features = features.ravel()
+    flat_weights = weights.ravel()
+    nonzero = np.flatnonzero(flat_weights)
+    order = nonzero[np.argsort(flat_features[nonzero], kind="stable")]
+    arrays = {
+        "ids": np.asarray(ids, np.int64),
+        "features": features,
+        "weights": weights,
+        "idf": idf,
+        "offsets": np.searchsorted(flat_features[order], np.arange(FEATURES + 1)).astype(np.int64),
+        "post_rows": (order // TERMS_PER_ENTRY).astype(np.int32),
+        "post_weights": flat_weights[order],
+    }
+
+    directory = index_dir(path)
+    build_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}-{time.monotonic_ns()}"
+    os.makedirs(os.path.join(directory, build_id))
+    for name, array in arrays.items():
+        np.save(os.path.join(directory, build_id, f"{name}.npy"), array)
+    manifest = {
+        "build": build_id,
+        "version": version,
+        "watermark": watermark,
+        "count": count,
+        "built_at": time.time(),
+        "seconds": round(time.monotonic() - started, 2),
+    }
+    temp_path = os.path.join(directory, "current.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, os.path.join(directory, "current.json"))
+
+    # Workers still mapping an old build keep reading it until they reload; unlinked files stay valid
+    for name in os.listdir(directory):
+        if name != build_id and os.path.isdir(os.path.join(directory, name)):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+    return manifest
+
+
+def changes_since_build(conn, path):
+    """Entries created or updated since the current build (None if there is no build)"""
+    manifest = read_manifest(path)
+    if manifest is None:
+        return None
+    return conn.execute(
+        "SELECT COUNT(*) FROM entries WHERE updated_at >= ? OR id > ?", manifest["watermark"]
+    ).fetchone()[0]
+
+
+def rebuild_if_stale(conn, path, max_changes=RELATED_REBUILD_CHANGES):
+    """Build when there is no build yet or too many entries changed since; returns the new manifest or None"""
+    changed = changes_since_build(conn, path)
+    if changed is not None and changed <= max_changes:
+        return None
+    with _build_lock(path):
+        # Another process may have built while we waited
+        changed = changes_since_build(conn, path)
+        if changed is not None and changed <= max_changes:
+            return None
+        return build(conn, path)
+
+
+class RelatedIndex:
+    """Per-process view of the memory-mapped build plus vectors for entries written since.
+
+    Kept current like the typeahead index: when entries_version moves, rows
+    changed since the last sync are re-vectorized with the build's idf and
+    their old rows masked out; a count check catches deletes. The write
+    handlers do this straight after their commit, so reads only catch up on
+    other processes' writes.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._path = None
+        self._build = None
+        self._arrays = None
+        self._stale = None
+        self._overlay = {}
+        self._stacked = None
+        self._vectorizer = None
+        self._version = None
+        self._watermark = None
+        self._state = None
+        self._builder = None
+
+    def is_current(self, state):
+        """True if the index was last synced at this (generation, data_version) state"""
+        return self._state == state
+
+    def _load(self, path, manifest):
+        directory = os.path.join(index_dir(path), manifest["build"])
+        self._arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        self._stale = np.zeros(manifest["count"], bool)
+        self._overlay = {}
+        self._stacked = None
+        self._vectorizer = Vectorizer()
+        self._build = manifest["build"]
+        self._version = manifest["version"]
+        self._watermark = tuple(manifest["watermark"])
+        self._path = path
+
+    def _slot(self, entry_id):
+        ids = self._arrays["ids"]
+        slot = int(np.searchsorted(ids, entry_id))
+        if slot < len(ids) and ids[slot] == entry_id:
+            return slot
+        return None
+
+    def sync(self, conn, state=None):
+        """Load the newest build and catch up with later writes.
+
+        Without a build yet, starts one in the background and raises RelatedBuilding.
+        """
+        if np is None:
+            raise RelatedUnavailable("Related entries need numpy")
+        path = get_pool(self.path).path
+        manifest = read_manifest(path)
+        if manifest is None:
+            self._start_build(path)
+            raise RelatedBuilding("The related-entries index is being built; retry shortly")
+        with self._lock:
+            if manifest["build"] != self._build or path != self._path:
+                self._load(path, manifest)
+            self._catch_up(conn)
+            self._state = state
+
+    def record_writes(self, conn):
+        """Vectorize entries written since the last sync; call on the writer connection after a commit"""
+        if np is None:
+            return
+        with self._lock:
+            # Before the first load there is nothing to update; the load picks the writes up
+            if self._arrays is not None:
+                self._catch_up(conn)
+
+    def _catch_up(self, conn):
+        version = entries_version(conn)
+        if self._version == version:
+            return
+        rows = conn.execute(
+            "SELECT id, title, content, tags FROM entries WHERE updated_at >= ? OR id > ?", self._watermark
+        ).fetchall()
+        idf = self._arrays["idf"]
+        for entry_id, title, content, tags in rows:
+            slot = self._slot(entry_id)
+            if slot is not None:
+                self._stale[slot] = True
+            self._overlay[entry_id] = weigh(*self._vectorizer.counts(title, content, tags), idf)
+
+        live = len(self._stale) - int(self._stale.sum()) + len(self._overlay)
+        if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] != live:
+            existing = {row[0] for row in conn.execute("SELECT id FROM entries")}
+            for entry_id in [entry_id for entry_id in self._overlay if entry_id not in existing]:
+                del self._overlay[entry_id]
+            gone = ~np.isin(self._arrays["ids"], np.fromiter(existing, np.int64, len(existing)))
+            self._stale |= gone
+
+        self._stacked = None
+        self._version = version
+        self._watermark = tuple(conn.execute(
+            "SELECT COALESCE(MAX(updated_at), ''), COALESCE(MAX(id), 0) FROM entries"
+        ).fetchone())
+
+    def _start_build(self, path):
+        with self._lock:
+            if self._builder is not None and self._builder.is_alive():
+                return
+            self._builder = threading.Thread(
+                target=self._run_build, args=(path,), name="indexa-related-build", daemon=True
+            )
+            self._builder.start()
+
+    def _run_build(self, path):
+        try:
+            with get_pool(path).reader() as conn:
+                rebuild_if_stale(conn, path)
+        except Exception:
+            logger.exception("Related-entries build failed")
+
+    def wait_for_build(self, timeout=None):
+        """Block until a background build started by sync has finished"""
+        builder = self._builder
+        if builder is not None:
+            builder.join(timeout)
+
+    def _vector(self, entry_id):
+        if entry_id in self._overlay:
+            return self._overlay[entry_id]
+        slot = self._slot(entry_id)
+        if slot is None or self._stale[slot]:
+            return None
+        return self._arrays["features"][slot], self._arrays["weights"][slot]
+
+    def _score_overlay(self, entry_id, features, weights, limit):
+        if self._stacked is None:
+            self._stacked = (
+                np.fromiter(self._overlay.keys(), np.int64, len(self._overlay)),
+                np.stack([vector[0] for vector in self._overlay.values()]),
+                np.stack([vector[1] for vector in self._overlay.values()]),
+            )
+        ids, other_features, other_weights = self._stacked
+        # Look every stored feature up among the query's (sorted) features at once
+        order = np.argsort(features)
+        features, weights = features[order], weights[order]
+        positions = np.minimum(np.searchsorted(features, other_features), len(features) - 1)
+        matched = features[positions] == other_features
+        scores = (np.where(matched, weights[positions], 0) * other_weights).sum(axis=1)
+        scores[ids == entry_id] = 0
+        top = np.argsort(-scores)[:limit]
+        return [(int(ids[row]), float(scores[row])) for row in top if scores[row] > 0]
+
+    def related(self, entry_id, limit=10):
+        """(id, cosine similarity) of the entries most similar to entry_id, best first"""
+        with self._lock:
+            vector = self._vector(entry_id)
+            if vector is None:
+                return []
+            features, weights = vector
+            keep = weights > 0
+            features, weights = features[keep], weights[keep]
+            if not len(features):
+                return []
+
+            # Build rows: accumulate query weight x row weight along each feature's postings
+            arrays = self._arrays
+            offsets, post_rows, post_weights = arrays["offsets"], arrays["post_rows"], arrays["post_weights"]
+            spans = [(offsets[feature], offsets[feature + 1], weight) for feature, weight in zip(features, weights)]
+            rows = np.concatenate([post_rows[start:end] for start, end, _ in spans] or [np.zeros(0, np.int32)])
+            products = np.concatenate(
+                [post_weights[start:end] * weight for start, end, weight in spans] or [np.zeros(0, np.float32)]
+            )
+            scores = np.bincount(rows, products, minlength=len(self._stale))
+            scores[self._stale] = 0
+            slot = self._slot(entry_id)
+            if slot is not None:
+                scores[slot] = 0
+
+            candidates = []
+            if len(scores):
+                top = np.argpartition(-scores, min(limit, len(scores) - 1))[:limit]
+                ids = arrays["ids"]
+                candidates = [(int(ids[row]), float(scores[row])) for row in top if scores[row] > 0]
+
+            # Entries written since the build, compared directly
+            if self._overlay:
+                candidates.extend(self._score_overlay(entry_id, features, weights, limit))
+
+        candidates.sort(key=lambda item: (-item[1], item[0]))
+        return candidates[:limit]
+
+
+related_index = RelatedIndex()
+
+# Indexes for other knowledge bases, by database path, created on first use
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_related_index(path=None):
+    """This process's related-entries index for a database file (related_index for the default one)"""
+    path = get_pool(path).path
+    if path == get_pool().path:
+        return related_index
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = RelatedIndex(path)
+        return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the related-entries index")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("build", help="Vectorize every entry and replace the current build")
+    parser.parse_args()
+
+    pool = get_pool()
+    with pool.reader() as conn, _build_lock(pool.path):
+        manifest = build(conn, pool.path)
+    print(json.dumps(manifest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import threading
+import time
+import zlib
+
+import markdown
+
+from cache import LRUCache
+from config import RENDER_CACHE_BYTES, RENDER_CACHE_PERSIST
+from metrics import markdown_duration
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'tables', 'toc']
+
+_local = threading.local()
+
+# Rendered HTML keyed by (entry id, updated_at, content checksum)
+html_cache = LRUCache(max_bytes=RENDER_CACHE_BYTES)
+
+
+def _converter():
+    # Markdown instances are not thread-safe, so each thread keeps its own
+    md = getattr(_local, "markdown", None)
+    if md is None:
+        md = _local.markdown = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+    return md
+
+
+# Markdown converter
+def convert_markdown(text):
+    """Convert markdown text to HTML"""
+    start = time.perf_counter()
+    md = _converter()
+    try:
+        return md.convert(text)
+    finally:
+        md.reset()
+        markdown_duration.observe(value=time.perf_counter() - start)
+
+
+def render_key(entry):
+    """Cache key identifying one version of an entry's content"""
+    # updated_at only has one-second resolution, so the checksum tells apart quick successive edits
+    return (entry["id"], entry["updated_at"], zlib.crc32(entry["content"].encode("utf-8")))
+
+
+def render_entry(conn, entry):
+    """Return an entry's HTML from the in-process cache, the entries_html table, or a fresh render"""
+    key = render_key(entry)
+    html = html_cache.get(key)
+    if html is not None:
+        return html
+
+    if RENDER_CACHE_PERSIST:
+        row = conn.execute(
+            "SELECT html FROM entries_html WHERE entry_id = ? AND updated_at = ? AND checksum = ?",
+            (entry["id"], entry["updated_at"], key[2]),
+        ).fetchone()
+        if row:
+            html_cache.set(key, row[0])
+            return row[0]
+
+    html = convert_markdown(entry["content"])
+    html_cache.set(key, html)
+    return html
+
+
+def store_rendered(conn, entry):
+    """Render an entry on write so later views are served from cache.
+
+    Must run on the writer connection; the caller commits.
+    """
+    key = render_key(entry)
+    html = convert_markdown(entry["content"])
+    html_cache.set(key, html)
+    if RENDER_CACHE_PERSIST:
+        conn.execute(
+            "INSERT OR REPLACE INTO entries_html (entry_id, updated_at, checksum, html) VALUES (?, ?, ?, ?)",
+            (entry["id"], entry["updated_at"], key[2], html),
+        )
+    return html
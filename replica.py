@@ -0,0 +1,206 @@
+"""Local read replica of the primary database, for NAS-backed deployments.
+
+Each worker copies the primary into DB_REPLICA_DIR (a tmpfs such as
+/dev/shm) with the backup API and serves every read from the copy. Commits
+to the primary are replayed from the entries_changes log: straight after
+this worker's own writes, so a request reads what it wrote; every half
+DB_REPLICA_MAX_STALENESS from a background thread; and before any read
+whose copy was last checked longer ago than DB_REPLICA_MAX_STALENESS.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+
+from config import DB_REPLICA_DIR, DB_REPLICA_MAX_REPLAY, DB_REPLICA_MAX_STALENESS
+from database import (
+    CHANGE_TRIGGERS,
+    close_pool,
+    entries_version,
+    get_pool,
+    register_replica,
+    unregister_replica,
+)
+
+logger = logging.getLogger(__name__)
+
+REPLICA_NAME = re.compile(r"^indexa-replica-(\d+)\.db(?:-wal|-shm)?$")
+
+ENTRY_COLUMNS = ("id", "title", "content", "category", "tags", "created_at", "updated_at")
+
+UPSERT_SQL = f"""
+    INSERT INTO entries ({', '.join(ENTRY_COLUMNS)}) VALUES ({', '.join('?' for _ in ENTRY_COLUMNS)})
+    ON CONFLICT (id) DO UPDATE SET {', '.join(f'{name} = excluded.{name}' for name in ENTRY_COLUMNS[1:])}
+"""
+
+# Ids per SELECT ... IN (...) while replaying
+CHUNK_SIZE = 500
+
+
+def _last_seq(conn):
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'entries_changes'").fetchone()
+    return row[0] if row else 0
+
+
+def remove_orphans(directory):
+    """Delete copies left behind by workers that are no longer running"""
+    for name in os.listdir(directory):
+        match = REPLICA_NAME.match(name)
+        if not match:
+            continue
+        try:
+            os.kill(int(match.group(1)), 0)
+        except ProcessLookupError:
+            os.remove(os.path.join(directory, name))
+        except PermissionError:
+            pass
+
+
+class Replica:
+    """A worker's local copy of one primary database, kept within max_staleness seconds of it"""
+
+    def __init__(self, primary=None, directory=DB_REPLICA_DIR, max_staleness=DB_REPLICA_MAX_STALENESS,
+                 max_replay=DB_REPLICA_MAX_REPLAY):
+        self.primary = get_pool(primary).path
+        self.directory = directory
+        self.max_staleness = max_staleness
+        self.max_replay = max_replay
+        self.path = None
+        # Primary data_version the copy reflects; stands in for the primary's in cache keys
+        self.data_version = None
+        self.loads = 0
+        self.replays = 0
+        self.replayed = 0
+        self._seq = 0
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Copy the primary, route its reads here and start the background catch-up thread"""
+        os.makedirs(self.directory, exist_ok=True)
+        remove_orphans(self.directory)
+        self.path = os.path.join(self.directory, f"indexa-replica-{os.getpid()}.db")
+        self.load()
+        register_replica(self.primary, self)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="indexa-replica", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        unregister_replica(self.primary)
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.path is not None:
+            close_pool(self.path)
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(self.path + suffix):
+                    os.remove(self.path + suffix)
+            self.path = None
+
+    def age(self):
+        """Seconds since the copy was last confirmed current"""
+        return time.monotonic() - self._checked
+
+    def load(self):
+        """Copy the whole primary with the backup API"""
+        primary = get_pool(self.primary)
+        with self._lock:
+            checked = time.monotonic()
+            version = primary.data_version()
+            with primary.reader() as source, get_pool(self.path).writer() as target:
+                source.backup(target)
+                # The copy is only read and replayed into, so it keeps no change log of its own
+                for suffix, _, _ in CHANGE_TRIGGERS:
+                    target.execute(f"DROP TRIGGER IF EXISTS entries_changes_{suffix}")
+                self._seq = _last_seq(target)
+                target.execute("DELETE FROM entries_changes")
+                target.commit()
+            self.data_version = version
+            self._checked = checked
+            self.loads += 1
+
+    def catch_up(self):
+        """Replay entries changed on the primary since the last check; returns how many were applied"""
+        primary = get_pool(self.primary)
+        with self._lock:
+            checked = time.monotonic()
+            version = primary.data_version()
+            if version == self.data_version:
+                self._checked = checked
+                return 0
+
+            with primary.reader() as source:
+                # One read snapshot for the log, the rows and the version counter
+                source.execute("BEGIN")
+                last = _last_seq(source)
+                first = source.execute("SELECT MIN(seq) FROM entries_changes").fetchone()[0]
+                ids = [row[0] for row in source.execute(
+                    "SELECT DISTINCT entry_id FROM entries_changes WHERE seq > ?", (self._seq,)
+                )]
+                if last != self._seq and (first is None or first > self._seq + 1 or len(ids) > self.max_replay):
+                    # Pruned past our position, or cheaper to copy everything again
+                    source.rollback()
+                    self.load()
+                    return len(ids)
+                rows = []
+                for start in range(0, len(ids), CHUNK_SIZE):
+                    chunk = ids[start:start + CHUNK_SIZE]
+                    rows.extend(source.execute(
+                        f"SELECT {', '.join(ENTRY_COLUMNS)} FROM entries WHERE id IN ({', '.join('?' for _ in chunk)})",
+                        chunk,
+                    ).fetchall())
+                counter = entries_version(source)
+
+            present = {row[0] for row in rows}
+            with get_pool(self.path).writer() as target:
+                target.executemany(
+                    "DELETE FROM entries WHERE id = ?", [(entry_id,) for entry_id in ids if entry_id not in present]
+                )
+                target.executemany(UPSERT_SQL, [tuple(row) for row in rows])
+                # Same counter as the primary, so ETags agree whichever worker answers
+                target.execute("UPDATE entries_version SET version = ? WHERE id = 1", (counter,))
+                target.commit()
+
+            self._seq = last
+            self.data_version = version
+            self._checked = checked
+            if ids:
+                self.replays += 1
+                self.replayed += len(ids)
+            return len(ids)
+
+    @contextmanager
+    def reader(self):
+        """Borrow a read-only connection to the copy, catching up first if it may be too stale"""
+        if self.age() > self.max_staleness:
+            self.catch_up()
+        with get_pool(self.path).reader() as conn:
+            yield conn
+
+    def status(self):
+        return {
+            "path": self.path,
+            "primary": self.primary,
+            "age_seconds": round(self.age(), 3),
+            "max_staleness": self.max_staleness,
+            "change_seq": self._seq,
+            "loads": self.loads,
+            "replays": self.replays,
+            "replayed_entries": self.replayed,
+        }
+
+    def _run(self):
+        while not self._stop.wait(self.max_staleness / 2):
+            try:
+                self.catch_up()
+            except Exception:
+                logger.exception("Replica catch-up failed")
+
+
+replica = Replica() if DB_REPLICA_DIR else None
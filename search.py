@@ -0,0 +1,377 @@
+import re
+
+from cache import LRUCache, current_generation
+from config import SEARCH_CACHE_SIZE, SEARCH_CACHE_TTL, SEARCH_FALLBACK_HITS, SEARCH_WEIGHTS
+from database import data_version
+from spelling import spelling_index
+from tags import tag_filter
+
+# entries_fts column order, as declared in database.CREATE_ENTRIES_FTS
+FTS_COLUMNS = ("title", "content", "category", "tags")
+
+# Columns users may target with field:term
+FIELD_FILTERS = ("title", "content", "category", "tags")
+
+_TOKEN = re.compile(r"""
+    \s*
+    (?P<neg>-)?
+    (?:(?P<field>[A-Za-z_]+):)?
+    (?:"(?P<phrase>[^"]*)"|(?P<word>[^\s"]+))
+""", re.VERBOSE)
+
+# Result lists keyed by the normalized query plus the write generation
+search_cache = LRUCache(max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+
+def normalize_query(q):
+    """Collapse whitespace and case; FTS5's unicode61 tokenizer ignores both"""
+    return " ".join(q.lower().split())
+
+
+def search_cache_key(q, category=None, limit=20, tags=(), tag_mode="all", offset=0, include_content=False, path=None):
+    """Build the cache key for a search.
+
+    The key embeds this process's write generation and the data_version of the
+    database at `path` (the default one unless given), so a commit from this or any other worker makes older entries unreachable.
+    Reading data_version is database I/O: call this on a database thread.
+    """
+    return (
+        normalize_query(q),
+        category or None,
+        limit,
+        tuple(sorted(set(tags))),
+        tag_mode,
+        offset,
+        include_content,
+        path,
+        current_generation(),
+        data_version(path),
+    )
+
+
+class QueryError(ValueError):
+    """Raised when user search input cannot be compiled"""
+
+
+def _quote(text):
+    # Inside an FTS5 string a double quote is escaped by doubling it
+    return '"' + text.replace('"', '""') + '"'
+
+
+def _tokenize(q):
+    """Split user input into (negated, field, text, is_phrase) terms and OR operators"""
+    tokens = []
+    pos = 0
+    while pos < len(q):
+        if q[pos:].strip() == "":
+            break
+        match = _TOKEN.match(q, pos)
+        if not match:
+            raise QueryError("Unbalanced quote in search query")
+        pos = match.end()
+
+        negated = bool(match.group("neg"))
+        field = match.group("field")
+        phrase = match.group("phrase")
+        word = match.group("word")
+
+        if field and field.lower() not in FIELD_FILTERS:
+            # Not a column filter (e.g. a URL), so keep the colon as part of the term
+            if phrase is not None:
+                raise QueryError(f"Unknown search field '{field}'")
+            word = f"{field}:{word}"
+            field = None
+
+        if word is not None and not negated and not field and word in ("OR", "AND", "NOT"):
+            tokens.append(word)
+            continue
+        text = phrase if phrase is not None else word
+        tokens.append((negated, field.lower() if field else None, text, phrase is not None))
+    return tokens
+
+
+def _render_term(field, text, is_phrase):
+    # Terms without any word characters index to nothing, so they would only empty the result
+    if not re.search(r"\w", text):
+        return None
+    expression = _quote(text) if is_phrase else _quote(text) + "*"
+    return f"{field} : {expression}" if field else expression
+
+
+def compile_query(q):
+    """Compile user search input into an FTS5 MATCH expression.
+
+    Supports per-term prefix matching, "quoted phrases", -exclusions,
+    title:/content:/category:/tags: column filters and OR between adjacent
+    terms (binding tighter than the implicit AND). Returns None when nothing
+    searchable remains; raises QueryError on malformed input.
+    """
+    groups = []
+    exclusions = []
+    pending_or = False
+    negate_next = False
+
+    for token in _tokenize(q):
+        if token == "OR":
+            if not groups or pending_or:
+                raise QueryError("OR must appear between two search terms")
+            pending_or = True
+            continue
+        if token == "AND":
+            continue
+        if token == "NOT":
+            negate_next = True
+            continue
+
+        negated, field, text, is_phrase = token
+        negated = negated or negate_next
+        negate_next = False
+        expression = _render_term(field, text, is_phrase)
+
+        if negated:
+            if pending_or:
+                raise QueryError("OR cannot be combined with an exclusion")
+            if expression:
+                exclusions.append(expression)
+            continue
+        if expression is None:
+            pending_or = False
+            continue
+        if pending_or:
+            groups[-1].append(expression)
+            pending_or = False
+        else:
+            groups.append([expression])
+
+    if pending_or or negate_next:
+        raise QueryError("Search query ends with an operator")
+    if not groups:
+        if exclusions:
+            raise QueryError("Search query needs at least one term to include")
+        return None
+
+    parts = [group[0] if len(group) == 1 else "(" + " OR ".join(group) + ")" for group in groups]
+    expression = " AND ".join(parts)
+    if exclusions:
+        expression = f"({expression}) NOT " + " NOT ".join(exclusions)
+    return expression
+
+
+def compile_trigram_query(q):
+    """Compile user search input into a substring MATCH for the trigram index.
+
+    Every included term (in its column, for field: filters) must occur as a
+    substring and no excluded one may. OR is read as AND, and included terms
+    shorter than three characters are skipped, as the trigram index cannot
+    match them. Returns None when no included term is left or an exclusion
+    is too short to apply.
+    """
+    parts = []
+    exclusions = []
+    for token in _tokenize(q):
+        if isinstance(token, str):
+            continue
+        negated, field, text, _ = token
+        text = text.replace("*", "").strip()
+        if len(text) < 3:
+            if negated:
+                return None
+            continue
+        expression = f"{field} : {_quote(text)}" if field else _quote(text)
+        (exclusions if negated else parts).append(expression)
+    if not parts:
+        return None
+    expression = " AND ".join(parts)
+    if exclusions:
+        expression = f"({expression}) NOT " + " NOT ".join(exclusions)
+    return expression
+
+
+def parse_weights(spec):
+    """Parse "title=10,tags=5" into bm25 weights in FTS column order (default 1.0)"""
+    weights = dict.fromkeys(FTS_COLUMNS, 1.0)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, value = item.partition("=")
+        name = name.strip()
+        if name not in weights:
+            raise ValueError(f"Unknown FTS column in SEARCH_WEIGHTS: {name}")
+        weights[name] = float(value)
+    return tuple(weights[column] for column in FTS_COLUMNS)
+
+
+BM25_WEIGHTS = parse_weights(SEARCH_WEIGHTS)
+
+
+def rank_expression(table="entries_fts", weights=BM25_WEIGHTS):
+    """bm25() call with the configured column weights; lower is better"""
+    return f"bm25({table}, {', '.join(repr(float(w)) for w in weights)})"
+
+
+def snippet_expression(table="entries_fts"):
+    """Highlighted excerpt of the content column"""
+    return f"snippet({table}, 1, '<mark>', '</mark>', '...', 32)"
+
+
+RESULT_COLUMNS = ("id", "title", "category", "tags", "created_at", "updated_at")
+
+
+def rank_candidates(
+    conn, match, category=None, tags=(), tag_mode="all", limit=20, offset=0, table="entries_fts", with_scores=False
+):
+    """Phase one: rank matching rowids from the FTS index alone and apply LIMIT/OFFSET.
+
+    with_scores=True returns (score, rowid) pairs, lowest (best) score first.
+    """
+    conditions = [f"{table} MATCH ?"]
+    params = [match]
+    if category:
+        conditions.append(f"{table}.rowid IN (SELECT id FROM entries WHERE category = ?)")
+        params.append(category)
+    tag_condition, tag_params = tag_filter(tags, tag_mode, column=f"{table}.rowid")
+    if tag_condition:
+        conditions.append(tag_condition)
+        params.extend(tag_params)
+
+    cursor = conn.execute(f"""
+        SELECT {table}.rowid, {rank_expression(table)} AS score FROM {table}
+        WHERE {' AND '.join(conditions)}
+        ORDER BY score
+        LIMIT ? OFFSET ?
+    """, (*params, limit, offset))
+    if with_scores:
+        return [(row[1], row[0]) for row in cursor.fetchall()]
+    return [row[0] for row in cursor.fetchall()]
+
+
+def fetch_hits(conn, match, ids, include_content=False, table="entries_fts"):
+    """Phase two: load metadata and snippets for the ranked page, keeping rank order"""
+    columns = ", ".join(f"e.{name}" for name in RESULT_COLUMNS + (("content",) if include_content else ()))
+    placeholders = ", ".join("?" for _ in ids)
+    cursor = conn.execute(f"""
+        SELECT {columns}, {snippet_expression(table)} AS snippet
+        FROM {table}
+        JOIN entries e ON e.id = {table}.rowid
+        WHERE {table} MATCH ? AND {table}.rowid IN ({placeholders})
+    """, (match, *ids))
+    by_id = {row["id"]: dict(row) for row in cursor.fetchall()}
+    # Rows deleted between the two phases are simply dropped
+    return [by_id[entry_id] for entry_id in ids if entry_id in by_id]
+
+
+def run_search(
+    conn, match, category=None, tags=(), tag_mode="all", limit=20, offset=0, include_content=False, table="entries_fts"
+):
+    """Two-phase search: bodies and snippets are only touched for the final page"""
+    ids = rank_candidates(conn, match, category, tags, tag_mode, limit, offset, table)
+    if not ids:
+        return []
+    return fetch_hits(conn, match, ids, include_content, table)
+
+
+def _where(*conditions):
+    conditions = [condition for condition in conditions if condition]
+    return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _facet_counts(counts, selected, limit, field):
+    # Most frequent first, but selected values always stay visible
+    ordered = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+    top = ordered[:limit]
+    shown = {value for value, _ in top}
+    top.extend((value, counts.get(value, 0)) for value in selected if value not in shown)
+    return [{field: value, "count": count} for value, count in top]
+
+
+def faceted_search(
+    conn, match, categories=(), tags=(), tag_mode="all", limit=20, offset=0, include_content=False, facet_limit=20
+):
+    """Ranked page plus hit counts per category and tag for the whole match set.
+
+    The FTS match is evaluated once into a materialized CTE, and the page,
+    the total and both facet groups are read from it in one statement.
+    Selected categories are ORed. Category counts ignore the category
+    selection, so each shows what selecting it would add. Tag counts do the
+    same in tag_mode=any and count within the selected tags in tag_mode=all.
+    """
+    categories = list(dict.fromkeys(categories))
+    category_condition = None
+    if categories:
+        category_condition = f"c.category IN ({', '.join('?' for _ in categories)})"
+    tag_condition, tag_params = tag_filter(tags, tag_mode, column="c.id")
+    tag_drilldown = tag_condition if tag_mode == "all" else None
+    both = _where(category_condition, tag_condition)
+
+    cursor = conn.execute(f"""
+        WITH matches AS MATERIALIZED (
+            SELECT rowid AS id, {rank_expression()} AS score FROM entries_fts WHERE entries_fts MATCH ?
+        ), c AS MATERIALIZED (
+            SELECT matches.id, matches.score, e.category FROM matches JOIN entries e ON e.id = matches.id
+        )
+        SELECT 'category', category, COUNT(*), NULL FROM c {_where(tag_condition)} GROUP BY category
+        UNION ALL
+        SELECT 'tag', t.tag, COUNT(*), NULL FROM c JOIN entry_tags t ON t.entry_id = c.id
+        {_where(category_condition, tag_drilldown)} GROUP BY t.tag
+        UNION ALL
+        SELECT 'total', NULL, COUNT(*), NULL FROM c {both}
+        UNION ALL
+        SELECT * FROM (SELECT 'hit', NULL, id, score FROM c {both} ORDER BY score LIMIT ? OFFSET ?)
+    """, (
+        match,
+        *tag_params,
+        *categories, *(tag_params if tag_drilldown else ()),
+        *categories, *tag_params,
+        *categories, *tag_params, limit, offset,
+    ))
+
+    category_counts, tag_counts, hits, total = {}, {}, [], 0
+    for kind, value, count, score in cursor.fetchall():
+        if kind == "category":
+            category_counts[value] = count
+        elif kind == "tag":
+            tag_counts[value] = count
+        elif kind == "total":
+            total = count
+        else:
+            hits.append((score, count))
+    ids = [entry_id for _, entry_id in sorted(hits)]
+
+    selected_tags = [tag.strip() for tag in tags if tag.strip()]
+    return {
+        "results": fetch_hits(conn, match, ids, include_content) if ids else [],
+        "total": total,
+        "categories": _facet_counts(category_counts, categories, facet_limit, "category"),
+        "tags": _facet_counts(tag_counts, selected_tags, facet_limit, "tag"),
+    }
+
+
+def search_with_fallback(
+    conn, q, match, category=None, tags=(), tag_mode="all", limit=20, offset=0, include_content=False
+):
+    """Search, topping up a short first page so typos and partial words still find something.
+
+    With fewer than SEARCH_FALLBACK_HITS hits, substring matches from the
+    trigram index are appended; if that is still short and the query has a
+    spelling correction, hits for the corrected query are appended too.
+    Returns (hits, suggestion), the suggestion being the corrected query or None.
+    """
+    hits = run_search(conn, match, category, tags, tag_mode, limit, offset, include_content)
+    # A short first page means the primary query has no further pages either
+    wanted = min(SEARCH_FALLBACK_HITS, limit)
+    if offset or len(hits) >= wanted:
+        return hits, None
+
+    def top_up(more):
+        seen = {hit["id"] for hit in hits}
+        hits.extend(hit for hit in more if hit["id"] not in seen)
+        del hits[limit:]
+
+    trigram_match = compile_trigram_query(q)
+    if trigram_match:
+        top_up(run_search(conn, trigram_match, category, tags, tag_mode, limit, 0, include_content, "entries_trigram"))
+
+    suggestion = spelling_index.suggest(conn, q)
+    if suggestion and len(hits) < wanted:
+        corrected = compile_query(suggestion)
+        if corrected:
+            top_up(run_search(conn, corrected, category, tags, tag_mode, limit, 0, include_content))
+    return hits, suggestion
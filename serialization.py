@@ -0,0 +1,37 @@
+import json
+
+from fastapi.responses import JSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the stdlib encoder
+    orjson = None
+
+
+def dumps(content):
+    """Encode to compact UTF-8 JSON bytes, the same output JSONResponse produces"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def rows_json(rows):
+    """Encode sqlite3 rows (or dicts) as a JSON array of objects"""
+    return dumps([dict(row) for row in rows])
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson when it is installed"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+class RawJSONResponse(Response):
+    """Response for an already encoded JSON body.
+
+    Returning a Response makes FastAPI skip response_model validation and
+    serialization, so the models only document the schema.
+    """
+
+    media_type = "application/json"
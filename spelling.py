@@ -0,0 +1,202 @@
+import bisect
+import re
+import threading
+import time
+import unicodedata
+
+from config import SPELLING_REBUILD_INTERVAL
+from database import entries_version
+
+# Roughly what FTS5's unicode61 tokenizer produces: lowercased, diacritics removed,
+# split on anything that is not a letter or digit
+WORD = re.compile(r"[^\W_]+")
+
+# Rows changed since the last sync above which a full rebuild is cheaper than catching up
+MAX_INCREMENTAL_ROWS = 1000
+
+
+def fold(text):
+    """Lowercase and strip diacritics, as unicode61 (remove_diacritics) does"""
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def words(text):
+    return WORD.findall(fold(text))
+
+
+def is_correctable(word):
+    """Words worth indexing and correcting; tokens with digits (versions, hashes, ports) are left alone"""
+    return 3 <= len(word) <= 32 and word.isalpha()
+
+
+def edit_distance(a, b):
+    """Optimal string alignment distance: insertions, deletions, substitutions and transpositions"""
+    if a == b:
+        return 0
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i] + [0] * len(b)
+        for j, char_b in enumerate(b, 1):
+            cost = char_a != char_b
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def deletions(word, depth):
+    """word with up to depth characters removed (including word itself)"""
+    found = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {term[:i] + term[i + 1:] for term in frontier for i in range(len(term))}
+        found |= frontier
+    return found
+
+
+class DeletionIndex:
+    """SymSpell-style index for finding words near a misspelling.
+
+    Each word is stored under itself and its single-character deletions; a
+    query looks up its own deletions up to two characters deep and verifies
+    the candidates with edit_distance. That finds every word one edit away
+    and the usual two-edit typos, with one dict lookup per query deletion
+    instead of a distance computation per word.
+    """
+
+    def __init__(self):
+        self._words = {}
+        self.size = 0
+
+    def add(self, word):
+        for key in deletions(word, 1):
+            bucket = self._words.setdefault(key, [])
+            if word not in bucket:
+                bucket.append(word)
+        self.size += 1
+
+    def search(self, word, max_distance):
+        """(distance, word) pairs within max_distance of word"""
+        candidates = set()
+        for key in deletions(word, max_distance):
+            candidates.update(self._words.get(key, ()))
+        found = []
+        for candidate in candidates:
+            distance = edit_distance(word, candidate)
+            if distance <= max_distance:
+                found.append((distance, candidate))
+        return found
+
+
+class SpellingIndex:
+    """Per-process "did you mean" index over the entries_fts vocabulary.
+
+    Built from the entries_vocab (fts5vocab) table on first use, then kept
+    current incrementally: when entries_version moves, only rows updated
+    since the last sync are tokenized and their new words added. Words of
+    deleted entries linger until the next full rebuild, which happens every
+    SPELLING_REBUILD_INTERVAL seconds or after large changes.
+    """
+
+    def __init__(self, rebuild_interval=SPELLING_REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._index = None
+        self._frequency = {}
+        self._sorted = []
+        self._version = None
+        self._watermark = ("", 0)
+        self._built_at = 0.0
+
+    def _rebuild(self, conn):
+        index = DeletionIndex()
+        frequency = {}
+        for term, doc_count in conn.execute("SELECT term, doc FROM entries_vocab"):
+            frequency[term] = doc_count
+            if is_correctable(term):
+                index.add(term)
+        self._index = index
+        self._frequency = frequency
+        self._sorted = sorted(frequency)
+        self._built_at = time.monotonic()
+
+    def _add(self, word):
+        if word in self._frequency:
+            self._frequency[word] += 1
+            return
+        self._frequency[word] = 1
+        bisect.insort(self._sorted, word)
+        if is_correctable(word):
+            self._index.add(word)
+
+    def sync(self, conn):
+        """Bring the index up to date with the database (cheap when nothing changed)"""
+        version = entries_version(conn)
+        with self._lock:
+            if self._version == version and self._index is not None:
+                return
+            stale = time.monotonic() - self._built_at > self.rebuild_interval
+            rows = None
+            if self._index is not None and not stale:
+                # updated_at has one-second resolution, so the watermark's own second is re-read;
+                # the id catches imported rows that keep an older updated_at
+                rows = conn.execute(
+                    "SELECT title, content, category, tags FROM entries WHERE updated_at >= ? OR id > ? LIMIT ?",
+                    (*self._watermark, MAX_INCREMENTAL_ROWS + 1),
+                ).fetchall()
+            if rows is None or len(rows) > MAX_INCREMENTAL_ROWS:
+                self._rebuild(conn)
+            else:
+                for row in rows:
+                    for word in set(words(" ".join(value or "" for value in row))):
+                        self._add(word)
+            self._version = version
+            self._watermark = tuple(conn.execute(
+                "SELECT COALESCE(MAX(updated_at), ''), COALESCE(MAX(id), 0) FROM entries"
+            ).fetchone())
+
+    def is_known(self, word):
+        """True if word is indexed or the prefix of an indexed word (search matches prefixes)"""
+        position = bisect.bisect_left(self._sorted, word)
+        return position < len(self._sorted) and self._sorted[position].startswith(word)
+
+    def correct(self, word):
+        """Closest, most frequent indexed word, or None when word needs no (or has no) correction"""
+        if not is_correctable(word):
+            return None
+        with self._lock:
+            if self._index is None or self.is_known(word):
+                return None
+            max_distance = 1 if len(word) <= 4 else 2
+            candidates = self._index.search(word, max_distance)
+            if not candidates:
+                return None
+            return min(candidates, key=lambda item: (item[0], -self._frequency.get(item[1], 0), item[1]))[1]
+
+    def suggest(self, conn, q):
+        """Spell-corrected version of a search query, or None if nothing changed"""
+        self.sync(conn)
+        changed = False
+
+        def replace(match):
+            nonlocal changed
+            word = match.group(0)
+            # Leave operators and field names (title:...) alone
+            if word in ("OR", "AND", "NOT") or q[match.end():match.end() + 1] == ":":
+                return word
+            correction = self.correct(fold(word))
+            if correction is None:
+                return word
+            changed = True
+            return correction
+
+        suggestion = WORD.sub(replace, q)
+        return suggestion if changed else None
+
+
+spelling_index = SpellingIndex()
@@ -1,5 +1,6 @@
 // Global variables
 let searchTimeout;
+let suggestTimeout;
 let currentSearchQuery = '';
 
 // DOM elements
@@ -8,6 +9,7 @@ const searchBtn = document.getElementById('searchBtn');
 const categoryFilter = document.getElementById('categoryFilter');
 const clearSearchBtn = document.getElementById('clearSearch');
 const searchResults = document.getElementById('searchResults');
+const searchSuggestions = document.getElementById('searchSuggestions');
 const recentEntries = document.getElementById('recentEntries');
 const entriesList = document.getElementById('entriesList');
 
@@ -58,9 +60,14 @@ function setupKeyboardShortcuts() {
 // Search functionality
 function handleSearchInput() {
     clearTimeout(searchTimeout);
+    clearTimeout(suggestTimeout);
     const query = searchInput.value.trim();
     
     if (query.length > 0) {
+        // Completions are cheap and answered from memory; the full search waits for a pause
+        suggestTimeout = setTimeout(() => {
+            loadSuggestions(query);
+        }, 100);
         searchTimeout = setTimeout(() => {
             performSearch();
         }, 300); // Debounce search
@@ -69,6 +76,27 @@ function handleSearchInput() {
     }
 }
 
+async function loadSuggestions(query) {
+    try {
+        const response = await fetch(`/suggest?${new URLSearchParams({ prefix: query, limit: '6' })}`);
+        const suggestions = await response.json();
+        const head = query.replace(/\S*$/, '');
+        const values = [
+            ...suggestions.terms.map(item => head + item.term),
+            ...suggestions.titles.map(item => item.title),
+        ];
+        
+        searchSuggestions.innerHTML = '';
+        [...new Set(values)].forEach(value => {
+            const option = document.createElement('option');
+            option.value = value;
+            searchSuggestions.appendChild(option);
+        });
+    } catch (error) {
+        console.error('Suggest error:', error);
+    }
+}
+
 async function performSearch() {
     const query = searchInput.value.trim();
     const category = categoryFilter.value;
@@ -92,8 +120,9 @@ async function performSearch() {
         
         const response = await fetch(`/search?${params}`);
         const results = await response.json();
+        const suggestion = response.headers.get('X-Did-You-Mean');
         
-        displaySearchResults(results);
+        displaySearchResults(results, suggestion ? decodeURIComponent(suggestion) : null);
         currentSearchQuery = query;
         
         // Hide recent entries when showing search results
@@ -105,11 +134,23 @@ async function performSearch() {
     }
 }
 
-function displaySearchResults(results) {
+function displaySearchResults(results, suggestion = null) {
     searchResults.innerHTML = '';
     
+    if (suggestion) {
+        const didYouMean = document.createElement('div');
+        didYouMean.className = 'did-you-mean';
+        didYouMean.innerHTML = `Did you mean <a href="#">${escapeHtml(suggestion)}</a>?`;
+        didYouMean.querySelector('a').addEventListener('click', function(e) {
+            e.preventDefault();
+            searchInput.value = suggestion;
+            performSearch();
+        });
+        searchResults.appendChild(didYouMean);
+    }
+    
     if (results.length === 0) {
-        searchResults.innerHTML = '<div class="no-results">No results found for your search.</div>';
+        searchResults.insertAdjacentHTML('beforeend', '<div class="no-results">No results found for your search.</div>');
         return;
     }
     
@@ -155,7 +196,8 @@ async function loadRecentEntries() {
     try {
         showLoading(entriesList);
         
-        const response = await fetch('/entries?limit=3');
+        // List views only need a preview, not full document bodies
+        const response = await fetch('/entries?limit=3&fields=id,title,preview,category,tags,updated_at');
         const entries = await response.json();
         
         displayEntries(entries);
@@ -190,12 +232,17 @@ function createEntryCard(entry, isSearchResult = false) {
     const snippetHTML = isSearchResult && entry.snippet ? 
         `<div class="entry-snippet">${entry.snippet}</div>` : '';
     
+    const previewText = entry.preview ?? entry.content ?? '';
     const contentPreview = !isSearchResult ? 
-        `<div class="entry-snippet">${escapeHtml(entry.content.substring(0, 150))}${entry.content.length > 150 ? '...' : ''}</div>` : '';
+        `<div class="entry-snippet">${escapeHtml(previewText.substring(0, 150))}${previewText.length > 150 ? '...' : ''}</div>` : '';
+    
+    // Federated search results carry the knowledge base they came from (names are [A-Za-z0-9_-])
+    const kbQuery = entry.kb ? `?kb=${encodeURIComponent(entry.kb)}` : '';
+    const kbArg = entry.kb ? `'${entry.kb}'` : 'null';
     
     card.innerHTML = `
         <div class="entry-title">
-            <a href="/view/${entry.id}">${escapeHtml(entry.title)}</a>
+            <a href="/view/${entry.id}${kbQuery}">${escapeHtml(entry.title)}</a>
         </div>
         <div class="entry-meta">
             <span class="entry-category">${escapeHtml(entry.category)}</span>
@@ -204,10 +251,10 @@ function createEntryCard(entry, isSearchResult = false) {
         ${tagsHTML ? `<div class="entry-tags">${tagsHTML}</div>` : ''}
         ${snippetHTML || contentPreview}
         <div class="entry-actions">
-            <a href="/view/${entry.id}" class="btn-small btn-view"><i class="fas fa-eye"></i> View</a>
-            <a href="/edit/${entry.id}" class="btn-small btn-edit"><i class="fas fa-edit"></i> Edit</a>
-            <button onclick="deleteEntry(${entry.id})" class="btn-small btn-delete"><i class="fas fa-trash"></i> Delete</button>
-            <button onclick="copyToClipboard('${entry.id}')" class="btn-small btn-secondary"><i class="fas fa-copy"></i> Copy</button>
+            <a href="/view/${entry.id}${kbQuery}" class="btn-small btn-view"><i class="fas fa-eye"></i> View</a>
+            <a href="/edit/${entry.id}${kbQuery}" class="btn-small btn-edit"><i class="fas fa-edit"></i> Edit</a>
+            <button onclick="deleteEntry(${entry.id}, ${kbArg})" class="btn-small btn-delete"><i class="fas fa-trash"></i> Delete</button>
+            <button onclick="copyToClipboard('${entry.id}', ${kbArg})" class="btn-small btn-secondary"><i class="fas fa-copy"></i> Copy</button>
         </div>
     `;
     
@@ -215,13 +262,13 @@ function createEntryCard(entry, isSearchResult = false) {
 }
 
 // Delete entry
-async function deleteEntry(entryId) {
+async function deleteEntry(entryId, kb = null) {
     if (!confirm('Are you sure you want to delete this entry?')) {
         return;
     }
     
     try {
-        const response = await fetch(`/entries/${entryId}`, {
+        const response = await fetch(`/entries/${entryId}${kb ? `?kb=${encodeURIComponent(kb)}` : ''}`, {
             method: 'DELETE'
         });
         
@@ -243,9 +290,9 @@ async function deleteEntry(entryId) {
 }
 
 // Copy entry content to clipboard
-async function copyToClipboard(entryId) {
+async function copyToClipboard(entryId, kb = null) {
     try {
-        const response = await fetch(`/entries/${entryId}`);
+        const response = await fetch(`/entries/${entryId}${kb ? `?kb=${encodeURIComponent(kb)}` : ''}`);
         const entry = await response.json();
         
         await navigator.clipboard.writeText(entry.content);
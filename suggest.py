@@ -0,0 +1,192 @@
+import bisect
+import heapq
+import threading
+import time
+
+from config import SPELLING_REBUILD_INTERVAL
+from database import entries_version, get_pool
+from spelling import WORD, fold, words
+
+# Rows changed since the last sync above which a full rebuild is cheaper than catching up
+MAX_INCREMENTAL_ROWS = 1000
+
+# Prefixes this short match so many terms that their top completions are memoized
+MEMO_PREFIX_LENGTH = 2
+
+
+def _title_keys(entry_id, title):
+    """Index a title under each of its words, so "pos" finds "Restore Postgres backup" """
+    folded = " ".join(fold(title).split())
+    return [(folded[match.start():], entry_id) for match in WORD.finditer(folded)]
+
+
+class SuggestIndex:
+    """Per-process typeahead index: vocabulary terms, titles, tags and categories.
+
+    Everything is kept in sorted arrays and answered with bisect, never by
+    querying entry bodies. Terms come from the entries_vocab (fts5vocab)
+    table weighted by document frequency. When entries_version moves, only
+    rows changed since the last sync are read (ids, titles, categories and
+    tags), and words from them are added to the term list. Words that occur
+    only in bodies appear after the next full rebuild, which happens every
+    SPELLING_REBUILD_INTERVAL seconds.
+    """
+
+    def __init__(self, rebuild_interval=SPELLING_REBUILD_INTERVAL):
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._terms = []
+        self._term_counts = {}
+        self._memo = {}
+        self._titles = {}
+        self._title_keys = []
+        self._tags = []
+        self._categories = []
+        self._version = None
+        self._watermark = ("", 0)
+        self._built_at = 0.0
+        self._state = None
+
+    def is_current(self, state):
+        """True if the index was last synced at this (generation, data_version) state"""
+        return self._state == state
+
+    def _rebuild_terms(self, conn):
+        self._term_counts = {term: count for term, count in conn.execute("SELECT term, doc FROM entries_vocab")}
+        self._terms = sorted(self._term_counts)
+        self._built_at = time.monotonic()
+
+    def _rebuild_titles(self, conn):
+        self._titles = {}
+        keys = []
+        for entry_id, title in conn.execute("SELECT id, title FROM entries"):
+            self._titles[entry_id] = title
+            keys.extend(_title_keys(entry_id, title))
+        keys.sort()
+        self._title_keys = keys
+
+    def _set_title(self, entry_id, title):
+        old = self._titles.get(entry_id)
+        if old == title:
+            return
+        if old is not None:
+            for key in _title_keys(entry_id, old):
+                position = bisect.bisect_left(self._title_keys, key)
+                if position < len(self._title_keys) and self._title_keys[position] == key:
+                    del self._title_keys[position]
+        self._titles[entry_id] = title
+        for key in _title_keys(entry_id, title):
+            bisect.insort(self._title_keys, key)
+
+    def _add_term(self, term):
+        if term in self._term_counts:
+            return
+        self._term_counts[term] = 1
+        bisect.insort(self._terms, term)
+
+    def sync(self, conn, state=None):
+        """Bring the index up to date with the database (cheap when nothing changed)"""
+        version = entries_version(conn)
+        with self._lock:
+            if self._version != version:
+                stale = time.monotonic() - self._built_at > self.rebuild_interval
+                rows = None
+                if self._version is not None and not stale:
+                    # Same watermark as the spelling index: updated_at's own second is re-read
+                    rows = conn.execute(
+                        "SELECT id, title, category, tags FROM entries WHERE updated_at >= ? OR id > ? LIMIT ?",
+                        (*self._watermark, MAX_INCREMENTAL_ROWS + 1),
+                    ).fetchall()
+                if rows is None or len(rows) > MAX_INCREMENTAL_ROWS:
+                    self._rebuild_terms(conn)
+                    self._rebuild_titles(conn)
+                else:
+                    for entry_id, title, category, tags in rows:
+                        self._set_title(entry_id, title)
+                        for word in words(f"{title} {category} {tags or ''}"):
+                            self._add_term(word)
+                    # Deleted entries leave no changed row behind, so compare counts
+                    if conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] != len(self._titles):
+                        self._rebuild_titles(conn)
+                self._memo = {}
+
+                # Both are small aggregates over covering indexes
+                self._tags = self._names(conn, "SELECT tag, COUNT(*) FROM entry_tags GROUP BY tag")
+                self._categories = self._names(conn, "SELECT category, COUNT(*) FROM entries GROUP BY category")
+                self._version = version
+                self._watermark = tuple(conn.execute(
+                    "SELECT COALESCE(MAX(updated_at), ''), COALESCE(MAX(id), 0) FROM entries"
+                ).fetchone())
+            self._state = state
+
+    @staticmethod
+    def _names(conn, sql):
+        # (folded name, name, count), sorted for prefix lookups
+        return sorted((fold(name), name, count) for name, count in conn.execute(sql))
+
+    def _complete_term(self, prefix, limit):
+        memoize = len(prefix) <= MEMO_PREFIX_LENGTH
+        if memoize and (prefix, limit) in self._memo:
+            return self._memo[(prefix, limit)]
+        start = bisect.bisect_left(self._terms, prefix)
+        end = bisect.bisect_left(self._terms, prefix + "\U0010ffff")
+        counts = self._term_counts
+        top = heapq.nsmallest(limit, self._terms[start:end], key=lambda term: (-counts[term], term))
+        result = [{"term": term, "count": counts[term]} for term in top]
+        if memoize:
+            self._memo[(prefix, limit)] = result
+        return result
+
+    def _complete_titles(self, prefix, limit):
+        results = []
+        seen = set()
+        position = bisect.bisect_left(self._title_keys, (prefix,))
+        while position < len(self._title_keys) and len(results) < limit:
+            key, entry_id = self._title_keys[position]
+            if not key.startswith(prefix):
+                break
+            if entry_id not in seen:
+                seen.add(entry_id)
+                results.append({"id": entry_id, "title": self._titles[entry_id]})
+            position += 1
+        return results
+
+    @staticmethod
+    def _complete_names(items, prefix, limit, field):
+        start = bisect.bisect_left(items, (prefix,))
+        end = bisect.bisect_left(items, (prefix + "\U0010ffff",))
+        top = heapq.nsmallest(limit, items[start:end], key=lambda item: (-item[2], item[0]))
+        return [{field: name, "count": count} for _, name, count in top]
+
+    def complete(self, prefix, limit=8):
+        """Completions for the last word (terms) and the whole prefix (titles, tags, categories)"""
+        prefix = " ".join(fold(prefix).split())
+        if not prefix:
+            return {"terms": [], "titles": [], "tags": [], "categories": []}
+        last_word = prefix.rsplit(" ", 1)[-1]
+        with self._lock:
+            return {
+                "terms": self._complete_term(last_word, limit),
+                "titles": self._complete_titles(prefix, limit),
+                "tags": self._complete_names(self._tags, prefix, limit, "tag"),
+                "categories": self._complete_names(self._categories, prefix, limit, "category"),
+            }
+
+
+suggest_index = SuggestIndex()
+
+# Indexes for other knowledge bases, by database path, created on first use
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_suggest_index(path=None):
+    """This process's typeahead index for a database file (suggest_index for the default one)"""
+    path = get_pool(path).path
+    if path == get_pool().path:
+        return suggest_index
+    with _indexes_lock:
+        index = _indexes.get(path)
+        if index is None:
+            index = _indexes[path] = SuggestIndex()
+        return index
@@ -0,0 +1,23 @@
+TAG_MODES = ("all", "any")
+
+
+def tag_filter(tags, mode="all", column="id"):
+    """Build a WHERE condition restricting `column` to entries carrying the given tags.
+
+    mode="all" requires every tag (AND), mode="any" at least one (OR). Both are
+    answered from the (tag, entry_id) primary key of entry_tags.
+    """
+    tags = list(dict.fromkeys(tag.strip() for tag in tags if tag.strip()))
+    if not tags:
+        return None, []
+
+    placeholders = ", ".join("?" for _ in tags)
+    if mode == "any" or len(tags) == 1:
+        condition = f"{column} IN (SELECT entry_id FROM entry_tags WHERE tag IN ({placeholders}))"
+        return condition, tags
+
+    condition = f"""{column} IN (
+        SELECT entry_id FROM entry_tags WHERE tag IN ({placeholders})
+        GROUP BY entry_id HAVING COUNT(*) = ?
+    )"""
+    return condition, tags + [len(tags)]
@@ -2,7 +2,7 @@ import pytest
 import sqlite3
 import tempfile
 import os
-from main import get_db, init_db
+from database import get_db, init_db
 
 @pytest.fixture
 def temp_database():
@@ -204,4 +204,400 @@ def test_database_timestamps(temp_database):
         new_timestamps = cursor.fetchone()
         
         assert new_timestamps[0] == timestamps[0]  # created_at should be unchanged
-        assert new_timestamps[1] != timestamps[1]  # updated_at should be different
\ No newline at end of file
+        assert new_timestamps[1] != timestamps[1]  # updated_at should be different
+
+def test_pool_uses_wal_mode(temp_database):
+    """Test that pooled connections run in WAL journal mode"""
+    with get_db(readonly=True) as conn:
+        mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode.lower() == "wal"
+
+def test_pool_reuses_connections(temp_database):
+    """Test that connections are returned to the pool and reused"""
+    with get_db(readonly=True) as conn:
+        first = conn
+    with get_db(readonly=True) as conn:
+        assert conn is first
+
+    with get_db() as conn:
+        writer = conn
+    with get_db() as conn:
+        assert conn is writer
+
+def test_readonly_connection_rejects_writes(temp_database):
+    """Test that read-only connections cannot modify the database"""
+    with get_db(readonly=True) as conn:
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("""
+                INSERT INTO entries (title, content, category, tags)
+                VALUES ('Title', 'Content', 'Category', '')
+            """)
+
+def test_uncommitted_writes_are_discarded(temp_database):
+    """Test that the writer is rolled back when returned without a commit"""
+    with get_db() as conn:
+        cursor = conn.execute("""
+            INSERT INTO entries (title, content, category, tags)
+            VALUES ('Rolled Back', 'Content', 'Category', '')
+        """)
+        entry_id = cursor.lastrowid
+
+    with get_db(readonly=True) as conn:
+        cursor = conn.execute("SELECT id FROM entries WHERE id = ?", (entry_id,))
+        assert cursor.fetchone() is None
+
+def test_pool_is_bounded(temp_database):
+    """Test that the pool never opens more readers than its size"""
+    from database import ConnectionPool, PoolTimeout
+
+    pool = ConnectionPool(temp_database, size=1, timeout=0.1)
+    try:
+        with pool.reader():
+            with pytest.raises(PoolTimeout):
+                with pool.reader():
+                    pass
+    finally:
+        pool.close()
+
+def test_run_db_does_not_block_event_loop(temp_database):
+    """Test that slow queries run off the event loop"""
+    import asyncio
+    import time
+    from database import run_db
+
+    def slow_query(conn):
+        time.sleep(0.3)
+        return conn.execute("SELECT 1").fetchone()[0]
+
+    async def scenario():
+        slow = asyncio.ensure_future(run_db(slow_query, readonly=True))
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - start
+        assert await slow == 1
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.2
+
+def test_streaming_json_reader_handles_small_chunks():
+    """Test that the incremental JSON reader copes with values split across reads"""
+    import io
+    import json
+    from transfer import iter_json_records, detect_format
+
+    entries = [{"id": i, "title": f"T{i}", "content": "x" * 50, "category": "c"} for i in range(20)]
+    document = json.dumps({"exported_at": "now", "entries": entries, "count": 12345}, indent=2)
+
+    assert list(iter_json_records(io.StringIO(document), chunk_size=7)) == entries
+    assert list(iter_json_records(io.StringIO(json.dumps(entries)), chunk_size=5)) == entries
+    assert detect_format(io.StringIO(document)) == "json"
+    assert detect_format(io.StringIO(json.dumps(entries[0]))) == "ndjson"
+
+def test_lru_cache_byte_bound():
+    """Test that the LRU cache evicts least recently used values past its size bound"""
+    from cache import LRUCache
+
+    cache = LRUCache(max_bytes=10)
+    cache.set("a", "xxxx")
+    cache.set("b", "xxxx")
+    assert cache.get("a") == "xxxx"
+    cache.set("c", "xxxx")
+
+    assert cache.get("b") is None
+    assert cache.get("a") == "xxxx"
+    assert cache.stats()["bytes"] == 8
+
+    cache.set("huge", "x" * 11)
+    assert cache.get("huge") is None
+
+def test_convert_markdown_reuses_converter():
+    """Test that the shared converter is reset between documents"""
+    from rendering import convert_markdown
+
+    first = convert_markdown("# One\n\n```\ncode\n```")
+    second = convert_markdown("# Two")
+    assert "<pre><code>" in first
+    assert 'id="two"' in second
+    assert "One" not in second
+
+def test_persisted_render_cache(temp_database, monkeypatch):
+    """Test that rendered HTML stored on write is read back from entries_html"""
+    import rendering
+
+    monkeypatch.setattr(rendering, "RENDER_CACHE_PERSIST", True)
+    with get_db() as conn:
+        cursor = conn.execute("""
+            INSERT INTO entries (title, content, category, tags)
+            VALUES ('Persisted', '*stored*', 'Test', '')
+        """)
+        entry = dict(conn.execute("SELECT * FROM entries WHERE id = ?", (cursor.lastrowid,)).fetchone())
+        rendering.store_rendered(conn, entry)
+        conn.commit()
+
+    rendering.html_cache.clear()
+    with get_db(readonly=True) as conn:
+        assert rendering.render_entry(conn, entry) == "<p><em>stored</em></p>"
+    assert rendering.html_cache.get(rendering.render_key(entry)) == "<p><em>stored</em></p>"
+
+    with get_db() as conn:
+        conn.execute("DELETE FROM entries WHERE id = ?", (entry["id"],))
+        conn.commit()
+        row = conn.execute("SELECT 1 FROM entries_html WHERE entry_id = ?", (entry["id"],)).fetchone()
+        assert row is None
+
+def test_entry_tags_triggers(temp_database):
+    """Test that entry_tags follows inserts, updates and deletes"""
+    with get_db() as conn:
+        cursor = conn.execute("""
+            INSERT INTO entries (title, content, category, tags)
+            VALUES ('Tagged', 'Content', 'Test', ' one, two ,,one')
+        """)
+        entry_id = cursor.lastrowid
+        tags = lambda: sorted(row[0] for row in conn.execute(
+            "SELECT tag FROM entry_tags WHERE entry_id = ?", (entry_id,)))
+        assert tags() == ["one", "two"]
+
+        conn.execute("UPDATE entries SET tags = 'three' WHERE id = ?", (entry_id,))
+        assert tags() == ["three"]
+
+        conn.execute("DELETE FROM entries WHERE id = ?", (entry_id,))
+        assert tags() == []
+        conn.commit()
+
+def test_lru_cache_ttl(monkeypatch):
+    """Test that entries expire after the TTL"""
+    import cache
+
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = cache.LRUCache(max_entries=2, ttl=10)
+    lru.set("a", 1)
+    assert lru.get("a") == 1
+    now[0] += 11
+    assert lru.get("a") is None
+    assert lru.stats()["misses"] == 1
+
+def test_data_version_sees_other_connections(temp_database):
+    """Test that commits from any connection change the data version"""
+    from database import data_version, get_pool
+
+    before = data_version()
+    other = sqlite3.connect(get_pool().path)
+    other.execute("INSERT INTO entries (title, content, category) VALUES ('x', 'y', 'z')")
+    other.commit()
+    other.close()
+    assert data_version() != before
+
+def test_compile_query():
+    """Test compiling user input into FTS5 expressions"""
+    from search import QueryError, compile_query
+
+    assert compile_query("docker nginx") == '"docker"* AND "nginx"*'
+    assert compile_query('"docker compose" -swarm') == '("docker compose") NOT "swarm"*'
+    assert compile_query("title:dock OR tags:ubu") == '(title : "dock"* OR tags : "ubu"*)'
+    assert compile_query("   ") is None
+    assert compile_query("http://host") == '"http://host"*'
+
+    for bad in ('"open', "-only", "dangling OR", 'nope:"x"'):
+        with pytest.raises(QueryError):
+            compile_query(bad)
+
+def test_parse_weights():
+    """Test parsing bm25 column weights"""
+    from search import parse_weights
+
+    assert parse_weights("title=10,tags=5") == (10.0, 1.0, 1.0, 5.0)
+    with pytest.raises(ValueError):
+        parse_weights("body=3")
+
+def test_spelling_and_trigram_queries():
+    """Test edit distances, the deletion index and substring query compilation"""
+    from search import compile_trigram_query
+    from spelling import DeletionIndex, edit_distance
+
+    assert edit_distance("ngnix", "nginx") == 1
+    assert edit_distance("kubernetse", "kubernetes") == 1
+    assert edit_distance("postgers", "postgres") == 1
+    assert edit_distance("nginx", "apache") == 6
+
+    index = DeletionIndex()
+    for word in ("nginx", "engine", "kubernetes", "kubectl"):
+        index.add(word)
+    assert sorted(index.search("ngnix", 1)) == [(1, "nginx")]
+    assert (2, "kubectl") in index.search("kubctel", 2)
+    assert index.search("postgres", 2) == []
+
+    assert compile_trigram_query('gres title:"ba sh" -cfg OR ab') == '("gres" AND title : "ba sh") NOT "cfg"'
+    assert compile_trigram_query("ab -nginx") is None
+    assert compile_trigram_query("nginx -ab") is None
+
+def test_instrumented_cursor_counts_rows(temp_database):
+    """Test that statements are timed and their rows counted once exhausted"""
+    from metrics import normalize_sql, sql_duration, sql_rows
+
+    sql = "SELECT id FROM entries WHERE id IN (?, ?, ?)"
+    statement = normalize_sql(sql)
+    assert statement == "SELECT id FROM entries WHERE id IN (?, ...)"
+    with get_db() as conn:
+        for title in ("a", "b"):
+            conn.execute("INSERT INTO entries (title, content, category) VALUES (?, 'x', 'y')", (title,))
+        ids = [row[0] for row in conn.execute("SELECT id FROM entries ORDER BY id DESC LIMIT 2")]
+        before = sql_rows._values.get((statement,), 0)
+        rows = conn.execute(sql, (*ids, -1)).fetchall()
+        conn.rollback()
+    
+    assert len(rows) == 2
+    assert sql_rows._values[(statement,)] == before + 2
+    assert sum(sql_duration._values[(statement,)][0]) >= 1
+
+def test_migrations_track_user_version():
+    """Test that migrations run once, adopt pre-versioned databases and guard the schema version"""
+    from database import get_pool
+    from migrations import LATEST_VERSION, MIGRATIONS, SchemaError, check_schema, migrate, schema_version
+
+    db_path = os.path.join(tempfile.mkdtemp(), "migrate.db")
+    with pytest.raises(SchemaError):
+        check_schema(db_path)
+    assert migrate(db_path) == [version for version, _, _ in MIGRATIONS]
+    assert migrate(db_path) == []
+    check_schema(db_path)
+    
+    # A database created by init_db before versioning has the schema but user_version 0
+    with get_pool(db_path).writer() as conn:
+        conn.execute("INSERT INTO entries (title, content, category, tags) VALUES ('t', 'c', 'x', 'legacy')")
+        conn.execute("DELETE FROM entry_tags")
+        conn.execute("PRAGMA user_version = 0")
+        conn.commit()
+    assert migrate(db_path) == [version for version, _, _ in MIGRATIONS]
+    with get_pool(db_path).writer() as conn:
+        assert schema_version(conn) == LATEST_VERSION
+        assert conn.execute("SELECT tag FROM entry_tags").fetchall()[0][0] == "legacy"
+        conn.execute(f"PRAGMA user_version = {LATEST_VERSION + 1}")
+    with pytest.raises(SchemaError):
+        migrate(db_path)
+    get_pool(db_path).close()
+
+def test_backup_snapshots_and_rotation(temp_database):
+    """Test both snapshot methods, checksum verification, deduplication and retention"""
+    from datetime import datetime, timedelta, timezone
+    from backup import BackupError, create_backup, list_snapshots, prune, verify
+    from database import get_pool
+
+    source = get_pool().path
+    backup_dir = os.path.join(tempfile.mkdtemp(), "backups")
+    with get_db() as conn:
+        conn.execute("INSERT INTO entries (title, content, category, tags) VALUES ('b', 'c', 'x', '')")
+        conn.commit()
+    
+    first = create_backup(backup_dir, "backup", source)
+    assert not first["unchanged"]
+    assert verify(first["path"])["sha256"] == first["sha256"]
+    # Nothing changed, so a second run keeps the existing snapshot
+    assert create_backup(backup_dir, "backup", source)["unchanged"]
+    compact = create_backup(backup_dir, "vacuum", source)
+    assert list_snapshots(backup_dir) == [first["path"], compact["path"]]
+    
+    with open(compact["path"], "r+b") as f:
+        f.seek(-1, os.SEEK_END)
+        f.write(b"\x01")
+    with pytest.raises(BackupError):
+        verify(compact["path"])
+    
+    # Retention keeps the newest snapshot overall and one per recent day
+    later = datetime.now(timezone.utc) + timedelta(days=2)
+    assert prune(backup_dir, keep=1, keep_daily=1, now=later) == [first["path"]]
+    assert list_snapshots(backup_dir) == [compact["path"]]
+
+def test_maintenance_tasks_and_leader_election():
+    """Test that maintenance merges, vacuums and records runs, and that only one scheduler leads"""
+    from database import get_pool
+    from maintenance import MaintenanceScheduler, leader_pid, read_status, run_tasks
+    from migrations import migrate
+
+    db_path = os.path.join(tempfile.mkdtemp(), "maintained.db")
+    migrate(db_path)
+    pool = get_pool(db_path)
+    with pool.writer() as conn:
+        for i in range(50):
+            conn.execute("INSERT INTO entries (title, content, category, tags) VALUES (?, ?, 'm', '')",
+                         (f"maintained {i}", "body " * 500))
+            conn.commit()
+        conn.execute("DELETE FROM entries")
+        conn.commit()
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] > 0
+    
+    report = run_tasks(db_path, force=True, budget=10)
+    assert set(report["tasks"]) == {"fts_merge", "fts_optimize", "analyze", "pragma_optimize", "checkpoint", "incremental_vacuum", "related_vectors", "prune_changelog"}
+    assert report["tasks"]["fts_merge"]["entries_fts"]["complete"]
+    assert report["tasks"]["incremental_vacuum"]["freed_pages"] > 0
+    with pool.writer() as conn:
+        assert conn.execute("PRAGMA freelist_count").fetchone()[0] == 0
+    assert read_status(db_path)["runs"][-1]["started_at"] == report["started_at"]
+    
+    first = MaintenanceScheduler(db_path, idle=0)
+    second = MaintenanceScheduler(db_path, idle=0)
+    assert first.step() is not None
+    assert first.is_leader and leader_pid(db_path) == os.getpid()
+    # Nothing was written since, and the interval tasks are not due yet
+    assert first.step() is None
+    assert second.step() is None and not second.is_leader
+    first.stop()
+    second.step()
+    assert second.is_leader
+    second.stop()
+    pool.close()
+
+
+def test_replica_replays_change_log():
+    """Test that a replica sees its own writes at once, other writers' within the bound, and reloads after pruning"""
+    import time
+    from database import entries_version, get_pool
+    from migrations import migrate
+    from replica import Replica
+
+    temp_dir = tempfile.mkdtemp()
+    db_path = os.path.join(temp_dir, "primary.db")
+    migrate(db_path)
+    with get_pool(db_path).writer() as conn:
+        conn.execute("INSERT INTO entries (title, content, category, tags) VALUES ('copied', 'at start', 'r', '')")
+        conn.commit()
+
+    def titles():
+        with get_db(readonly=True, path=db_path) as conn:
+            assert conn.execute("PRAGMA database_list").fetchone()["file"] == replica.path
+            return sorted(row[0] for row in conn.execute("SELECT title FROM entries"))
+
+    replica = Replica(db_path, directory=os.path.join(temp_dir, "replicas"), max_staleness=0.2)
+    replica.start()
+    try:
+        assert titles() == ["copied"]
+        # Writes go to the primary and are replayed before the writer is released
+        with get_db(path=db_path) as conn:
+            conn.execute("UPDATE entries SET title = 'mine' WHERE title = 'copied'")
+            conn.execute("INSERT INTO entries (title, content, category, tags) VALUES ('second', 'x', 'r', '')")
+            conn.commit()
+        assert titles() == ["mine", "second"]
+        with get_db(readonly=True, path=db_path) as conn:
+            assert conn.execute("SELECT COUNT(*) FROM entries_fts WHERE entries_fts MATCH 'mine'").fetchone()[0] == 1
+
+        # Another process's write is visible once the staleness bound has passed
+        other = sqlite3.connect(db_path)
+        other.execute("DELETE FROM entries WHERE title = 'second'")
+        other.commit()
+        time.sleep(0.25)
+        assert titles() == ["mine"]
+
+        # A change log pruned past the replica's position forces a full copy
+        loads = replica.loads
+        other.execute("INSERT INTO entries (title, content, category, tags) VALUES ('third', 'x', 'r', '')")
+        other.execute("DELETE FROM entries_changes")
+        other.commit()
+        replica.catch_up()
+        assert replica.loads == loads + 1
+        assert titles() == ["mine", "third"]
+        with get_db(readonly=True, path=db_path) as conn:
+            assert entries_version(conn) == entries_version(other)
+        other.close()
+    finally:
+        replica.stop()
+    assert os.listdir(os.path.join(temp_dir, "replicas")) == []
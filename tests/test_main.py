@@ -1,12 +1,14 @@
 import pytest
 from fastapi.testclient import TestClient
-from main import app
+from main import app, init_db
 import os
 import tempfile
+import re
 import sqlite3
 
-# Create a test client
+# Create a test client; its lifespan (which migrates the schema) only runs inside a with block
 client = TestClient(app)
+init_db()
 
 @pytest.fixture
 def temp_db():
@@ -100,7 +102,7 @@ def test_search_entries():
     client.post("/entries", json=entry_data)
     
     # Search for the entry
-    response = client.get("/search?q=searchable")
+    response = client.get("/search?q=searchable&include_content=true")
     assert response.status_code == 200
     
     data = response.json()
@@ -241,4 +243,660 @@ def test_delete_entry():
     
     # Verify it's deleted
     get_response = client.get(f"/entries/{entry_id}")
-    assert get_response.status_code == 404
\ No newline at end of file
+    assert get_response.status_code == 404
+
+
+def test_export_ndjson_pages(monkeypatch):
+    """Test that NDJSON export pages through every entry"""
+    import json
+    import transfer
+
+    monkeypatch.setattr(transfer, "EXPORT_PAGE_SIZE", 2)
+    ids = []
+    for i in range(5):
+        response = client.post("/entries", json={
+            "title": f"Paged Export {i}",
+            "content": "Export content",
+            "category": "Test",
+            "tags": "export"
+        })
+        ids.append(response.json()["id"])
+    
+    response = client.get("/export?format=ndjson")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    
+    entries = [json.loads(line) for line in response.text.splitlines()]
+    exported_ids = [entry["id"] for entry in entries]
+    assert exported_ids == sorted(exported_ids)
+    assert set(ids) <= set(exported_ids)
+    
+    # The JSON document must stay valid across page boundaries
+    data = client.get("/export").json()
+    assert [entry["id"] for entry in data["entries"]] == exported_ids
+
+def test_export_gzip_and_since():
+    """Test compressed and incremental exports"""
+    import gzip
+    import json
+    
+    response = client.get("/export?format=ndjson&gzip=true")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/gzip"
+    lines = gzip.decompress(response.content).decode().splitlines()
+    assert len(lines) >= 1
+    
+    response = client.get("/export?since=2999-01-01T00:00:00")
+    assert response.json()["entries"] == []
+    
+    response = client.get("/export?format=xml")
+    assert response.status_code == 422
+
+def test_import_round_trip():
+    """Test that an export can be imported back, in both formats"""
+    import gzip
+    import json
+    
+    entries = [
+        {"title": f"Imported Runbook {i}", "content": f"importable body {i}", "category": "Imported", "tags": "import"}
+        for i in range(3)
+    ]
+    ndjson = "\n".join(json.dumps(entry) for entry in entries) + "\n"
+    
+    response = client.post("/import?defer_fts=true", content=ndjson)
+    assert response.status_code == 200
+    result = response.json()
+    assert result["imported"] == 3
+    assert "rows_per_second" in result
+    
+    # Deferred FTS rebuild must leave the new rows searchable
+    response = client.get("/search?q=importable")
+    assert len(response.json()) >= 3
+    
+    document = json.dumps({"exported_at": "2025-01-01T00:00:00", "entries": entries})
+    response = client.post("/import", content=gzip.compress(document.encode()))
+    assert response.status_code == 200
+    assert response.json()["imported"] == 3
+
+def test_import_keep_ids_replaces_indexed_values():
+    """Test that importing over an existing id drops its old tags and search terms"""
+    import json
+    
+    for defer_fts in ("true", "false"):
+        entry_id = client.post("/entries", json={
+            "title": "Overwritten", "content": f"staleword{defer_fts}", "category": "Imported", "tags": f"staletag{defer_fts}"
+        }).json()["id"]
+        record = {"id": entry_id, "title": "Overwritten", "content": f"freshword{defer_fts}",
+                  "category": "Imported", "tags": f"freshtag{defer_fts}"}
+        response = client.post(f"/import?keep_ids=true&defer_fts={defer_fts}", content=json.dumps(record) + "\n")
+        assert response.status_code == 200
+        
+        tags = client.get("/tags").json()
+        assert f"freshtag{defer_fts}" in tags and f"staletag{defer_fts}" not in tags
+        assert client.get(f"/search?q=staleword{defer_fts}").json() == []
+        assert [hit["id"] for hit in client.get(f"/search?q=freshword{defer_fts}").json()] == [entry_id]
+        assert client.get(f"/entries/{entry_id}").json()["tags"] == f"freshtag{defer_fts}"
+
+def test_import_rejects_malformed_body():
+    """Test that malformed imports fail with 400 and insert nothing"""
+    before = len(client.get("/export").json()["entries"])
+    
+    body = '{"title": "Valid", "content": "c", "category": "c"}\n{"title": "Missing fields"}\n'
+    response = client.post("/import", content=body)
+    assert response.status_code == 400
+    
+    response = client.post("/import?format=json", content='{"entries": [{"title": ')
+    assert response.status_code == 400
+    
+    # Not UTF-8, corrupt gzip, and fields of the wrong type
+    for body in (
+        b'\xff\xfe{"title": "x"}\n',
+        b'\x1f\x8bjunk',
+        b'{"title": "T", "content": "c", "category": "c", "created_at": {"x": 1}}\n',
+        b'{"title": null, "content": "c", "category": "c"}\n',
+        b'{"title": "T", "content": ["c"], "category": "c"}\n',
+    ):
+        response = client.post("/import", content=body)
+        assert response.status_code == 400, body
+    
+    assert len(client.get("/export").json()["entries"]) == before
+
+def test_view_entry_uses_render_cache():
+    """Test that viewing an entry serves HTML rendered on write"""
+    from rendering import html_cache
+    
+    entry_data = {
+        "title": "Rendered Entry",
+        "content": "# Heading\n\n| a | b |\n|---|---|\n| 1 | 2 |\n",
+        "category": "Test",
+        "tags": "render"
+    }
+    entry_id = client.post("/entries", json=entry_data).json()["id"]
+    
+    hits = html_cache.hits
+    response = client.get(f"/view/{entry_id}")
+    assert response.status_code == 200
+    assert "<table>" in response.text
+    assert html_cache.hits == hits + 1
+    
+    # Editing the entry must never serve the old render
+    entry_data["content"] = "Changed **body**"
+    client.put(f"/entries/{entry_id}", json=entry_data)
+    response = client.get(f"/view/{entry_id}")
+    assert "<strong>body</strong>" in response.text
+    assert "<table>" not in response.text
+
+def test_get_entries_keyset_pagination():
+    """Test walking a category page by page with the opaque cursor"""
+    created = []
+    for i in range(5):
+        response = client.post("/entries", json={
+            "title": f"Paged {i}",
+            "content": "Paged content",
+            "category": "Pagination",
+            "tags": ""
+        })
+        created.append(response.json()["id"])
+    
+    seen = []
+    url = "/entries?category=Pagination&limit=2"
+    while True:
+        response = client.get(url)
+        assert response.status_code == 200
+        seen.extend(entry["id"] for entry in response.json())
+        cursor = response.headers.get("x-next-cursor")
+        if not cursor:
+            break
+        url = f"/entries?category=Pagination&limit=2&cursor={cursor}"
+    
+    # Entries share timestamps, so the id tie-breaker must keep pages disjoint
+    assert sorted(seen) == sorted(created)
+    assert len(seen) == len(set(seen))
+
+def test_get_entries_projection():
+    """Test projecting list views down to a few fields"""
+    client.post("/entries", json={
+        "title": "Projected",
+        "content": "x" * 500,
+        "category": "Projection",
+        "tags": "a,b"
+    })
+    
+    response = client.get("/entries?category=Projection&fields=title,preview")
+    assert response.status_code == 200
+    entry = response.json()[0]
+    assert set(entry) == {"id", "title", "preview", "updated_at"}
+    assert len(entry["preview"]) == 200
+    
+    assert client.get("/entries?fields=title,password").status_code == 400
+    assert client.get("/entries?cursor=not-a-cursor").status_code == 400
+    # Large pages keep working as they did before pagination
+    assert client.get("/entries?limit=5000").status_code == 200
+
+def test_tag_counts_and_filters():
+    """Test tag counts and AND/OR tag filters on listings and search"""
+    both = client.post("/entries", json={
+        "title": "Tag Filter Both", "content": "tagfilter body", "category": "Tags", "tags": "tf-alpha, tf-beta"
+    }).json()["id"]
+    alpha = client.post("/entries", json={
+        "title": "Tag Filter Alpha", "content": "tagfilter body", "category": "Tags", "tags": "tf-alpha"
+    }).json()["id"]
+    
+    counts = {row["tag"]: row["count"] for row in client.get("/tags?counts=true").json()}
+    assert counts["tf-alpha"] >= 2
+    assert counts["tf-beta"] >= 1
+    
+    ids = [e["id"] for e in client.get("/entries?tag=tf-alpha&tag=tf-beta").json()]
+    assert both in ids and alpha not in ids
+    
+    ids = [e["id"] for e in client.get("/entries?tag=tf-alpha&tag=tf-beta&tag_mode=any").json()]
+    assert both in ids and alpha in ids
+    
+    ids = [e["id"] for e in client.get("/search?q=tagfilter&tag=tf-beta").json()]
+    assert ids == [both]
+    
+    # Retagging keeps the index in sync
+    client.put(f"/entries/{alpha}", json={
+        "title": "Tag Filter Alpha", "content": "tagfilter body", "category": "Tags", "tags": "tf-beta"
+    })
+    ids = [e["id"] for e in client.get("/search?q=tagfilter&tag=tf-beta").json()]
+    assert sorted(ids) == sorted([both, alpha])
+
+def test_search_cache_hits_and_invalidation():
+    """Test that repeated searches are cached and writes invalidate them"""
+    client.post("/entries", json={
+        "title": "Cached Search", "content": "cacheable keyword", "category": "Cache", "tags": ""
+    })
+    
+    first = client.get("/search?q=cacheable").json()
+    before = client.get("/cache/stats").json()["search"]
+    # Case and whitespace differences normalize to the same key
+    assert client.get("/search?q=%20CACHEABLE%20").json() == first
+    after = client.get("/cache/stats").json()["search"]
+    assert after["hits"] == before["hits"] + 1
+    
+    # A write must make the next search miss and see the new entry
+    client.post("/entries", json={
+        "title": "Cached Search Two", "content": "cacheable keyword", "category": "Cache", "tags": ""
+    })
+    assert len(client.get("/search?q=cacheable").json()) == len(first) + 1
+
+def test_search_query_syntax():
+    """Test multi-term, phrase, exclusion and field searches"""
+    client.post("/entries", json={
+        "title": "Qsyntax Proxy", "content": "qsyntax reverse proxy with nginx", "category": "Qsyntax", "tags": "qs-web"
+    })
+    client.post("/entries", json={
+        "title": "Qsyntax Containers", "content": "qsyntax docker \"compose\" stack", "category": "Qsyntax", "tags": "qs-docker"
+    })
+    
+    titles = lambda q: sorted(r["title"] for r in client.get("/search", params={"q": q}).json())
+    
+    assert titles("qsyntax ngin") == ["Qsyntax Proxy"]
+    assert titles("qsyntax -nginx") == ["Qsyntax Containers"]
+    assert titles('"reverse proxy" qsyntax') == ["Qsyntax Proxy"]
+    assert titles("qsyntax tags:qs-dock") == ["Qsyntax Containers"]
+    assert titles("qsyntax (nginx OR docker)") == ["Qsyntax Containers", "Qsyntax Proxy"]
+    
+    # Embedded quotes used to break MATCH syntax with a 500
+    assert client.get("/search", params={"q": 'qsyntax "compose'}).status_code == 400
+    assert client.get("/search", params={"q": "-nginx"}).status_code == 400
+
+def test_search_ranks_title_matches_first():
+    """Test that title matches outrank body-only matches"""
+    client.post("/entries", json={
+        "title": "Unrelated heading", "content": "rankweight " * 5, "category": "Rank", "tags": ""
+    })
+    client.post("/entries", json={
+        "title": "Rankweight guide", "content": "short body", "category": "Rank", "tags": ""
+    })
+    
+    results = client.get("/search?q=rankweight").json()
+    assert results[0]["title"] == "Rankweight guide"
+
+def test_search_results_are_lightweight():
+    """Test that search omits bodies by default and pages with offset"""
+    for i in range(3):
+        client.post("/entries", json={
+            "title": f"Lightweight {i}", "content": "lightresult " + "body " * 200, "category": "Light", "tags": ""
+        })
+    
+    results = client.get("/search?q=lightresult").json()
+    assert len(results) == 3
+    assert all("content" not in result for result in results)
+    assert all("<mark>" in result["snippet"] for result in results)
+    
+    first_page = client.get("/search?q=lightresult&limit=2").json()
+    second_page = client.get("/search?q=lightresult&limit=2&offset=2").json()
+    assert [r["id"] for r in first_page + second_page] == [r["id"] for r in results]
+    
+    full = client.get("/search?q=lightresult&include_content=true").json()
+    assert full[0]["content"].startswith("lightresult")
+
+def test_metrics_endpoint():
+    """Test that requests, SQL statements and renders show up in /metrics"""
+    entry_id = client.post("/entries", json={
+        "title": "Metrics entry", "content": "# Metrics", "category": "Metrics", "tags": ""
+    }).json()["id"]
+    client.get(f"/view/{entry_id}")
+    
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'indexa_http_requests_total{method="GET",route="/view/{entry_id}",status="200"}' in body
+    assert 'indexa_sql_statement_duration_seconds_count{statement="SELECT * FROM entries WHERE id = ?"}' in body
+    assert 'indexa_template_render_seconds_count{template="view_entry.html"}' in body
+    assert "indexa_markdown_render_seconds_count" in body
+
+def test_entry_conditional_get():
+    """Test ETag/Last-Modified revalidation of entries and entry pages"""
+    from database import get_db
+    
+    entry_id = client.post("/entries", json={
+        "title": "Conditional", "content": "etag body", "category": "HTTP", "tags": ""
+    }).json()["id"]
+    # Validators are withheld while updated_at is within the current second
+    assert "etag" not in client.get(f"/entries/{entry_id}").headers
+    
+    with get_db() as conn:
+        conn.execute("UPDATE entries SET updated_at = '2024-01-01 00:00:00' WHERE id = ?", (entry_id,))
+        conn.commit()
+    
+    response = client.get(f"/entries/{entry_id}")
+    etag = response.headers["etag"]
+    assert response.headers["last-modified"] == "Mon, 01 Jan 2024 00:00:00 GMT"
+    assert client.get(f"/entries/{entry_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/entries/{entry_id}", headers={"If-None-Match": '"other"'}).status_code == 200
+    assert client.get(f"/entries/{entry_id}", headers={
+        "If-Modified-Since": "Tue, 02 Jan 2024 00:00:00 GMT"
+    }).status_code == 304
+    
+    page = client.get(f"/view/{entry_id}")
+    assert page.headers["etag"] != etag
+    assert client.get(f"/view/{entry_id}", headers={"If-None-Match": page.headers["etag"]}).status_code == 304
+    
+    client.put(f"/entries/{entry_id}", json={
+        "title": "Conditional", "content": "changed body", "category": "HTTP", "tags": ""
+    })
+    response = client.get(f"/entries/{entry_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["content"] == "changed body"
+
+def test_listing_etags_follow_writes():
+    """Test that listing and metadata ETags change on every write"""
+    for path in ("/categories", "/tags?counts=true", "/entries?limit=5"):
+        etag = client.get(path).headers["etag"]
+        assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+        
+        client.post("/entries", json={"title": "Bump", "content": "x", "category": "Bump", "tags": "bump"})
+        response = client.get(path, headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+def test_compression_and_static_assets():
+    """Test gzip negotiation and immutable caching of content-hashed assets"""
+    client.post("/entries", json={
+        "title": "Compressible", "content": "repetitive text " * 500, "category": "Zip", "tags": ""
+    })
+    response = client.get("/entries?category=Zip", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert response.json()[0]["title"] == "Compressible"
+    # The compressed representation's ETag still revalidates, and the 304 carries the same validator
+    assert response.headers["etag"].endswith('-gzip"')
+    revalidated = client.get("/entries?category=Zip", headers={
+        "Accept-Encoding": "gzip", "If-None-Match": response.headers["etag"]
+    })
+    assert revalidated.status_code == 304
+    assert revalidated.headers["etag"] == response.headers["etag"]
+    assert "accept-encoding" in revalidated.headers["vary"].lower()
+    
+    small = client.get("/categories", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in small.headers
+    
+    page = client.get("/").text
+    url = re.search(r'src="(/static/script\.js\?v=\w+)"', page).group(1)
+    assert "immutable" in client.get(url).headers["cache-control"]
+    assert "immutable" not in client.get("/static/script.js").headers["cache-control"]
+
+def test_json_encoding_matches_schema():
+    """Test that rows encoded without models keep the response shape and stdlib fallback agrees"""
+    import serialization
+    
+    created = client.post("/entries", json={
+        "title": "Encoded ünïcode", "content": "encodedjson body", "category": "Encoding", "tags": "json"
+    }).json()
+    
+    entry = client.get(f"/entries/{created['id']}")
+    assert entry.headers["content-type"] == "application/json"
+    assert entry.json() == created
+    
+    listed = client.get("/entries?category=Encoding").json()
+    assert listed == [created]
+    
+    orjson = serialization.orjson
+    serialization.orjson = None
+    try:
+        fallback = serialization.dumps(created)
+    finally:
+        serialization.orjson = orjson
+    assert serialization.dumps(created) == fallback
+
+def test_admin_backup_download(monkeypatch):
+    """Test that the admin backup endpoint streams a verified snapshot and honours ADMIN_TOKEN"""
+    import hashlib
+    import main
+    
+    client.post("/entries", json={"title": "Backed up", "content": "snapshot", "category": "Backup", "tags": ""})
+    # Disabled until a token is configured
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "")
+    assert client.get("/admin/backup").status_code == 403
+    
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    response = client.get("/admin/backup", headers={"Authorization": "Bearer secret"})
+    assert response.status_code == 200
+    assert response.content.startswith(b"SQLite format 3\x00")
+    assert hashlib.sha256(response.content).hexdigest() == response.headers["x-checksum-sha256"]
+    
+    path = os.path.join(tempfile.mkdtemp(), "download.db")
+    with open(path, "wb") as f:
+        f.write(response.content)
+    conn = sqlite3.connect(path)
+    assert conn.execute("SELECT COUNT(*) FROM entries WHERE title = 'Backed up'").fetchone()[0] >= 1
+    conn.close()
+    
+    assert client.get("/admin/backup").status_code == 401
+    assert client.get("/admin/backup?method=backup", headers={"Authorization": "Bearer secret"}).status_code == 200
+
+def test_search_tolerates_typos():
+    """Test that short result pages fall back to substring matches and spelling corrections"""
+    created = client.post("/entries", json={
+        "title": "Typotolerant cache", "content": "memcached eviction tuning", "category": "Typos", "tags": ""
+    }).json()
+    
+    # Infix: the word index only matches prefixes, the trigram index finds substrings
+    infix = client.get("/search", params={"q": "emcache"})
+    assert created["id"] in [r["id"] for r in infix.json()]
+    
+    typo = client.get("/search", params={"q": "memcahced evicton"})
+    assert typo.headers["x-did-you-mean"] == "memcached%20eviction"
+    assert created["id"] in [r["id"] for r in typo.json()]
+    
+    exact = client.get("/search", params={"q": "memcached"})
+    assert "x-did-you-mean" not in exact.headers
+
+def test_suggest_completions():
+    """Test typeahead completions for terms, titles, tags and categories, including later writes"""
+    client.post("/entries", json={
+        "title": "Zookeeper quorum recovery", "content": "zookeeperish body words", "category": "Zoo Ops", "tags": "zkcluster"
+    })
+    
+    suggestions = client.get("/suggest?prefix=zoo").json()
+    assert "zookeeper" in [item["term"] for item in suggestions["terms"]]
+    assert "Zookeeper quorum recovery" in [item["title"] for item in suggestions["titles"]]
+    assert suggestions["categories"] == [{"category": "Zoo Ops", "count": 1}]
+    
+    # Titles match at any word; terms complete the last word
+    assert client.get("/suggest?prefix=quor").json()["titles"][0]["title"] == "Zookeeper quorum recovery"
+    assert client.get("/suggest?prefix=zkc").json()["tags"] == [{"tag": "zkcluster", "count": 1}]
+    
+    created = client.post("/entries", json={
+        "title": "Zookeeper snapshots", "content": "x", "category": "Zoo Ops", "tags": ""
+    }).json()
+    client.put(f"/entries/{created['id']}", json={
+        "title": "Zookeeper snapshot retention", "content": "x", "category": "Zoo Ops", "tags": ""
+    })
+    titles = [item["title"] for item in client.get("/suggest?prefix=zookeeper s").json()["titles"]]
+    assert titles == ["Zookeeper snapshot retention"]
+    assert client.get("/suggest?prefix=").status_code == 422
+
+def test_faceted_search_counts():
+    """Test that faceted search returns the page with category and tag counts for all matches"""
+    for category, tags in (("Facet A", "fx,fy"), ("Facet A", "fx"), ("Facet B", "fy"), ("Facet C", "")):
+        client.post("/entries", json={
+            "title": f"Facetword {category}", "content": "facetbody", "category": category, "tags": tags
+        })
+    
+    result = client.get("/search/faceted", params={"q": "facetword", "limit": 1}).json()
+    assert result["total"] == 4
+    assert len(result["results"]) == 1
+    assert result["categories"] == [
+        {"category": "Facet A", "count": 2}, {"category": "Facet B", "count": 1}, {"category": "Facet C", "count": 1}
+    ]
+    assert result["tags"] == [{"tag": "fx", "count": 2}, {"tag": "fy", "count": 2}]
+    
+    # Categories are ORed; category counts ignore the category selection, tag counts do not
+    selected = client.get("/search/faceted", params={"q": "facetword", "category": ["Facet B", "Facet C"]}).json()
+    assert selected["total"] == 2
+    assert {r["category"] for r in selected["results"]} == {"Facet B", "Facet C"}
+    assert selected["categories"][0] == {"category": "Facet A", "count": 2}
+    assert selected["tags"] == [{"tag": "fy", "count": 1}]
+    
+    tagged = client.get("/search/faceted", params={"q": "facetword", "tag": "fx", "facet_limit": 1}).json()
+    assert tagged["total"] == 2
+    assert tagged["categories"] == [{"category": "Facet A", "count": 2}]
+    assert tagged["tags"] == [{"tag": "fx", "count": 2}]
+
+def test_admin_maintenance_status(monkeypatch):
+    """Test that the maintenance status endpoint reports the database and recorded runs"""
+    import main
+    from maintenance import run_tasks
+    
+    monkeypatch.setattr(main, "ADMIN_TOKEN", "secret")
+    run_tasks(tasks=["checkpoint"])
+    status = client.get("/admin/maintenance", headers={"Authorization": "Bearer secret"}).json()
+    assert status["database"]["journal_mode"] == "wal"
+    assert status["database"]["page_count"] > 0
+    assert "checkpoint" in status["tasks"]
+    assert status["runs"][-1]["tasks"]["checkpoint"]["complete"]
+
+def test_related_entries():
+    """Test that related entries rank similar runbooks first and pick up entries written after the build"""
+    pytest.importorskip("numpy")
+    from related import get_related_index
+    
+    
+    base = client.post("/entries", json={
+        "title": "Relatable pgbouncer pooling", "content": "pgbouncer transaction pooling for postgres replicas",
+        "category": "Related", "tags": "pgbouncer,postgres"
+    }).json()
+    similar = client.post("/entries", json={
+        "title": "Pgbouncer pooling limits", "content": "tune pgbouncer pool size for postgres",
+        "category": "Related", "tags": "pgbouncer"
+    }).json()
+    client.post("/entries", json={
+        "title": "Relatable printer queue", "content": "clear the cups spooler", "category": "Related", "tags": "printing"
+    })
+    
+    response = client.get(f"/entries/{base['id']}/related")
+    if response.status_code == 503:
+        # Without a build the first call starts one in the background instead of waiting for it
+        assert response.headers["Retry-After"]
+        get_related_index().wait_for_build()
+        response = client.get(f"/entries/{base['id']}/related")
+    related = response.json()
+    assert related[0]["id"] == similar["id"]
+    assert base["id"] not in [r["id"] for r in related]
+    
+    later = client.post("/entries", json={
+        "title": "Pgbouncer pooling failover", "content": "pgbouncer pooling with postgres replicas failover",
+        "category": "Related", "tags": "pgbouncer,postgres"
+    }).json()
+    related = client.get(f"/entries/{base['id']}/related?limit=2").json()
+    assert later["id"] in [r["id"] for r in related]
+    assert client.get(f"/entries/{later['id']}/related").json()[0]["score"] > 0
+    assert client.get("/entries/999999/related").status_code == 404
+
+def test_related_entries_updated_on_write():
+    """Test that the write handlers vectorize new and deleted entries without a rebuild"""
+    pytest.importorskip("numpy")
+    from database import get_pool
+    from related import get_related_index, read_manifest
+    
+    index = get_related_index()
+    first = client.post("/entries", json={
+        "title": "Varnish purge runbook", "content": "purge varnish cache bans", "category": "Related", "tags": "varnish"
+    }).json()
+    if client.get(f"/entries/{first['id']}/related").status_code == 503:
+        index.wait_for_build()
+        assert client.get(f"/entries/{first['id']}/related").status_code == 200
+    build = read_manifest(get_pool().path)["build"]
+    
+    second = client.post("/entries", json={
+        "title": "Varnish ban lurker", "content": "varnish cache bans and purge lag", "category": "Related", "tags": "varnish"
+    }).json()
+    # Vectorized by POST /entries itself, before any read of the index
+    assert second["id"] in [entry_id for entry_id, _ in index.related(first["id"])]
+    assert [r["id"] for r in client.get(f"/entries/{first['id']}/related").json()][0] == second["id"]
+    
+    client.delete(f"/entries/{second['id']}")
+    assert second["id"] not in [entry_id for entry_id, _ in index.related(first["id"])]
+    assert read_manifest(get_pool().path)["build"] == build
+
+def test_federated_knowledge_bases(monkeypatch):
+    """Test per-knowledge-base CRUD and a fan-out search merged across shards"""
+    import knowledge_bases
+    
+    with pytest.raises(ValueError):
+        knowledge_bases.parse_knowledge_bases("ops")
+    for name in ("ops", "dev"):
+        path = os.path.join(tempfile.mkdtemp(), f"{name}.db")
+        monkeypatch.setitem(knowledge_bases.knowledge_bases, name, path)
+        init_db(path)
+    
+    ops = client.post("/entries?kb=ops", json={
+        "title": "Fedword pager rotation", "content": "fedword fedword on call", "category": "Ops only", "tags": ""
+    }).json()
+    client.post("/entries?kb=dev", json={
+        "title": "Fedword build cache", "content": "ci", "category": "Dev only", "tags": ""
+    })
+    assert client.get(f"/entries/{ops['id']}?kb=ops").json()["title"] == "Fedword pager rotation"
+    assert client.get("/categories?kb=ops").json() == ["Ops only"]
+    assert "Ops only" not in client.get("/categories").json()
+    
+    results = client.get("/search", params={"q": "fedword", "kb": ["ops", "dev"]}).json()
+    assert sorted(r["kb"] for r in results) == ["dev", "ops"]
+    assert client.get("/search", params={"q": "fedword"}).json() == []
+    second = client.get("/search", params={"q": "fedword", "kb": ["ops", "dev"], "limit": 1, "offset": 1}).json()
+    assert second == [results[1]]
+    
+    assert client.get("/search", params={"q": "fedword", "kb": "nope"}).status_code == 404
+    assert client.get("/entries?kb=nope").status_code == 404
+    assert {"name": "ops", "entries": 1} in client.get("/kbs").json()
+    
+    # The other entry, search, suggestion and transfer routes follow kb= as well
+    view = client.get(f"/view/{ops['id']}?kb=ops")
+    assert "Fedword pager rotation" in view.text and "?kb=ops" in view.text
+    assert "Fedword build cache" in client.get("/edit/1?kb=dev").text
+    faceted = client.get("/search/faceted", params={"q": "fedword", "kb": "ops"}).json()
+    assert faceted["total"] == 1 and faceted["categories"] == [{"category": "Ops only", "count": 1}]
+    assert client.get("/search/faceted", params={"q": "fedword"}).json()["total"] == 0
+    assert "pager" in [item["term"] for item in client.get("/suggest?prefix=pag&kb=ops").json()["terms"]]
+    export = client.get("/export?kb=ops").json()["entries"]
+    assert [entry["title"] for entry in export] == ["Fedword pager rotation"]
+    client.post("/import?kb=dev&format=json", content=client.get("/export?kb=ops").content)
+    assert sorted(client.get("/categories?kb=dev").json()) == ["Dev only", "Ops only"]
+
+def test_batch_get_patch_delete():
+    """Test multi-get, bulk partial update and bulk delete with per-item results"""
+    ids = [
+        client.post("/entries", json={
+            "title": f"Batch {i}", "content": f"batchbody {i}", "category": "Batch", "tags": "old"
+        }).json()["id"]
+        for i in range(3)
+    ]
+    missing = max(ids) + 1000
+    
+    response = client.get("/entries", params={"ids": f"{ids[2]},{missing},{ids[0]}", "fields": "id,title"})
+    assert response.status_code == 200
+    assert [entry["id"] for entry in response.json()] == [ids[2], ids[0]]
+    assert response.headers["X-Missing-Ids"] == str(missing)
+    assert client.get("/entries", params={"ids": "1,x"}).status_code == 400
+    
+    response = client.patch("/entries", json=[
+        {"id": ids[0], "category": "Rebatched", "tags": "new"},
+        {"id": ids[1], "category": "Rebatched", "tags": "new"},
+        {"id": ids[2], "content": "rewritten batchbody"},
+        {"id": missing, "tags": "new"},
+    ])
+    assert response.status_code == 200
+    assert [item["status"] for item in response.json()] == ["updated", "updated", "updated", "not_found"]
+    entries = client.get("/entries", params={"ids": ",".join(map(str, ids))}).json()
+    assert [(entry["category"], entry["tags"]) for entry in entries[:2]] == [("Rebatched", "new")] * 2
+    assert entries[2]["content"] == "rewritten batchbody" and entries[2]["category"] == "Batch"
+    assert client.get("/entries", params={"tag": "new", "category": "Rebatched"}).json()[0]["id"] in ids
+    assert client.patch("/entries", json=[{"id": ids[0]}]).status_code == 400
+    
+    # Items for the same entry apply in request order, even across different field sets
+    response = client.patch("/entries", json=[
+        {"id": ids[2], "category": "A"}, {"id": ids[2], "category": "B", "tags": "t"}, {"id": ids[2], "category": "C"},
+    ])
+    assert [item["status"] for item in response.json()] == ["updated"] * 3
+    assert client.get(f"/entries/{ids[2]}").json()["category"] == "C"
+    
+    response = client.post("/entries/delete", json={"ids": [ids[0], missing, ids[1]]})
+    assert [(item["id"], item["status"]) for item in response.json()] == [
+        (ids[0], "deleted"), (missing, "not_found"), (ids[1], "deleted")
+    ]
+    assert [entry["id"] for entry in client.get("/entries", params={"ids": ",".join(map(str, ids))}).json()] == [ids[2]]
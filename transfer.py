@@ -0,0 +1,385 @@
+import argparse
+import gzip
+import io
+import json
+import re
+import time
+import zlib
+from datetime import datetime
+
+from config import EXPORT_PAGE_SIZE, IMPORT_BATCH_SIZE
+from database import CREATE_TRIGGER_AI, CREATE_TRIGGER_TRIGRAM_AI, CREATE_TRIGGER_VERSION, get_db, init_db, run_db
+from serialization import dumps
+
+EXPORT_FORMATS = ("json", "ndjson")
+
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "ndjson": "application/x-ndjson",
+}
+
+
+def encode_entry(entry):
+    """Encode one entry dict compactly to UTF-8 bytes, the same way JSONResponse does"""
+    return dumps(entry)
+
+
+def fetch_export_page(conn, last_id, since, page_size):
+    """Fetch the next page of entries after last_id, ordered by id"""
+    if since:
+        cursor = conn.execute("""
+            SELECT * FROM entries
+            WHERE id > ? AND updated_at > ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, since, page_size))
+    else:
+        cursor = conn.execute("""
+            SELECT * FROM entries
+            WHERE id > ?
+            ORDER BY id
+            LIMIT ?
+        """, (last_id, page_size))
+    return [dict(row) for row in cursor.fetchall()]
+
+
+def _encode_page(conn, last_id, since, fmt, first, compressor):
+    # Fetch, encode and compress on the database thread; returns (chunk, last_id, done)
+    entries = fetch_export_page(conn, last_id, since, EXPORT_PAGE_SIZE)
+    if not entries:
+        return b"", last_id, True
+
+    lines = [encode_entry(entry) for entry in entries]
+    if fmt == "ndjson":
+        data = b"\n".join(lines) + b"\n"
+    else:
+        data = (b"" if first else b",") + b",".join(lines)
+    return _compress(compressor, data), entries[-1]["id"], len(entries) < EXPORT_PAGE_SIZE
+
+
+def _compress(compressor, data):
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return compressor.compress(data) if compressor else data
+
+
+async def iter_export(fmt="json", since=None, gzip=False, path=None):
+    """Yield the export document as bytes, page by page, keyset-paginated on id"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+
+    if fmt == "json":
+        exported_at = json.dumps(datetime.now().isoformat())
+        yield _compress(compressor, '{"exported_at":' + exported_at + ',"entries":[')
+
+    last_id = 0
+    first = True
+    done = False
+    while not done:
+        chunk, next_id, done = await run_db(
+            _encode_page, last_id, since, fmt, first, compressor, readonly=True, path=path
+        )
+        # The compressor may buffer a whole page, so track progress by id
+        if next_id != last_id:
+            first = False
+        last_id = next_id
+        if chunk:
+            yield chunk
+
+    tail = _compress(compressor, "]}") if fmt == "json" else b""
+    if compressor:
+        tail += compressor.flush()
+    if tail:
+        yield tail
+
+
+# Import
+IMPORT_FORMATS = ("auto", "json", "ndjson")
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class ImportFormatError(ValueError):
+    """Raised when an import body is not a valid export document"""
+
+
+class _StreamDecoder:
+    """Decode JSON values one at a time from a text stream without loading it whole"""
+
+    def __init__(self, fp, chunk_size=READ_CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Return the next non-whitespace character, or '' at end of input"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in " \t\r\n":
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ImportFormatError(f"Expected '{char}' but found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError as exc:
+                if self._fill():
+                    continue
+                raise ImportFormatError(f"Malformed JSON: {exc.msg}") from None
+            # A number ending exactly at the buffer edge may continue in the next chunk
+            if end == len(self.buf) and not isinstance(value, (dict, list, str)) and self._fill():
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Decode the elements of the array starting at the current position"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+                continue
+            self.expect("]")
+            return
+
+
+def iter_json_records(fp, chunk_size=READ_CHUNK_SIZE):
+    """Yield entries from an /export JSON document, or a bare array of entries"""
+    reader = _StreamDecoder(fp, chunk_size)
+    if reader.peek() == "[":
+        yield from reader.items()
+        return
+
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == "entries":
+            yield from reader.items()
+        else:
+            reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+def iter_ndjson_records(fp):
+    """Yield entries from newline-delimited JSON"""
+    for line_number, line in enumerate(fp, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as exc:
+            raise ImportFormatError(f"Line {line_number}: {exc.msg}") from None
+
+
+def detect_format(fp):
+    """Guess json or ndjson from the first key of a seekable stream"""
+    head = fp.read(4096)
+    fp.seek(0)
+    stripped = head.lstrip()
+    if stripped.startswith("["):
+        return "json"
+    # An export document starts with its exported_at/entries keys, an NDJSON line with entry fields
+    match = re.match(r'\{\s*"(\w+)"', stripped)
+    if match and match.group(1) in ("entries", "exported_at"):
+        return "json"
+    return "ndjson"
+
+
+def _text_field(record, name, index):
+    # Numbers are stored as their text; null, objects and arrays are rejected
+    value = record.get(name)
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        if name not in record:
+            raise ImportFormatError(f"Entry {index}: missing field {name}")
+        raise ImportFormatError(f"Entry {index}: {name} must be a string")
+    return str(value)
+
+
+def _timestamp_field(record, name, index):
+    value = record.get(name)
+    if value is not None and not isinstance(value, str):
+        raise ImportFormatError(f"Entry {index}: {name} must be a string or null")
+    return value
+
+
+def _entry_params(record, index, keep_ids):
+    if not isinstance(record, dict):
+        raise ImportFormatError(f"Entry {index}: expected an object")
+    params = (
+        _text_field(record, "title", index),
+        _text_field(record, "content", index),
+        _text_field(record, "category", index),
+        _text_field(record, "tags", index) if record.get("tags") is not None else "",
+        _timestamp_field(record, "created_at", index),
+        _timestamp_field(record, "updated_at", index),
+    )
+    if keep_ids:
+        if not isinstance(record.get("id"), int):
+            raise ImportFormatError(f"Entry {index}: keep_ids requires an integer id")
+        params = (record["id"],) + params
+    return params
+
+
+INSERT_SQL = """
+    INSERT INTO entries (title, content, category, tags, created_at, updated_at)
+    VALUES (?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+"""
+
+# An upsert rather than INSERT OR REPLACE: the implicit delete of a replace fires no
+# DELETE triggers, which would leave the old row in the FTS and tag indexes
+INSERT_WITH_ID_SQL = """
+    INSERT INTO entries (id, title, content, category, tags, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, COALESCE(?, CURRENT_TIMESTAMP), COALESCE(?, CURRENT_TIMESTAMP))
+    ON CONFLICT (id) DO UPDATE SET
+        title = excluded.title, content = excluded.content, category = excluded.category,
+        tags = excluded.tags, created_at = excluded.created_at, updated_at = excluded.updated_at
+"""
+
+
+def import_entries(conn, records, batch_size=None, defer_fts=True, keep_ids=False):
+    """Insert records in executemany batches inside a single transaction.
+
+    With defer_fts the per-row FTS insert triggers are dropped for the load and
+    both FTS indexes are rebuilt once at the end, all inside the same transaction.
+    The rebuild covers every row in the table, so it suits bulk loads rather
+    than small imports into a large knowledge base.
+    """
+    batch_size = batch_size or IMPORT_BATCH_SIZE
+    sql = INSERT_WITH_ID_SQL if keep_ids else INSERT_SQL
+    start = time.perf_counter()
+    imported = 0
+
+    if conn.in_transaction:
+        conn.commit()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if defer_fts:
+            conn.execute("DROP TRIGGER IF EXISTS entries_ai")
+            conn.execute("DROP TRIGGER IF EXISTS entries_trigram_ai")
+        # One version bump for the whole load instead of one per row
+        conn.execute("DROP TRIGGER IF EXISTS entries_version_ai")
+        conn.execute("DROP TRIGGER IF EXISTS entries_version_au")
+
+        batch = []
+        for index, record in enumerate(records, 1):
+            batch.append(_entry_params(record, index, keep_ids))
+            if len(batch) >= batch_size:
+                conn.executemany(sql, batch)
+                imported += len(batch)
+                batch = []
+        if batch:
+            conn.executemany(sql, batch)
+            imported += len(batch)
+
+        if defer_fts:
+            conn.execute(CREATE_TRIGGER_AI)
+            conn.execute("INSERT INTO entries_fts(entries_fts) VALUES('rebuild')")
+            conn.execute(CREATE_TRIGGER_TRIGRAM_AI)
+            conn.execute("INSERT INTO entries_trigram(entries_trigram) VALUES('rebuild')")
+        conn.execute(CREATE_TRIGGER_VERSION.format(suffix="ai", event="INSERT"))
+        conn.execute(CREATE_TRIGGER_VERSION.format(suffix="au", event="UPDATE"))
+        conn.execute("UPDATE entries_version SET version = version + 1 WHERE id = 1")
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+    elapsed = time.perf_counter() - start
+    return {
+        "imported": imported,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(imported / elapsed, 1) if elapsed > 0 else None,
+    }
+
+
+def open_import_stream(raw):
+    """Wrap a binary stream as text, transparently gunzipping it"""
+    magic = raw.read(2)
+    raw.seek(0)
+    if magic == b"\x1f\x8b":
+        raw = gzip.GzipFile(fileobj=raw, mode="rb")
+    return io.TextIOWrapper(raw, encoding="utf-8")
+
+
+# Raised while reading a body that is not UTF-8, or not valid gzip despite its magic bytes
+STREAM_ERRORS = (UnicodeDecodeError, OSError, EOFError, zlib.error)
+
+
+def import_file(conn, raw, fmt="auto", **options):
+    """Import an export file (JSON or NDJSON, optionally gzipped) from a binary stream"""
+    try:
+        fp = open_import_stream(raw)
+        if fmt == "auto":
+            # Detection peeks at the start, so it needs a seekable stream
+            if not fp.seekable():
+                fp = io.StringIO(fp.read())
+            fmt = detect_format(fp)
+        records = iter_json_records(fp) if fmt == "json" else iter_ndjson_records(fp)
+        # The stream is decoded lazily, so read errors surface from inside the load
+        return import_entries(conn, records, **options)
+    except STREAM_ERRORS as exc:
+        raise ImportFormatError(f"Unreadable import body: {exc}") from None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import or export Indexa entries")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importer = commands.add_parser("import", help="Bulk import an /export JSON or NDJSON file")
+    importer.add_argument("path", help="Export file to load; may be gzipped")
+    importer.add_argument("--format", choices=IMPORT_FORMATS, default="auto")
+    importer.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    importer.add_argument("--keep-ids", action="store_true", help="Preserve entry ids, replacing existing rows")
+    importer.add_argument("--no-defer-fts", action="store_true", help="Index each row as it is inserted")
+
+    args = parser.parse_args()
+    init_db()
+    with open(args.path, "rb") as raw, get_db() as conn:
+        result = import_file(
+            conn,
+            raw,
+            args.format,
+            batch_size=args.batch_size,
+            defer_fts=not args.no_defer_fts,
+            keep_ids=args.keep_ids,
+        )
+    print(json.dumps(result))
+
+
+if __name__ == "__main__":
+    main()